@@ -1,19 +1,38 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Query
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Query, Header, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Callable
 import uuid
+import hashlib
+import time
+from contextlib import contextmanager
+import asyncio
+import functools
+import itertools
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, date, timezone, timedelta
 from enum import Enum
 import csv
 import io
+import zipfile
+import gzip
+import json
+import shutil
+import re
+import xml.etree.ElementTree as ET
 from decimal import Decimal, InvalidOperation
+import numpy as np
 
 
 ROOT_DIR = Path(__file__).parent
@@ -95,6 +114,7 @@ class Transaction(BaseModel):
     invoice_number: Optional[str] = None
     notes: Optional[str] = None
     reconciled: bool = False
+    open_amount: Optional[float] = None  # Still to be paid; lowered with $inc by (partial) payments and corrections
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TransactionCreate(BaseModel):
@@ -140,15 +160,45 @@ class ImportPreviewItem(BaseModel):
     validation_errors: List[str]
     import_status: str  # 'valid', 'warning', 'error'
 
+class ImportStageTiming(BaseModel):
+    stage: str  # e.g. 'read', 'decode', 'parse', 'validate', 'insert'
+    duration_ms: float
+    rows: Optional[int] = None
+
 class ImportPreview(BaseModel):
     file_name: str
-    import_type: str  # 'epd_declaraties', 'epd_particulier', 'bank_bunq'
+    import_type: str  # 'epd_declaraties', 'epd_particulier', 'bank_bunq', or a BANK_STATEMENT_PARSERS key
     total_rows: int
     valid_rows: int
     error_rows: int
     preview_items: List[ImportPreviewItem]
     column_mapping: Dict[str, str]
     all_errors: Optional[List[str]] = []  # All validation errors for debugging
+    mapping_profile_id: Optional[str] = None
+    field_mapping: Dict[str, str] = {}  # Resolved logical field -> CSV column
+    timings: List[ImportStageTiming] = []
+
+class ColumnMappingProfile(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    fingerprint: str  # sha256 of the trimmed header row
+    import_type: str
+    columns: List[str]
+    column_mapping: Dict[str, str]  # logical field -> CSV column
+    source: str = 'auto'  # 'auto' (discovered) or 'user' (override)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class ColumnMappingProfileUpdate(BaseModel):
+    column_mapping: Dict[str, str]
+
+class ImportFileResult(BaseModel):
+    file_name: str
+    import_type: Optional[str] = None  # Detected (or forced) import type
+    success: bool
+    imported_count: int
+    error_count: int
+    errors: List[str]
+    timings: List[ImportStageTiming] = []
 
 class ImportResult(BaseModel):
     success: bool
@@ -156,6 +206,8 @@ class ImportResult(BaseModel):
     error_count: int
     errors: List[str]
     created_transactions: List[str]  # List of transaction IDs
+    file_results: List[ImportFileResult] = []  # Per-file breakdown for batch imports
+    timings: List[ImportStageTiming] = []
 
 class BankReconciliation(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -164,8 +216,10 @@ class BankReconciliation(BaseModel):
     bank_amount: float
     bank_description: str
     matched_transaction_id: Optional[str] = None
-    reconciliation_status: str  # 'unmatched', 'matched', 'ignored'
+    reconciliation_status: str  # 'unmatched', 'matched', 'matched_split', 'matched_specification', 'partial_payment', 'rejected', 'ignored'
     match_confidence: float = 0.0  # 0-1 score
+    matched_amount: Optional[float] = None  # Part of the bank amount covered by this match (split payments)
+    notes: Optional[str] = None  # E.g. the insurer's rejection reason
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class BankTransaction(BaseModel):
@@ -175,6 +229,8 @@ class BankTransaction(BaseModel):
     description: str
     counterparty: Optional[str] = None
     account_number: Optional[str] = None
+    invoice_numbers: List[str] = []  # Factuurnummers found in the description
+    counterparty_key: str = ''  # Normalised counterparty, for grouping unmatched rows
     reconciled: bool = False
 
 # Nieuwe models voor verzekeraars en crediteuren
@@ -194,6 +250,7 @@ class Crediteur(BaseModel):
     crediteur: str
     bedrag: float
     dag: int  # Dag van de maand (1-31)
+    iban: Optional[str] = None  # Rekeningnummer, used to recognise bank payments to this crediteur
     actief: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -201,6 +258,34 @@ class CrediteurCreate(BaseModel):
     crediteur: str
     bedrag: float
     dag: int
+    iban: Optional[str] = None
+
+class ClassificationRule(BaseModel):
+    id: str
+    match_field: str  # 'iban', 'counterparty' or 'description'
+    pattern: str  # Normalised IBAN, counterparty name or description pattern
+    classification_type: str  # 'vast' of 'variabel'
+    category_name: str
+    hit_count: int = 0  # Classifications that chose this type and category
+    applied_count: int = 0  # Bank transactions it classified
+    active: bool = True
+    created_at: datetime
+
+class RecurringCrediteurApplyRequest(BaseModel):
+    counterparty_keys: Optional[List[str]] = None  # Proposals to apply; all of them when omitted
+
+class BulkClassifyRequest(BaseModel):
+    bank_transaction_ids: List[str]
+    classification_type: str = Field(..., pattern="^(vast|variabel)$")
+    category_name: str
+
+class Counterparty(BaseModel):
+    iban: str  # Normalised, e.g. NL91ABNA0417164300
+    kind: str  # 'crediteur' or 'verzekeraar'
+    target_id: str
+    name: str
+    match_count: int = 0  # Reconciled bank rows that confirmed this counterparty
+    last_matched_at: datetime
 
 # Nieuwe models voor uitgebreide cashflow management
 class BankSaldo(BaseModel):
@@ -239,6 +324,23 @@ class CorrectionCreate(BaseModel):
     date: date
     patient_name: Optional[str] = None
 
+class BatchSuggestionsRequest(BaseModel):
+    bank_transaction_ids: List[str]  # A page of bank transactions
+
+class BatchMatchItem(BaseModel):
+    bank_transaction_id: str
+    cashflow_transaction_id: Optional[str] = None  # Either a cashflow transaction...
+    crediteur_id: Optional[str] = None  # ...or a crediteur
+
+class BatchMatchRequest(BaseModel):
+    matches: List[BatchMatchItem]
+    idempotency_key: Optional[str] = None  # Retrying with the same key returns the first result
+
+class SplitMatchRequest(BaseModel):
+    bank_transaction_id: str
+    transaction_ids: List[str]  # Declaraties paid together by this bank transaction
+    idempotency_key: Optional[str] = None
+
 class CopyPasteImportRequest(BaseModel):
     data: str  # Raw copy-paste data
     import_type: str  # 'verzekeraars' of 'crediteuren'
@@ -249,6 +351,7 @@ class CopyPasteImportResult(BaseModel):
     error_count: int
     errors: List[str]
     preview_data: List[Dict[str, Any]]
+    timings: List[ImportStageTiming] = []
 
 class VerwachteBetaling(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -263,16 +366,18 @@ class VerwachteBetaling(BaseModel):
 
 # Transaction endpoints
 @api_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate):
+async def create_transaction(transaction: TransactionCreate, background_tasks: BackgroundTasks):
     """Create a new transaction"""
     transaction_dict = transaction.dict()
-    transaction_obj = Transaction(**transaction_dict)
+    transaction_obj = Transaction(**transaction_dict, open_amount=transaction_dict['amount'])
     
     # Prepare for MongoDB storage
     mongo_dict = prepare_for_mongo(transaction_obj.dict())
     
     try:
         await db.transactions.insert_one(mongo_dict)
+        await invalidate_match_indexes()
+        background_tasks.add_task(refresh_candidates_after_import, [transaction_obj.id])
         return transaction_obj
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating transaction: {str(e)}")
@@ -324,7 +429,7 @@ async def get_transaction(transaction_id: str):
         raise HTTPException(status_code=500, detail=f"Error fetching transaction: {str(e)}")
 
 @api_router.put("/transactions/{transaction_id}", response_model=Transaction)
-async def update_transaction(transaction_id: str, update_data: TransactionUpdate):
+async def update_transaction(transaction_id: str, update_data: TransactionUpdate, background_tasks: BackgroundTasks):
     """Update a transaction"""
     try:
         # Remove None values from update data
@@ -336,14 +441,13 @@ async def update_transaction(transaction_id: str, update_data: TransactionUpdate
         # Prepare dates for MongoDB
         update_dict = prepare_for_mongo(update_dict)
         
-        result = await db.transactions.update_one(
-            {"id": transaction_id},
-            {"$set": update_dict}
-        )
-        
-        if result.matched_count == 0:
+        if await update_transaction_fields(transaction_id, update_dict) is None:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
+        # Bank rows that offered it may no longer apply; rows in its (new) date window are recomputed
+        await discard_reconciliation_candidates(transaction_ids=[transaction_id])
+        background_tasks.add_task(refresh_candidates_after_import, [transaction_id])
+        
         # Return updated transaction
         updated_transaction = await db.transactions.find_one({"id": transaction_id})
         return Transaction(**parse_from_mongo(updated_transaction))
@@ -357,6 +461,7 @@ async def delete_transaction(transaction_id: str):
         result = await db.transactions.delete_one({"id": transaction_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Transaction not found")
+        await discard_reconciliation_candidates(transaction_ids=[transaction_id])
         return {"message": "Transaction deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting transaction: {str(e)}")
@@ -456,6 +561,45 @@ def extract_clean_name(raw_name: str) -> str:
     # If no dash, return the original (already clean)
     return raw_name
 
+# Factuurnummers in bank descriptions: EPD numbers (e.g. 202200008321) and labelled references ("factuur nr: F-1234")
+INVOICE_NUMBER_PATTERNS = [
+    re.compile(r"(?<!\d)(20\d{10})(?!\d)"),
+    re.compile(r"\b(?:factuurnummer|factuurnr|factuur|fact|nota|declaratie|invoice|inv)\.?\s*(?:nr\.?|nummer|no\.?)?\s*[:#]?\s*([a-z]{0,4}-?\d{4,})", re.IGNORECASE),
+]
+
+def extract_invoice_numbers(description: Optional[str]) -> List[str]:
+    """Invoice number tokens in a bank description, in order of appearance"""
+    found = []
+    for pattern in INVOICE_NUMBER_PATTERNS:
+        for match in pattern.finditer(description or ''):
+            if match.group(1) not in found:
+                found.append(match.group(1))
+    return found
+
+def bank_invoice_numbers(bank_trans: Dict[str, Any]) -> List[str]:
+    """Stored invoice numbers of a bank transaction, extracted on the fly for rows imported before they were stored"""
+    if 'invoice_numbers' in bank_trans:
+        return bank_trans['invoice_numbers']
+    return extract_invoice_numbers(bank_trans.get('description'))
+
+def counterparty_key(counterparty: Optional[str], description: Optional[str] = None) -> str:
+    """Grouping key for a bank counterparty ('Vastgoed B.V.' and 'VASTGOED BV' -> 'vastgoed');
+    the description pattern when the bank gave no name"""
+    words = [word for word in re.findall(r"[a-z0-9]+", (counterparty or '').lower().replace('.', '')) if word not in NAME_STOP_WORDS]
+    return ' '.join(words) or description_pattern(description)
+
+def new_bank_transaction(mapped_data: Dict[str, Any]) -> BankTransaction:
+    """BankTransaction for an imported row, with the keys derived from its description and counterparty"""
+    return BankTransaction(
+        **mapped_data,
+        invoice_numbers=extract_invoice_numbers(mapped_data.get('description')),
+        counterparty_key=counterparty_key(mapped_data.get('counterparty'), mapped_data.get('description'))
+    )
+
+def normalize_name(name: str) -> str:
+    """Normalized name key for verzekeraars/crediteuren: lowercase, single spaces"""
+    return ' '.join((name or '').lower().split())
+
 def parse_dutch_currency(value: str) -> float:
     """Parse Dutch currency format (€ -1.008,50 or -48,50) to float"""
     if not value:
@@ -494,6 +638,40 @@ def parse_dutch_currency(value: str) -> float:
     except ValueError:
         return 0.0
 
+COPY_PASTE_DELIMITERS = ['\t', ';', ',', '  ', ' ']
+COPY_PASTE_SAMPLE_LINES = 50
+
+def _split_paste_line(line: str, delimiter: str) -> List[str]:
+    """Split one pasted line and drop empty parts"""
+    if delimiter in ('  ', ' '):  # Any run of whitespace
+        return line.split()
+    return [part.strip() for part in line.split(delimiter) if part.strip()]
+
+def _fit_paste_parts(parts: List[str], expected_columns: List[str]) -> Optional[Dict[str, str]]:
+    """Map split parts onto the expected columns, folding extra parts into the first column (names with spaces)"""
+    if len(parts) == len(expected_columns):
+        return dict(zip(expected_columns, parts))
+    if len(parts) > len(expected_columns) and len(expected_columns) >= 2:
+        tail_size = len(expected_columns) - 1
+        final_parts = [' '.join(parts[:-tail_size])] + parts[-tail_size:]
+        return dict(zip(expected_columns, final_parts))
+    return None
+
+def detect_copy_paste_delimiter(lines: List[str], expected_columns: List[str]) -> str:
+    """Pick the delimiter whose column counts best fit the expected columns on a sample of lines"""
+    sample = lines[:COPY_PASTE_SAMPLE_LINES]
+    best_delimiter = COPY_PASTE_DELIMITERS[-1]
+    best_score = (0, 0)
+    for delimiter in COPY_PASTE_DELIMITERS:
+        counts = [len(_split_paste_line(line, delimiter)) for line in sample]
+        exact = sum(1 for count in counts if count == len(expected_columns))
+        usable = sum(1 for count in counts if count >= len(expected_columns))
+        # Earlier delimiters win ties, matching the historical preference order
+        if (exact, usable) > best_score:
+            best_delimiter = delimiter
+            best_score = (exact, usable)
+    return best_delimiter
+
 def parse_copy_paste_data(data: str, expected_columns: List[str]) -> List[Dict[str, str]]:
     """Parse copy-paste data (tab/space separated) into structured format"""
     lines = [line.strip() for line in data.strip().split('\n') if line.strip()]
@@ -501,58 +679,13 @@ def parse_copy_paste_data(data: str, expected_columns: List[str]) -> List[Dict[s
     if not lines:
         raise HTTPException(status_code=400, detail="Geen data gevonden")
     
-    # Try different delimiters
-    delimiters = ['\t', ';', ',', '  ', ' ']
-    
-    for delimiter in delimiters:
-        try:
-            parsed_data = []
-            for i, line in enumerate(lines):
-                if delimiter == '  ':  # Multiple spaces
-                    parts = [p.strip() for p in line.split() if p.strip()]
-                else:
-                    parts = [p.strip() for p in line.split(delimiter)]
-                
-                # Filter out empty parts but keep parts that might be intentionally empty (like "-")
-                filtered_parts = []
-                for part in parts:
-                    if part.strip() or part == '-':  # Keep non-empty parts or explicit dashes
-                        filtered_parts.append(part.strip() if part.strip() else part)
-                
-                if len(filtered_parts) == len(expected_columns):
-                    row_dict = {expected_columns[j]: filtered_parts[j] for j in range(len(filtered_parts))}
-                    parsed_data.append(row_dict)
-                elif len(filtered_parts) > len(expected_columns):
-                    # If we have more parts than expected, try to combine some (useful for names with spaces)
-                    if len(expected_columns) >= 2:
-                        # Combine extra parts into the first column (usually name)
-                        combined_first = ' '.join(filtered_parts[:-(len(expected_columns)-1)])
-                        remaining_parts = filtered_parts[-(len(expected_columns)-1):]
-                        final_parts = [combined_first] + remaining_parts
-                        
-                        if len(final_parts) == len(expected_columns):
-                            row_dict = {expected_columns[j]: final_parts[j] for j in range(len(final_parts))}
-                            parsed_data.append(row_dict)
-            
-            if len(parsed_data) > 0:
-                return parsed_data
-                
-        except Exception:
-            continue
+    # Choose the delimiter once from a sample, then split every line exactly once
+    delimiter = detect_copy_paste_delimiter(lines, expected_columns)
     
-    # If no delimiter worked, treat as space-separated with smart combination
     parsed_data = []
     for line in lines:
-        parts = [p for p in line.split() if p]
-        if len(parts) >= len(expected_columns):
-            if len(parts) == len(expected_columns):
-                row_dict = {expected_columns[j]: parts[j] for j in range(len(expected_columns))}
-            else:
-                # Combine extra parts into first column
-                combined_first = ' '.join(parts[:-(len(expected_columns)-1)])
-                remaining_parts = parts[-(len(expected_columns)-1):]
-                final_parts = [combined_first] + remaining_parts
-                row_dict = {expected_columns[j]: final_parts[j] for j in range(len(expected_columns))}
+        row_dict = _fit_paste_parts(_split_paste_line(line, delimiter), expected_columns)
+        if row_dict is not None:
             parsed_data.append(row_dict)
     
     return parsed_data
@@ -715,19 +848,20 @@ def parse_csv_file(file_content: str, delimiter: str = ',') -> List[Dict[str, st
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error parsing CSV: {str(e)}")
 
-def validate_epd_declaratie_row(row: Dict[str, str], row_number: int) -> ImportPreviewItem:
+def validate_epd_declaratie_row(row: Dict[str, str], row_number: int, column_mapping: Optional[Dict[str, str]] = None) -> ImportPreviewItem:
     """Validate EPD declaratie row and return preview item"""
     errors = []
     mapped_data = {}
+    column_mapping = column_mapping or {}
     
     # Map columns: factuur, datum, verzekeraar, bedrag
     try:
-        mapped_data['invoice_number'] = row.get('factuur', '').strip()
+        mapped_data['invoice_number'] = row.get(column_mapping.get('invoice_number', 'factuur'), '').strip()
         if not mapped_data['invoice_number']:
             errors.append('Factuur nummer is verplicht')
             
         # Parse date - support Dutch format like "8-1-2025"
-        date_str = row.get('datum', '').strip()
+        date_str = row.get(column_mapping.get('date', 'datum'), '').strip()
         if date_str:
             try:
                 # Try Dutch format first (d-m-yyyy)
@@ -746,7 +880,7 @@ def validate_epd_declaratie_row(row: Dict[str, str], row_number: int) -> ImportP
             errors.append('Datum is verplicht')
             
         # Parse amount using improved Dutch currency parser
-        amount_str = row.get('bedrag', '').strip()
+        amount_str = row.get(column_mapping.get('amount', 'bedrag'), '').strip()
         if amount_str:
             try:
                 parsed_amount = parse_dutch_currency(amount_str)
@@ -760,7 +894,7 @@ def validate_epd_declaratie_row(row: Dict[str, str], row_number: int) -> ImportP
             errors.append('Bedrag is verplicht')
             
         # Verzekeraar - extract clean name (remove factuurnummer prefix)
-        verzekeraar_raw = row.get('verzekeraar', '').strip()
+        verzekeraar_raw = row.get(column_mapping.get('patient_name', 'verzekeraar'), '').strip()
         verzekeraar_clean = extract_clean_name(verzekeraar_raw)
         mapped_data['patient_name'] = verzekeraar_clean
             
@@ -779,19 +913,20 @@ def validate_epd_declaratie_row(row: Dict[str, str], row_number: int) -> ImportP
         import_status=status
     )
 
-def validate_epd_particulier_row(row: Dict[str, str], row_number: int) -> ImportPreviewItem:
+def validate_epd_particulier_row(row: Dict[str, str], row_number: int, column_mapping: Optional[Dict[str, str]] = None) -> ImportPreviewItem:
     """Validate EPD particulier row and return preview item"""
     errors = []
     mapped_data = {}
+    column_mapping = column_mapping or {}
     
     # Map columns: factuur, datum, debiteur, bedrag
     try:
-        mapped_data['invoice_number'] = row.get('factuur', '').strip()
+        mapped_data['invoice_number'] = row.get(column_mapping.get('invoice_number', 'factuur'), '').strip()
         if not mapped_data['invoice_number']:
             errors.append('Factuur nummer is verplicht')
             
         # Parse date - support Dutch format like "8-1-2025"
-        date_str = row.get('datum', '').strip()
+        date_str = row.get(column_mapping.get('date', 'datum'), '').strip()
         if date_str:
             try:
                 # Try Dutch format first (d-m-yyyy)
@@ -810,7 +945,7 @@ def validate_epd_particulier_row(row: Dict[str, str], row_number: int) -> Import
             errors.append('Datum is verplicht')
             
         # Parse amount using improved Dutch currency parser
-        amount_str = row.get('bedrag', '').strip()
+        amount_str = row.get(column_mapping.get('amount', 'bedrag'), '').strip()
         if amount_str:
             try:
                 parsed_amount = parse_dutch_currency(amount_str)
@@ -824,7 +959,7 @@ def validate_epd_particulier_row(row: Dict[str, str], row_number: int) -> Import
             errors.append('Bedrag is verplicht')
             
         # Extract clean patient name (remove factuurnummer prefix)
-        debiteur = row.get('debiteur', '').strip()
+        debiteur = row.get(column_mapping.get('patient_name', 'debiteur'), '').strip()
         patient_name = extract_clean_name(debiteur)
         
         mapped_data['patient_name'] = patient_name
@@ -843,7 +978,83 @@ def validate_epd_particulier_row(row: Dict[str, str], row_number: int) -> Import
         import_status=status
     )
 
-def validate_bunq_row(row: Dict[str, str], row_number: int) -> ImportPreviewItem:
+# Column candidates per logical field, in priority order. Discovery picks the first
+# candidate present in the header row; the result is stored as a column mapping
+# profile so later uploads with the same layout skip discovery.
+BUNQ_DATE_COLUMNS = [
+    'datum',  # Exact BUNQ column name first
+    'Date', 'Datum', 'date', 'DATE',
+    'Transactiedatum', 'transactiedatum', 'Transaction Date', 'transaction_date',
+    'Boekingsdatum', 'boekingsdatum', 'Booking Date', 'booking_date',
+    'Created', 'created', 'Tijd', 'tijd', 'Time', 'time'
+]
+
+BUNQ_AMOUNT_COLUMNS = [
+    'bedrag',  # Exact BUNQ column name first
+    ' bedrag',  # With leading space (as seen in the error)
+    'Amount', 'Bedrag', 'amount', 'AMOUNT',
+    'Transactiebedrag', 'transactiebedrag', 'Transaction Amount', 'transaction_amount',
+    'Saldo mutatie', 'saldo_mutatie', 'Balance Change', 'balance_change',
+    'Waarde', 'waarde', 'Value', 'value', 'EUR', 'eur',
+    'Debet', 'debet', 'Credit', 'credit'
+]
+
+BUNQ_COUNTERPARTY_COLUMNS = [
+    'debiteur',  # Exact BUNQ column name first
+    'Counterparty', 'tegenpartij', 'Tegenpartij', 'counterparty',
+    'Naam tegenpartij', 'naam_tegenpartij', 'Counterparty Name', 'counterparty_name',
+    'Begunstigde', 'begunstigde', 'Beneficiary', 'beneficiary',
+    'Van/naar', 'van_naar', 'From/To', 'from_to'
+]
+
+BUNQ_DESCRIPTION_COLUMNS = [
+    'omschrijving',  # Exact BUNQ column name first
+    'Description', 'Omschrijving', 'description',
+    'Transactieomschrijving', 'transactieomschrijving', 'Transaction Description', 'transaction_description',
+    'Memo', 'memo', 'Note', 'note', 'Notes', 'notes',
+    'Mededelingen', 'mededelingen', 'Message', 'message'
+]
+
+BUNQ_ACCOUNT_COLUMNS = [
+    'Account', 'rekening', 'Rekening', 'account',
+    'IBAN', 'iban', 'Rekeningnummer', 'rekeningnummer',
+    'Account Number', 'account_number', 'From Account', 'from_account'
+]
+
+IMPORT_COLUMN_CANDIDATES = {
+    'epd_declaraties': {
+        'invoice_number': ['factuur'],
+        'date': ['datum'],
+        'patient_name': ['verzekeraar'],
+        'amount': ['bedrag']
+    },
+    'epd_particulier': {
+        'invoice_number': ['factuur'],
+        'date': ['datum'],
+        'patient_name': ['debiteur'],
+        'amount': ['bedrag']
+    },
+    'bank_bunq': {
+        'date': BUNQ_DATE_COLUMNS,
+        'amount': BUNQ_AMOUNT_COLUMNS,
+        'counterparty': BUNQ_COUNTERPARTY_COLUMNS,
+        'description': BUNQ_DESCRIPTION_COLUMNS,
+        'account_number': BUNQ_ACCOUNT_COLUMNS
+    }
+}
+
+def _mapped_columns(column_mapping: Optional[Dict[str, str]], field: str, candidates: List[str]) -> List[str]:
+    """Return the columns to probe for a field: the profile's column first, then the other candidates.
+    
+    A profile records one column per field, but layouts such as Debet/Credit or an empty debiteur next
+    to a filled Tegenpartij spread a field over several columns, so each row still falls back per value.
+    """
+    mapped = (column_mapping or {}).get(field)
+    if not mapped:
+        return candidates
+    return [mapped] + [column for column in candidates if column != mapped]
+
+def validate_bunq_row(row: Dict[str, str], row_number: int, column_mapping: Optional[Dict[str, str]] = None) -> ImportPreviewItem:
     """Validate BUNQ bank row and return preview item"""
     errors = []
     mapped_data = {}
@@ -855,16 +1066,8 @@ def validate_bunq_row(row: Dict[str, str], row_number: int) -> ImportPreviewItem
         
         # Parse date - try extensive list of possible column names (including exact BUNQ format)
         date_str = ''
-        date_columns = [
-            'datum',  # Exact BUNQ column name first
-            'Date', 'Datum', 'date', 'DATE',
-            'Transactiedatum', 'transactiedatum', 'Transaction Date', 'transaction_date',
-            'Boekingsdatum', 'boekingsdatum', 'Booking Date', 'booking_date',
-            'Created', 'created', 'Tijd', 'tijd', 'Time', 'time'
-        ]
-        
         found_date_col = None
-        for date_col in date_columns:
+        for date_col in _mapped_columns(column_mapping, 'date', BUNQ_DATE_COLUMNS):
             if date_col in row and row[date_col] and str(row[date_col]).strip():
                 date_str = str(row[date_col]).strip()
                 found_date_col = date_col
@@ -900,18 +1103,8 @@ def validate_bunq_row(row: Dict[str, str], row_number: int) -> ImportPreviewItem
             
         # Parse amount - try extensive list of possible column names (including exact BUNQ format)
         amount_str = ''
-        amount_columns = [
-            'bedrag',  # Exact BUNQ column name first
-            ' bedrag',  # With leading space (as seen in the error)
-            'Amount', 'Bedrag', 'amount', 'AMOUNT',
-            'Transactiebedrag', 'transactiebedrag', 'Transaction Amount', 'transaction_amount',
-            'Saldo mutatie', 'saldo_mutatie', 'Balance Change', 'balance_change',
-            'Waarde', 'waarde', 'Value', 'value', 'EUR', 'eur',
-            'Debet', 'debet', 'Credit', 'credit'
-        ]
-        
         found_amount_col = None
-        for amount_col in amount_columns:
+        for amount_col in _mapped_columns(column_mapping, 'amount', BUNQ_AMOUNT_COLUMNS):
             if amount_col in row and row[amount_col] and str(row[amount_col]).strip():
                 amount_str = str(row[amount_col]).strip()
                 found_amount_col = amount_col
@@ -930,38 +1123,19 @@ def validate_bunq_row(row: Dict[str, str], row_number: int) -> ImportPreviewItem
             
         # Other fields - try extensive column names (including exact BUNQ format)
         mapped_data['counterparty'] = ''
-        counterparty_columns = [
-            'debiteur',  # Exact BUNQ column name first
-            'Counterparty', 'tegenpartij', 'Tegenpartij', 'counterparty',
-            'Naam tegenpartij', 'naam_tegenpartij', 'Counterparty Name', 'counterparty_name',
-            'Begunstigde', 'begunstigde', 'Beneficiary', 'beneficiary',
-            'Van/naar', 'van_naar', 'From/To', 'from_to'
-        ]
-        for counter_col in counterparty_columns:
+        for counter_col in _mapped_columns(column_mapping, 'counterparty', BUNQ_COUNTERPARTY_COLUMNS):
             if counter_col in row and row[counter_col] and str(row[counter_col]).strip():
                 mapped_data['counterparty'] = str(row[counter_col]).strip()
                 break
                 
         mapped_data['description'] = ''
-        description_columns = [
-            'omschrijving',  # Exact BUNQ column name first
-            'Description', 'Omschrijving', 'description',
-            'Transactieomschrijving', 'transactieomschrijving', 'Transaction Description', 'transaction_description',
-            'Memo', 'memo', 'Note', 'note', 'Notes', 'notes',
-            'Mededelingen', 'mededelingen', 'Message', 'message'
-        ]
-        for desc_col in description_columns:
+        for desc_col in _mapped_columns(column_mapping, 'description', BUNQ_DESCRIPTION_COLUMNS):
             if desc_col in row and row[desc_col] and str(row[desc_col]).strip():
                 mapped_data['description'] = str(row[desc_col]).strip()
                 break
                 
         mapped_data['account_number'] = ''
-        account_columns = [
-            'Account', 'rekening', 'Rekening', 'account',
-            'IBAN', 'iban', 'Rekeningnummer', 'rekeningnummer',
-            'Account Number', 'account_number', 'From Account', 'from_account'
-        ]
-        for acc_col in account_columns:
+        for acc_col in _mapped_columns(column_mapping, 'account_number', BUNQ_ACCOUNT_COLUMNS):
             if acc_col in row and row[acc_col] and str(row[acc_col]).strip():
                 mapped_data['account_number'] = str(row[acc_col]).strip()
                 break
@@ -983,6 +1157,614 @@ def validate_bunq_row(row: Dict[str, str], row_number: int) -> ImportPreviewItem
         import_status=status
     )
 
+def validate_import_row(import_type: str, row: Dict[str, str], row_number: int, column_mapping: Optional[Dict[str, str]] = None) -> ImportPreviewItem:
+    """Validate a single CSV row with the validator for the given import type"""
+    if import_type == 'epd_declaraties':
+        return validate_epd_declaratie_row(row, row_number, column_mapping)
+    elif import_type == 'epd_particulier':
+        return validate_epd_particulier_row(row, row_number, column_mapping)
+    elif import_type == 'bank_bunq':
+        return validate_bunq_row(row, row_number, column_mapping)
+    raise HTTPException(status_code=400, detail=f"Onbekend import type: {import_type}")
+
+# Column mapping profiles
+def normalize_header_row(columns: List[str]) -> List[str]:
+    """Normalize header names (trimmed) so surrounding whitespace does not split a profile.
+    Case is kept: the stored mapping names columns exactly as they appear in the file."""
+    return [str(column).strip() for column in columns]
+
+def compute_header_fingerprint(columns: List[str]) -> str:
+    """Stable hash of the normalized header row"""
+    normalized = '\x1f'.join(normalize_header_row(columns))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def discover_column_mapping(import_type: str, rows: List[Dict[str, str]], sample_size: int = 20) -> Dict[str, str]:
+    """Resolve logical field -> CSV column from the candidate lists, using a sample of rows"""
+    candidates_by_field = IMPORT_COLUMN_CANDIDATES.get(import_type)
+    if candidates_by_field is None:
+        raise HTTPException(status_code=400, detail=f"Onbekend import type: {import_type}")
+    if not rows:
+        return {}
+    
+    # Candidates are matched case-insensitively; the mapping names the column as the file spells it
+    header = {column.lower(): column for column in reversed(list(rows[0].keys()))}
+    sample = rows[:sample_size]
+    mapping = {}
+    for field, candidates in candidates_by_field.items():
+        present = [header[column.lower()] for column in candidates if column.lower() in header]
+        # Prefer the first candidate that actually carries data in the sample
+        for column in present:
+            if any(str(row.get(column) or '').strip() for row in sample):
+                mapping[field] = column
+                break
+        else:
+            if present:
+                mapping[field] = present[0]
+    return mapping
+
+async def resolve_column_mapping_profile(import_type: str, rows: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Look up the column mapping profile for this header layout, discovering and storing it on first use"""
+    columns = list(rows[0].keys())
+    fingerprint = compute_header_fingerprint(columns)
+    
+    profile = await db.column_mapping_profiles.find_one({"fingerprint": fingerprint, "import_type": import_type})
+    if profile:
+        return profile
+    
+    now = datetime.now(timezone.utc)
+    profile = ColumnMappingProfile(
+        fingerprint=fingerprint,
+        import_type=import_type,
+        columns=columns,
+        column_mapping=discover_column_mapping(import_type, rows),
+        source='auto',
+        created_at=now,
+        updated_at=now
+    )
+    profile_dict = prepare_for_mongo(profile.dict())
+    profile_dict['updated_at'] = now.isoformat()
+    
+    # $setOnInsert keeps a concurrent upload of the same layout from creating a duplicate
+    await db.column_mapping_profiles.update_one(
+        {"fingerprint": fingerprint, "import_type": import_type},
+        {"$setOnInsert": profile_dict},
+        upsert=True
+    )
+    return await db.column_mapping_profiles.find_one({"fingerprint": fingerprint, "import_type": import_type})
+
+# Bank statement parsers
+# Each parser reads a binary stream and yields ImportPreviewItems whose mapped_data
+# has the same shape as validate_bunq_row: date, amount, original_amount,
+# counterparty, description and account_number (counterparty IBAN).
+def decode_file_content(content: bytes) -> str:
+    """Decode uploaded file content, trying the encodings banks commonly export in"""
+    for encoding in ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']:
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise HTTPException(status_code=400, detail="Kan bestand encoding niet detecteren")
+
+def _build_bank_preview_item(
+    row_number: int,
+    date_str: str,
+    date_formats: List[str],
+    amount: Optional[float],
+    counterparty: str = '',
+    description: str = '',
+    account_number: str = '',
+    errors: Optional[List[str]] = None
+) -> ImportPreviewItem:
+    """Build a bank ImportPreviewItem from already extracted fields"""
+    errors = list(errors or [])
+    mapped_data = {}
+    
+    date_str = (date_str or '').strip()
+    if date_str:
+        for fmt in date_formats:
+            try:
+                mapped_data['date'] = datetime.strptime(date_str, fmt).date().isoformat()
+                break
+            except ValueError:
+                continue
+        else:
+            errors.append(f'Ongeldige datum format: {date_str}')
+    else:
+        errors.append('Datum is verplicht')
+    
+    if amount is None:
+        errors.append('Bedrag is verplicht')
+    else:
+        mapped_data['amount'] = amount
+        mapped_data['original_amount'] = amount
+    
+    mapped_data['counterparty'] = (counterparty or '').strip()
+    mapped_data['description'] = (description or '').strip()
+    mapped_data['account_number'] = (account_number or '').replace(' ', '').strip()
+    
+    status = 'error' if errors else 'valid'
+    return ImportPreviewItem(
+        row_number=row_number,
+        mapped_data=mapped_data,
+        validation_errors=errors,
+        import_status=status
+    )
+
+def parse_ing_statement(stream) -> Iterator[ImportPreviewItem]:
+    """ING CSV export: Datum (yyyymmdd), Naam / Omschrijving, Tegenrekening, Af Bij, Bedrag (EUR), Mededelingen"""
+    rows = parse_csv_file(decode_file_content(stream.read()))
+    for i, row in enumerate(rows, 1):
+        errors = []
+        amount = None
+        amount_str = row.get('Bedrag (EUR)', '')
+        if amount_str:
+            amount = abs(parse_dutch_currency(amount_str))
+            direction = row.get('Af Bij', row.get('Debit/credit', '')).strip().lower()
+            if direction in ('af', 'debit'):
+                amount = -amount
+            elif direction not in ('bij', 'credit'):
+                errors.append(f'Onbekende Af/Bij waarde: {direction}')
+        yield _build_bank_preview_item(
+            i,
+            row.get('Datum', row.get('Date', '')),
+            ['%Y%m%d', '%d-%m-%Y', '%Y-%m-%d'],
+            amount,
+            counterparty=row.get('Naam / Omschrijving', row.get('Name / Description', '')),
+            description=row.get('Mededelingen', row.get('Notifications', '')),
+            account_number=row.get('Tegenrekening', row.get('Counterparty', '')),
+            errors=errors
+        )
+
+def parse_rabobank_statement(stream) -> Iterator[ImportPreviewItem]:
+    """Rabobank CSV export: Datum (yyyy-mm-dd), signed Bedrag, Naam tegenpartij, Omschrijving-1..3"""
+    rows = parse_csv_file(decode_file_content(stream.read()))
+    for i, row in enumerate(rows, 1):
+        amount_str = row.get('Bedrag', '')
+        description = ' '.join(
+            row.get(column, '') for column in ('Omschrijving-1', 'Omschrijving-2', 'Omschrijving-3')
+            if row.get(column, '')
+        )
+        yield _build_bank_preview_item(
+            i,
+            row.get('Datum', ''),
+            ['%Y-%m-%d', '%d-%m-%Y'],
+            parse_dutch_currency(amount_str) if amount_str else None,
+            counterparty=row.get('Naam tegenpartij', ''),
+            description=description,
+            account_number=row.get('Tegenrekening IBAN/BBAN', '')
+        )
+
+# ABN AMRO puts the counterparty inside the description, either as "Naam: ..." or SEPA "/NAME/.../"
+ABN_AMRO_NAME_PATTERNS = [
+    re.compile(r'/NAME/([^/]+)'),
+    re.compile(r'Naam:\s*(.+?)(?:\s{2,}|\s+(?:Omschrijving|Kenmerk|Machtiging|IBAN|BIC):|$)')
+]
+ABN_AMRO_IBAN_PATTERNS = [
+    re.compile(r'/IBAN/([^/]+)'),
+    re.compile(r'IBAN:\s*([A-Z]{2}\d{2}[A-Z0-9]+)')
+]
+
+def _first_pattern_match(patterns: List[re.Pattern], text: str) -> str:
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match.group(1).strip()
+    return ''
+
+def parse_abnamro_statement(stream) -> Iterator[ImportPreviewItem]:
+    """ABN AMRO TAB export without header: rekening, munt, datum, beginsaldo, eindsaldo, rentedatum, bedrag, omschrijving"""
+    content = decode_file_content(stream.read())
+    reader = csv.reader(io.StringIO(content), delimiter='\t')
+    row_number = 0
+    for parts in reader:
+        if not any(part.strip() for part in parts):
+            continue
+        row_number += 1
+        if len(parts) < 8:
+            yield _build_bank_preview_item(
+                row_number, '', [], None,
+                errors=[f'Verwacht 8 kolommen, gevonden: {len(parts)}']
+            )
+            continue
+        description = ' '.join(part.strip() for part in parts[7:] if part.strip())
+        yield _build_bank_preview_item(
+            row_number,
+            parts[2],
+            ['%Y%m%d'],
+            parse_dutch_currency(parts[6]) if parts[6].strip() else None,
+            counterparty=_first_pattern_match(ABN_AMRO_NAME_PATTERNS, description),
+            description=description,
+            account_number=_first_pattern_match(ABN_AMRO_IBAN_PATTERNS, description)
+        )
+
+def _xml_local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def _xml_child(elem, *names: str):
+    """Walk child elements by local name, ignoring the (version specific) CAMT namespace"""
+    for name in names:
+        if elem is None:
+            return None
+        elem = next((child for child in elem if _xml_local_name(child.tag) == name), None)
+    return elem
+
+def _xml_text(elem, *names: str) -> str:
+    found = _xml_child(elem, *names)
+    return (found.text or '').strip() if found is not None else ''
+
+def _camt053_entry_to_item(entry, row_number: int) -> ImportPreviewItem:
+    """Map one CAMT.053 <Ntry> element onto the bank transaction fields"""
+    errors = []
+    amount = None
+    amount_str = _xml_text(entry, 'Amt')
+    if amount_str:
+        try:
+            amount = float(amount_str)
+            if _xml_text(entry, 'CdtDbtInd') == 'DBIT':
+                amount = -amount
+        except ValueError:
+            errors.append(f'Ongeldig bedrag: {amount_str}')
+    
+    date_str = (
+        _xml_text(entry, 'BookgDt', 'Dt') or _xml_text(entry, 'BookgDt', 'DtTm')[:10] or
+        _xml_text(entry, 'ValDt', 'Dt') or _xml_text(entry, 'ValDt', 'DtTm')[:10]
+    )
+    
+    # Outgoing payments name the creditor, incoming payments the debtor
+    tx_details = _xml_child(entry, 'NtryDtls', 'TxDtls')
+    party_tag, account_tag = ('Cdtr', 'CdtrAcct') if amount is not None and amount < 0 else ('Dbtr', 'DbtrAcct')
+    related_parties = _xml_child(tx_details, 'RltdPties')
+    party = _xml_child(related_parties, party_tag)
+    counterparty = _xml_text(party, 'Nm') or _xml_text(party, 'Pty', 'Nm')
+    account_number = _xml_text(related_parties, account_tag, 'Id', 'IBAN')
+    
+    remittance = _xml_child(tx_details, 'RmtInf')
+    description = ' '.join(
+        (child.text or '').strip() for child in (remittance if remittance is not None else [])
+        if _xml_local_name(child.tag) == 'Ustrd' and child.text
+    )
+    if not description:
+        description = _xml_text(tx_details, 'AddtlTxInf') or _xml_text(entry, 'AddtlNtryInf')
+    
+    return _build_bank_preview_item(
+        row_number, date_str, ['%Y-%m-%d'], amount,
+        counterparty=counterparty,
+        description=description,
+        account_number=account_number,
+        errors=errors
+    )
+
+def parse_camt053_statement(stream) -> Iterator[ImportPreviewItem]:
+    """Stream CAMT.053 XML entries with iterparse, dropping each <Ntry> once mapped so memory stays constant"""
+    parents = []
+    row_number = 0
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if _xml_local_name(elem.tag) != 'Ntry':
+            continue
+        row_number += 1
+        yield _camt053_entry_to_item(elem, row_number)
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+
+BANK_STATEMENT_PARSERS = {
+    'bank_ing': parse_ing_statement,
+    'bank_rabobank': parse_rabobank_statement,
+    'bank_abnamro': parse_abnamro_statement,
+    'bank_camt053': parse_camt053_statement
+}
+
+# Header columns the CSV bank parsers read, per field with the alternative spellings they accept
+BANK_STATEMENT_COLUMNS = {
+    'bank_ing': {
+        'date': ['Datum', 'Date'],
+        'amount': ['Bedrag (EUR)'],
+        'direction': ['Af Bij', 'Debit/credit'],
+        'counterparty': ['Naam / Omschrijving', 'Name / Description'],
+        'description': ['Mededelingen', 'Notifications'],
+        'account_number': ['Tegenrekening', 'Counterparty']
+    },
+    'bank_rabobank': {
+        'date': ['Datum'],
+        'amount': ['Bedrag'],
+        'counterparty': ['Naam tegenpartij'],
+        'description': ['Omschrijving-1', 'Omschrijving-2', 'Omschrijving-3'],
+        'account_number': ['Tegenrekening IBAN/BBAN']
+    }
+}
+
+IMPORT_FILE_EXTENSIONS = {
+    'bank_abnamro': ('.tab', '.txt', '.csv'),
+    'bank_camt053': ('.xml',)
+}
+
+def check_import_file_extension(filename: str, import_type: str):
+    """Reject files whose extension does not fit the import type"""
+    extensions = IMPORT_FILE_EXTENSIONS.get(import_type, ('.csv',))
+    if not (filename or '').lower().endswith(extensions):
+        raise HTTPException(status_code=400, detail=f"Alleen {', '.join(extensions)} bestanden zijn toegestaan voor {import_type}")
+
+# Insurer payment specifications
+# A lump-sum insurer payment comes with a specification listing per factuurnummer what was paid.
+# Both parsers read the file incrementally and yield ImportPreviewItems whose mapped_data holds
+# invoice_number, paid_amount, declared_amount (optional) and reason (optional). read_specification
+# collects those items in a list, so memory grows with the number of lines, not with the file.
+SPECIFICATION_FIELDS = {
+    'invoice_number': {'factuurnummer', 'factuurnr', 'declaratienummer', 'declaratienr', 'notanummer', 'invoicenumber', 'nota'},
+    'paid_amount': {'betaald', 'betaaldbedrag', 'bedragbetaald', 'uitbetaald', 'uitbetaaldbedrag', 'toegekend', 'toegekendbedrag', 'paidamount'},
+    'declared_amount': {'gedeclareerd', 'gedeclareerdbedrag', 'declaratiebedrag', 'ingediendbedrag', 'declaredamount'},
+    'reason': {'reden', 'afwijzingsreden', 'retourcode', 'retourcodeomschrijving', 'toelichting', 'opmerking', 'reason'}
+}
+
+def _specification_field(name: str) -> Optional[str]:
+    """Map a column header or XML tag onto a specification field, ignoring case, spaces and punctuation"""
+    key = re.sub(r'[^a-z]', '', name.lower())
+    return next((field for field, aliases in SPECIFICATION_FIELDS.items() if key in aliases), None)
+
+def _build_specification_item(row_number: int, values: Dict[str, str]) -> ImportPreviewItem:
+    errors = []
+    mapped_data = {'invoice_number': (values.get('invoice_number') or '').strip(), 'reason': (values.get('reason') or '').strip() or None}
+    if not mapped_data['invoice_number']:
+        errors.append('Factuurnummer is verplicht')
+    for field in ('paid_amount', 'declared_amount'):
+        amount_str = (values.get(field) or '').strip()
+        if not amount_str:
+            mapped_data[field] = None
+            continue
+        try:
+            mapped_data[field] = parse_dutch_currency(amount_str)
+        except ValueError:
+            mapped_data[field] = None
+            errors.append(f'Ongeldig bedrag: {amount_str}')
+    if mapped_data['paid_amount'] is None and not errors:
+        errors.append('Betaald bedrag is verplicht')
+    return ImportPreviewItem(
+        row_number=row_number,
+        mapped_data=mapped_data,
+        validation_errors=errors,
+        import_status='error' if errors else 'valid'
+    )
+
+def _decoded_lines(stream) -> Iterator[str]:
+    """Decode an upload line by line, falling back to cp1252 for lines that are not UTF-8"""
+    for raw_line in stream:
+        try:
+            yield raw_line.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            yield raw_line.decode('cp1252', errors='replace')
+
+def parse_specification_csv(stream) -> Iterator[ImportPreviewItem]:
+    """Stream a CSV specification row by row; the delimiter is taken from the header line"""
+    lines = _decoded_lines(stream)
+    header_line = next(lines, '')
+    delimiter = max([';', ',', '\t'], key=header_line.count)
+    header = next(csv.reader([header_line], delimiter=delimiter), [])
+    fields = [_specification_field(column) for column in header]
+    if 'invoice_number' not in fields or 'paid_amount' not in fields:
+        raise HTTPException(status_code=400, detail="Specificatie mist een kolom voor factuurnummer of betaald bedrag")
+    row_number = 0
+    for row in csv.reader(lines, delimiter=delimiter):
+        if not any(value.strip() for value in row):
+            continue
+        row_number += 1
+        values = {field: value for field, value in zip(fields, row) if field}
+        yield _build_specification_item(row_number, values)
+
+def parse_specification_xml(stream) -> Iterator[ImportPreviewItem]:
+    """Stream an XML specification with iterparse: every element with a factuurnummer child is a line.
+    
+    Elements with children are detached from their parent once they end, so the tree never holds
+    more than the open path plus the leaf fields of the current element.
+    """
+    row_number = 0
+    path = []  # open elements, each with whether it has child elements
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if path:
+                path[-1][1] = True
+            path.append([elem, False])
+            continue
+        _, has_children = path.pop()
+        if not has_children:
+            continue  # a leaf field, read when its parent ends
+        # Nested elements were detached when they ended, so only leaf fields remain
+        values = {}
+        for child in elem:
+            field = _specification_field(_xml_local_name(child.tag))
+            if field:
+                values[field] = child.text or ''
+        if path:
+            path[-1][0].remove(elem)
+        elem.clear()
+        if 'invoice_number' not in values:
+            continue
+        row_number += 1
+        yield _build_specification_item(row_number, values)
+
+def read_specification(filename: str, stream) -> List[ImportPreviewItem]:
+    """All lines of a CSV or XML specification; blocking, so run it through run_import_task"""
+    parser = parse_specification_xml if filename.lower().endswith('.xml') else parse_specification_csv
+    return list(parser(stream))
+
+# Import timing
+class ImportTimer:
+    """Wall time and row counts per import stage, returned in the response and logged as one JSON line"""
+    
+    def __init__(self, operation: str, **context):
+        self.operation = operation
+        self.context = context
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block; set 'rows' on the yielded dict to record a row count. Repeated stages accumulate."""
+        entry = {'rows': None}
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            self.add(name, time.perf_counter() - start, entry['rows'])
+    
+    def add(self, name: str, seconds: float, rows: Optional[int] = None):
+        stage = self.stages.setdefault(name, {'duration_ms': 0.0, 'rows': None})
+        stage['duration_ms'] += seconds * 1000
+        if rows is not None:
+            stage['rows'] = (stage['rows'] or 0) + rows
+    
+    def summary(self) -> List[ImportStageTiming]:
+        return [
+            ImportStageTiming(stage=name, duration_ms=round(stage['duration_ms'], 2), rows=stage['rows'])
+            for name, stage in self.stages.items()
+        ]
+    
+    def finish(self, **context) -> List[ImportStageTiming]:
+        """Log the breakdown and return it for the response"""
+        timings = self.summary()
+        logger.info(json.dumps({
+            "event": "import_timing",
+            "operation": self.operation,
+            **self.context,
+            **context,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "stages": [timing.dict() for timing in timings]
+        }, default=str))
+        return timings
+
+# Import workers
+# CSV parsing and row validation are pure CPU work. They run in the default thread
+# pool so the event loop keeps serving other requests; files above IMPORT_SHARD_ROWS
+# rows are validated in shards across a process pool to use multiple cores.
+IMPORT_PARSE_CONCURRENCY = int(os.environ.get('IMPORT_PARSE_CONCURRENCY', '2'))
+IMPORT_SHARD_ROWS = int(os.environ.get('IMPORT_SHARD_ROWS', '5000'))
+IMPORT_PROCESS_WORKERS = int(os.environ.get('IMPORT_PROCESS_WORKERS', str(os.cpu_count() or 2)))
+import_parse_semaphore = asyncio.Semaphore(IMPORT_PARSE_CONCURRENCY)
+_import_process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_import_process_pool() -> ProcessPoolExecutor:
+    global _import_process_pool
+    if _import_process_pool is None:
+        _import_process_pool = ProcessPoolExecutor(max_workers=IMPORT_PROCESS_WORKERS)
+    return _import_process_pool
+
+async def run_import_task(func, *args):
+    """Run CPU-bound import work in a worker thread, at most IMPORT_PARSE_CONCURRENCY at a time"""
+    async with import_parse_semaphore:
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+def validate_import_rows_shard(import_type: str, rows: List[Dict[str, str]], first_row_number: int, column_mapping: Optional[Dict[str, str]]) -> List[ImportPreviewItem]:
+    return [
+        validate_import_row(import_type, row, row_number, column_mapping)
+        for row_number, row in enumerate(rows, first_row_number)
+    ]
+
+async def validate_import_rows(import_type: str, rows: List[Dict[str, str]], column_mapping: Optional[Dict[str, str]] = None) -> List[ImportPreviewItem]:
+    """Validate all rows off the event loop, sharding very large files across processes"""
+    if len(rows) <= IMPORT_SHARD_ROWS:
+        return await run_import_task(validate_import_rows_shard, import_type, rows, 1, column_mapping)
+    
+    loop = asyncio.get_running_loop()
+    pool = get_import_process_pool()
+    async with import_parse_semaphore:
+        shards = await asyncio.gather(*[
+            loop.run_in_executor(
+                pool, validate_import_rows_shard,
+                import_type, rows[start:start + IMPORT_SHARD_ROWS], start + 1, column_mapping
+            )
+            for start in range(0, len(rows), IMPORT_SHARD_ROWS)
+        ])
+    return [item for shard in shards for item in shard]
+
+def parse_and_validate_copy_paste(data: str, expected_columns: List[str], validate_row) -> List[ImportPreviewItem]:
+    """Parse pasted data and validate every row; run through run_import_task"""
+    parsed_data = parse_copy_paste_data(data, expected_columns)
+    return [validate_row(row, i) for i, row in enumerate(parsed_data, 1)]
+
+def _take(iterator: Iterator, count: int) -> list:
+    return list(itertools.islice(iterator, count))
+
+BANK_IMPORT_BATCH_SIZE = 500
+
+def preview_bank_statement(file_name: str, stream, import_type: str) -> ImportPreview:
+    """Build an ImportPreview from a registered bank statement parser"""
+    timer = ImportTimer('preview', import_type=import_type, file_name=file_name)
+    preview_items = []
+    all_errors = []
+    total_rows = 0
+    valid_rows = 0
+    
+    with timer.stage('parse_validate') as stage:
+        for item in BANK_STATEMENT_PARSERS[import_type](stream):
+            total_rows += 1
+            if item.import_status == 'valid':
+                valid_rows += 1
+            elif len(all_errors) < 50:
+                all_errors.extend(f"Rij {item.row_number}: {error}" for error in item.validation_errors)
+            if len(preview_items) < 20:
+                preview_items.append(item)
+        stage['rows'] = total_rows
+    
+    if total_rows == 0:
+        raise HTTPException(status_code=400, detail="Bestand bevat geen transacties")
+    
+    return ImportPreview(
+        file_name=file_name,
+        import_type=import_type,
+        total_rows=total_rows,
+        valid_rows=valid_rows,
+        error_rows=total_rows - valid_rows,
+        preview_items=preview_items,
+        column_mapping={},
+        all_errors=all_errors[:50],
+        timings=timer.finish(total_rows=total_rows)
+    )
+
+async def import_bank_statement(stream, import_type: str, timer: Optional[ImportTimer] = None) -> ImportResult:
+    """Store the entries of a registered bank statement parser as bank transactions, in batches"""
+    timer = timer or ImportTimer('execute', import_type=import_type)
+    imported_count = 0
+    error_count = 0
+    errors = []
+    created_transactions = []
+    
+    # Pull parsed entries in chunks on a worker thread; the stream is never fully materialized
+    entries = BANK_STATEMENT_PARSERS[import_type](stream)
+    while True:
+        with timer.stage('parse_validate') as stage:
+            chunk = await run_import_task(_take, entries, BANK_IMPORT_BATCH_SIZE)
+            stage['rows'] = len(chunk)
+        if not chunk:
+            break
+        
+        batch = []
+        for item in chunk:
+            if item.import_status != 'valid':
+                error_count += 1
+                errors.append(f"Rij {item.row_number}: {', '.join(item.validation_errors)}")
+                continue
+            bank_trans = new_bank_transaction(item.mapped_data)
+            batch.append(prepare_for_mongo(bank_trans.dict()))
+            created_transactions.append(bank_trans.id)
+        
+        if batch:
+            with timer.stage('insert') as stage:
+                await db.bank_transactions.insert_many(batch)
+                stage['rows'] = len(batch)
+            imported_count += len(batch)
+    
+    return ImportResult(
+        success=True,
+        imported_count=imported_count,
+        error_count=error_count,
+        errors=errors[:10],  # Limit to first 10 errors
+        created_transactions=created_transactions,
+        timings=timer.finish(imported_count=imported_count, error_count=error_count)
+    )
+
 # Import Endpoints
 @api_router.post("/import/debug-preview")
 async def debug_import_preview(
@@ -990,10 +1772,24 @@ async def debug_import_preview(
     import_type: str = Form(...)
 ):
     """Debug preview with detailed error reporting and sample rows"""
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Alleen CSV bestanden zijn toegestaan")
+    check_import_file_extension(file.filename, import_type)
     
     try:
+        if import_type in BANK_STATEMENT_PARSERS:
+            debug_results = []
+            for item in await run_import_task(_take, BANK_STATEMENT_PARSERS[import_type](file.file), 10):
+                debug_results.append({
+                    'row_number': item.row_number,
+                    'mapped_data': item.mapped_data,
+                    'validation_errors': item.validation_errors,
+                    'status': item.import_status
+                })
+            return {
+                'file_name': file.filename,
+                'import_type': import_type,
+                'debug_results': debug_results
+            }
+        
         # Read and parse file with proper encoding detection
         content = await file.read()
         
@@ -1012,22 +1808,17 @@ async def debug_import_preview(
             raise HTTPException(status_code=400, detail="Kan bestand encoding niet detecteren")
         
         # Parse CSV and get sample data
-        rows = parse_csv_file(content_str)
+        rows = await run_import_task(parse_csv_file, content_str)
         
         if not rows:
             return {"error": "Geen geldige rijen gevonden", "sample_rows": [], "total_rows": 0}
         
+        profile = await resolve_column_mapping_profile(import_type, rows)
+        
         # Process first 10 rows for detailed debugging
         debug_results = []
         for i, row in enumerate(rows[:10], 1):
-            if import_type == 'bank_bunq':
-                item = validate_bunq_row(row, i)
-            elif import_type == 'epd_declaraties':
-                item = validate_epd_declaratie_row(row, i)
-            elif import_type == 'epd_particulier':
-                item = validate_epd_particulier_row(row, i)
-            else:
-                raise HTTPException(status_code=400, detail=f"Onbekend import type: {import_type}")
+            item = validate_import_row(import_type, row, i, profile['column_mapping'])
             
             debug_results.append({
                 'row_number': i,
@@ -1045,7 +1836,13 @@ async def debug_import_preview(
             'total_rows': len(rows),
             'columns_found': columns,
             'debug_results': debug_results,
-            'sample_raw_rows': rows[:5]
+            'sample_raw_rows': rows[:5],
+            'column_profile': {
+                'id': profile['id'],
+                'fingerprint': profile['fingerprint'],
+                'source': profile['source'],
+                'column_mapping': profile['column_mapping']
+            }
         }
         
     except Exception as e:
@@ -1076,7 +1873,7 @@ async def inspect_csv_columns(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Kan bestand encoding niet detecteren")
         
         # Parse CSV and get first few rows
-        rows = parse_csv_file(content_str)
+        rows = await run_import_task(parse_csv_file, content_str)
         
         if not rows:
             return {"columns": [], "sample_rows": [], "row_count": 0}
@@ -1089,7 +1886,8 @@ async def inspect_csv_columns(file: UploadFile = File(...)):
             "columns": columns,
             "sample_rows": sample_rows,
             "row_count": len(rows),
-            "filename": file.filename
+            "filename": file.filename,
+            "header_fingerprint": compute_header_fingerprint(columns)
         }
         
     except Exception as e:
@@ -1101,50 +1899,43 @@ async def preview_import(
     import_type: str = Form(...)
 ):
     """Preview import data before processing"""
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Alleen CSV bestanden zijn toegestaan")
+    check_import_file_extension(file.filename, import_type)
     
     try:
-        # Read file content with proper encoding detection
-        content = await file.read()
+        if import_type in BANK_STATEMENT_PARSERS:
+            return await run_import_task(preview_bank_statement, file.filename, file.file, import_type)
         
-        # Try different encodings
-        encodings = ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']
-        content_str = None
+        timer = ImportTimer('preview', import_type=import_type, file_name=file.filename)
         
-        for encoding in encodings:
-            try:
-                content_str = content.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-                
-        if content_str is None:
-            raise HTTPException(status_code=400, detail="Kan bestand encoding niet detecteren")
+        # Read file content with proper encoding detection
+        with timer.stage('read'):
+            content = await file.read()
+        
+        with timer.stage('decode'):
+            content_str = decode_file_content(content)
         
-        # Parse CSV
-        rows = parse_csv_file(content_str)
+        # Parse CSV (includes delimiter guessing)
+        with timer.stage('parse') as stage:
+            rows = await run_import_task(parse_csv_file, content_str)
+            stage['rows'] = len(rows)
         
         if not rows:
             raise HTTPException(status_code=400, detail="CSV bestand is leeg")
         
+        # Known header layouts reuse their stored mapping and skip column discovery
+        with timer.stage('column_profile'):
+            profile = await resolve_column_mapping_profile(import_type, rows)
+        field_mapping = profile['column_mapping']
+        
         # Validate ALL rows first to get accurate statistics, then create preview
-        all_validation_results = []
         total_valid_count = 0
         total_error_count = 0
         
         # Process all rows for accurate statistics
-        for i, row in enumerate(rows, 1):
-            if import_type == 'epd_declaraties':
-                item = validate_epd_declaratie_row(row, i)
-            elif import_type == 'epd_particulier':
-                item = validate_epd_particulier_row(row, i)
-            elif import_type == 'bank_bunq':
-                item = validate_bunq_row(row, i)
-            else:
-                raise HTTPException(status_code=400, detail=f"Onbekend import type: {import_type}")
-            
-            all_validation_results.append(item)
+        with timer.stage('validate') as stage:
+            all_validation_results = await validate_import_rows(import_type, rows, field_mapping)
+            stage['rows'] = len(all_validation_results)
+        for item in all_validation_results:
             if item.import_status == 'valid':
                 total_valid_count += 1
             else:
@@ -1182,68 +1973,58 @@ async def preview_import(
             error_rows=total_error_count,
             preview_items=preview_items,  # Already limited to first 20
             column_mapping=column_mapping,
-            all_errors=all_errors[:50]  # Limit to first 50 errors for display
+            all_errors=all_errors[:50],  # Limit to first 50 errors for display
+            mapping_profile_id=profile['id'],
+            field_mapping=field_mapping,
+            timings=timer.finish(total_rows=len(rows))
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fout bij verwerken bestand: {str(e)}")
 
-@api_router.post("/import/execute", response_model=ImportResult)
-async def execute_import(
-    file: UploadFile = File(...),
-    import_type: str = Form(...)
-):
-    """Execute the import after preview confirmation"""
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Alleen CSV bestanden zijn toegestaan")
+async def import_csv_content(content: bytes, import_type: str, timer: Optional[ImportTimer] = None) -> ImportResult:
+    """Validate and store the rows of an EPD or BUNQ CSV file"""
+    timer = timer or ImportTimer('execute', import_type=import_type)
+    with timer.stage('decode'):
+        content_str = decode_file_content(content)
     
-    try:
-        # Read and parse file with proper encoding detection
-        content = await file.read()
-        
-        # Try different encodings
-        encodings = ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']
-        content_str = None
-        
-        for encoding in encodings:
-            try:
-                content_str = content.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-                
-        if content_str is None:
-            raise HTTPException(status_code=400, detail="Kan bestand encoding niet detecteren")
-        rows = parse_csv_file(content_str)
-        
-        imported_count = 0
-        error_count = 0
-        errors = []
-        created_transactions = []
-        
-        for i, row in enumerate(rows, 1):
+    # Parsing includes delimiter guessing
+    with timer.stage('parse') as stage:
+        rows = await run_import_task(parse_csv_file, content_str)
+        stage['rows'] = len(rows)
+    
+    field_mapping = None
+    if rows:
+        with timer.stage('column_profile'):
+            profile = await resolve_column_mapping_profile(import_type, rows)
+        field_mapping = profile['column_mapping']
+    
+    imported_count = 0
+    error_count = 0
+    errors = []
+    created_transactions = []
+    
+    # Validate and map data
+    with timer.stage('validate') as stage:
+        items = await validate_import_rows(import_type, rows, field_mapping)
+        stage['rows'] = len(items)
+    
+    with timer.stage('insert') as stage:
+        for i, item in enumerate(items, 1):
             try:
-                # Validate and map data
-                if import_type == 'epd_declaraties':
-                    item = validate_epd_declaratie_row(row, i)
-                elif import_type == 'epd_particulier':
-                    item = validate_epd_particulier_row(row, i)
-                elif import_type == 'bank_bunq':
+                if import_type == 'bank_bunq':
                     # For bank data, store as bank transactions for reconciliation
-                    item = validate_bunq_row(row, i)
                     if item.import_status == 'valid':
-                        bank_trans = BankTransaction(**item.mapped_data)
+                        bank_trans = new_bank_transaction(item.mapped_data)
                         bank_dict = prepare_for_mongo(bank_trans.dict())
                         await db.bank_transactions.insert_one(bank_dict)
                         imported_count += 1
                         created_transactions.append(bank_trans.id)
                     continue
-                else:
-                    raise HTTPException(status_code=400, detail=f"Onbekend import type: {import_type}")
                 
                 if item.import_status == 'valid':
                     # Create transaction
-                    transaction_obj = Transaction(**item.mapped_data)
+                    transaction_obj = Transaction(**item.mapped_data, open_amount=item.mapped_data['amount'])
                     mongo_dict = prepare_for_mongo(transaction_obj.dict())
                     await db.transactions.insert_one(mongo_dict)
                     imported_count += 1
@@ -1255,18 +2036,1367 @@ async def execute_import(
             except Exception as e:
                 error_count += 1
                 errors.append(f"Rij {i}: {str(e)}")
+        stage['rows'] = imported_count
+    
+    if imported_count and import_type != 'bank_bunq':
+        await invalidate_match_indexes()
+    
+    return ImportResult(
+        success=True,
+        imported_count=imported_count,
+        error_count=error_count,
+        errors=errors[:10],  # Limit to first 10 errors
+        created_transactions=created_transactions,
+        timings=timer.finish(imported_count=imported_count, error_count=error_count)
+    )
+
+@api_router.post("/import/execute", response_model=ImportResult)
+async def execute_import(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    import_type: str = Form(...)
+):
+    """Execute the import after preview confirmation"""
+    check_import_file_extension(file.filename, import_type)
+    
+    try:
+        timer = ImportTimer('execute', import_type=import_type, file_name=file.filename)
+        if import_type in BANK_STATEMENT_PARSERS:
+            result = await import_bank_statement(file.file, import_type, timer)
+        else:
+            # Read and parse file with proper encoding detection
+            with timer.stage('read'):
+                content = await file.read()
+            result = await import_csv_content(content, import_type, timer)
+        
+        # Reconciliation candidates are computed after the response is sent
+        background_tasks.add_task(classify_after_import, result.created_transactions)
+        background_tasks.add_task(refresh_candidates_after_import, result.created_transactions)
+        return result
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import fout: {str(e)}")
+
+# Batch import
+IMPORT_BATCH_CONCURRENCY = int(os.environ.get('IMPORT_BATCH_CONCURRENCY', '3'))
+IMPORT_ARCHIVE_MAX_FILES = 100
+IMPORT_ARCHIVE_MAX_BYTES = 200 * 1024 * 1024
+IMPORT_ARCHIVE_READ_CHUNK = 1024 * 1024
+IMPORT_DETECTION_SAMPLE_ROWS = 5
+
+# Specific layouts first: on equal scores the earlier (more specific) type wins over the generic BUNQ validator
+CSV_DETECTION_ORDER = ['epd_declaraties', 'epd_particulier', 'bank_ing', 'bank_rabobank', 'bank_bunq']
+
+def expand_import_archives(files: List[tuple]) -> List[tuple]:
+    """Replace zip archives in a list of (file_name, content) by the files they contain"""
+    expanded = []
+    for file_name, content in files:
+        if not file_name.lower().endswith('.zip'):
+            expanded.append((file_name, content))
+            continue
+        
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir() and not Path(info.filename).name.startswith('.') and '__MACOSX' not in info.filename
+            ]
+            if len(members) > IMPORT_ARCHIVE_MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"{file_name}: maximaal {IMPORT_ARCHIVE_MAX_FILES} bestanden per archief")
+            if sum(info.file_size for info in members) > IMPORT_ARCHIVE_MAX_BYTES:
+                raise HTTPException(status_code=400, detail=f"{file_name}: archief is te groot")
+            # file_size comes from the archive itself, so the limit is enforced again on the bytes read
+            total_bytes = 0
+            for info in members:
+                chunks = []
+                with archive.open(info) as member:
+                    for chunk in iter(lambda: member.read(IMPORT_ARCHIVE_READ_CHUNK), b''):
+                        total_bytes += len(chunk)
+                        if total_bytes > IMPORT_ARCHIVE_MAX_BYTES:
+                            raise HTTPException(status_code=400, detail=f"{file_name}: archief is te groot")
+                        chunks.append(chunk)
+                expanded.append((f"{file_name}/{info.filename}", b''.join(chunks)))
+    return expanded
+
+def detect_import_type(file_name: str, content: bytes) -> Optional[str]:
+    """Detect the import type of a file by running the existing validators on a sample of its rows"""
+    lower_name = file_name.lower()
+    if lower_name.endswith('.xml'):
+        return 'bank_camt053'
+    if lower_name.endswith(('.tab', '.txt')):
+        return 'bank_abnamro'
+    if not lower_name.endswith('.csv'):
+        return None
+    
+    rows = parse_csv_file(decode_file_content(content))
+    if not rows:
+        return None
+    sample = rows[:IMPORT_DETECTION_SAMPLE_ROWS]
+    
+    best_type = None
+    best_score = (0, 0.0)
+    for import_type in CSV_DETECTION_ORDER:
+        if import_type in BANK_STATEMENT_PARSERS:
+            items = _take(BANK_STATEMENT_PARSERS[import_type](io.BytesIO(content)), IMPORT_DETECTION_SAMPLE_ROWS)
+            valid = sum(1 for item in items if item.import_status == 'valid')
+            # Scored like the EPD types: the share of the parser's columns the header actually has
+            header = set(rows[0].keys())
+            columns_by_field = BANK_STATEMENT_COLUMNS[import_type]
+            coverage = sum(1 for columns in columns_by_field.values() if header.intersection(columns)) / len(columns_by_field)
+        else:
+            valid = sum(
+                1 for i, row in enumerate(sample, 1)
+                if validate_import_row(import_type, row, i).import_status == 'valid'
+            )
+            # Coverage separates layouts the validators accept equally (e.g. verzekeraar vs debiteur)
+            coverage = len(discover_column_mapping(import_type, rows)) / len(IMPORT_COLUMN_CANDIDATES[import_type])
+        if valid and (valid, coverage) > best_score:
+            best_type = import_type
+            best_score = (valid, coverage)
+    return best_type
+
+async def import_single_file(file_name: str, content: bytes, import_type: Optional[str]) -> tuple:
+    """Import one file of a batch; failures are reported per file instead of aborting the batch"""
+    timer = ImportTimer('execute_batch_file', file_name=file_name)
+    try:
+        if not import_type:
+            with timer.stage('detect'):
+                import_type = await run_import_task(detect_import_type, file_name, content)
+            if not import_type:
+                raise HTTPException(status_code=400, detail="Bestandstype niet herkend")
+        
+        timer.context['import_type'] = import_type
+        check_import_file_extension(file_name, import_type)
+        if import_type in BANK_STATEMENT_PARSERS:
+            result = await import_bank_statement(io.BytesIO(content), import_type, timer)
+        else:
+            result = await import_csv_content(content, import_type, timer)
+        
+        return result, ImportFileResult(
+            file_name=file_name,
+            import_type=import_type,
+            success=result.success,
+            imported_count=result.imported_count,
+            error_count=result.error_count,
+            errors=result.errors,
+            timings=result.timings
+        )
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        return None, ImportFileResult(
+            file_name=file_name,
+            import_type=import_type,
+            success=False,
+            imported_count=0,
+            error_count=1,
+            errors=[detail],
+            timings=timer.finish(failed=True)
+        )
+
+@api_router.post("/import/execute-batch", response_model=ImportResult)
+async def execute_batch_import(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    import_type: Optional[str] = Form(None)
+):
+    """Import several CSV/XML files or zip archives at once; the type of each file is detected unless import_type is given"""
+    try:
+        timer = ImportTimer('execute_batch')
+        with timer.stage('read') as stage:
+            uploaded = [(file.filename, await file.read()) for file in files]
+            stage['rows'] = len(uploaded)
+        with timer.stage('expand_archives') as stage:
+            expanded = await run_import_task(expand_import_archives, uploaded)
+            stage['rows'] = len(expanded)
+        if not expanded:
+            raise HTTPException(status_code=400, detail="Geen bestanden ontvangen")
+        
+        semaphore = asyncio.Semaphore(IMPORT_BATCH_CONCURRENCY)
+        
+        async def import_with_limit(file_name: str, content: bytes):
+            async with semaphore:
+                return await import_single_file(file_name, content, import_type)
+        
+        with timer.stage('import_files') as stage:
+            outcomes = await asyncio.gather(*[import_with_limit(name, content) for name, content in expanded])
+            stage['rows'] = len(outcomes)
+        
+        created_transactions = []
+        errors = []
+        for result, file_result in outcomes:
+            if result:
+                created_transactions.extend(result.created_transactions)
+            errors.extend(f"{file_result.file_name}: {error}" for error in file_result.errors)
+        file_results = [file_result for _, file_result in outcomes]
+        background_tasks.add_task(classify_after_import, created_transactions)
+        background_tasks.add_task(refresh_candidates_after_import, created_transactions)
         
         return ImportResult(
-            success=True,
-            imported_count=imported_count,
-            error_count=error_count,
-            errors=errors[:10],  # Limit to first 10 errors
-            created_transactions=created_transactions
+            success=all(file_result.success for file_result in file_results),
+            imported_count=sum(file_result.imported_count for file_result in file_results),
+            error_count=sum(file_result.error_count for file_result in file_results),
+            errors=errors[:50],
+            created_transactions=created_transactions,
+            file_results=file_results,
+            timings=timer.finish(file_count=len(file_results))
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Import fout: {str(e)}")
 
+# Column Mapping Profile Endpoints
+@api_router.get("/import/column-profiles", response_model=List[ColumnMappingProfile])
+async def get_column_mapping_profiles(import_type: Optional[str] = None):
+    """Get stored column mapping profiles"""
+    try:
+        query = {"import_type": import_type} if import_type else {}
+        profiles = await db.column_mapping_profiles.find(query).sort([("updated_at", -1)]).to_list(1000)
+        return [ColumnMappingProfile(**parse_from_mongo(profile)) for profile in profiles]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching column profiles: {str(e)}")
+
+@api_router.put("/import/column-profiles/{profile_id}", response_model=ColumnMappingProfile)
+async def update_column_mapping_profile(profile_id: str, update_data: ColumnMappingProfileUpdate):
+    """Override the column mapping of a profile; later uploads with this layout use it as-is"""
+    try:
+        profile = await db.column_mapping_profiles.find_one({"id": profile_id})
+        if not profile:
+            raise HTTPException(status_code=404, detail="Kolomprofiel niet gevonden")
+        
+        known_fields = IMPORT_COLUMN_CANDIDATES.get(profile['import_type'], {})
+        unknown_fields = [field for field in update_data.column_mapping if field not in known_fields]
+        if unknown_fields:
+            raise HTTPException(status_code=400, detail=f"Onbekende velden: {', '.join(unknown_fields)}")
+        
+        unknown_columns = [column for column in update_data.column_mapping.values() if column not in profile['columns']]
+        if unknown_columns:
+            raise HTTPException(status_code=400, detail=f"Kolommen niet in bestand: {', '.join(unknown_columns)}")
+        
+        await db.column_mapping_profiles.update_one(
+            {"id": profile_id},
+            {"$set": {
+                "column_mapping": update_data.column_mapping,
+                "source": "user",
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+        
+        updated_profile = await db.column_mapping_profiles.find_one({"id": profile_id})
+        return ColumnMappingProfile(**parse_from_mongo(updated_profile))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating column profile: {str(e)}")
+
+@api_router.delete("/import/column-profiles/{profile_id}")
+async def delete_column_mapping_profile(profile_id: str):
+    """Delete a profile so the next upload with this layout runs column discovery again"""
+    try:
+        result = await db.column_mapping_profiles.delete_one({"id": profile_id})
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Kolomprofiel niet gevonden")
+        return {"message": "Kolomprofiel verwijderd"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting column profile: {str(e)}")
+
+# Bank Reconciliation Matching
+RECONCILIATION_WINDOW_DAYS = 7  # Bank and cashflow dates may differ at most this many days
+NON_EXACT_MATCH_MAX_SCORE = 94.0  # Below the default auto-apply threshold of 95
+
+def amount_to_cents(amount) -> int:
+    """Amount in whole cents, so amounts can be compared and used as dict keys exactly"""
+    return int(round(float(amount or 0) * 100))
+
+def parse_iso_day(value) -> Optional[date]:
+    """Date from a stored ISO date/datetime string (or date object)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value:
+        try:
+            return date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return None
+    return None
+
+def same_sign(amount_a: float, amount_b: float) -> bool:
+    """Incoming only matches incoming, outgoing only matches outgoing"""
+    return (amount_a >= 0) == (amount_b >= 0)
+
+def transaction_open_amount(transaction: Dict[str, Any]) -> float:
+    """What is still to be paid on a transaction; rows stored before open_amount existed are fully open or closed"""
+    if transaction.get('open_amount') is not None:
+        return transaction['open_amount']
+    return 0.0 if transaction.get('reconciled') else transaction.get('amount', 0.0)
+
+def open_balance_filter(amounts) -> Dict[str, Any]:
+    """open_amount condition for transactions that can still take payments of these signs (served by the (reconciled, open_amount, date) index)"""
+    incoming = any(amount >= 0 for amount in amounts)
+    outgoing = any(amount < 0 for amount in amounts)
+    if incoming and not outgoing:
+        return {"$gt": 0}
+    if outgoing and not incoming:
+        return {"$lt": 0}
+    return {"$ne": 0}
+
+def amount_change(transaction: Dict[str, Any], new_amount: float) -> Dict[str, Any]:
+    """Update for a corrected transaction amount; the open balance of an unreconciled transaction
+    moves by the same difference, a reconciled one stays closed"""
+    if transaction.get('reconciled'):
+        return {"$set": {"amount": new_amount}}
+    return {"$set": {"amount": new_amount}, "$inc": {"open_amount": round(new_amount - transaction['amount'], 2)}}
+
+class TransactionAmountIndex:
+    """Open cashflow transactions bucketed by open amount in cents, each bucket sorted by date"""
+    
+    def __init__(self, transactions: List[Dict[str, Any]]):
+        buckets = {}
+        for transaction in transactions:
+            day = parse_iso_day(transaction.get('date'))
+            if day is None:
+                continue
+            buckets.setdefault(amount_to_cents(transaction_open_amount(transaction)), []).append((day.toordinal(), transaction))
+        
+        self.buckets = {}
+        for cents, entries in buckets.items():
+            entries.sort(key=lambda entry: entry[0])
+            self.buckets[cents] = ([entry[0] for entry in entries], [entry[1] for entry in entries])
+        self.amounts = sorted(self.buckets)
+    
+    def exact(self, cents: int, day: date, window: int = RECONCILIATION_WINDOW_DAYS) -> List[Dict[str, Any]]:
+        """Transactions with exactly this amount dated within the window around day"""
+        bucket = self.buckets.get(cents)
+        if not bucket:
+            return []
+        ordinals, transactions = bucket
+        start = bisect_left(ordinals, day.toordinal() - window)
+        end = bisect_right(ordinals, day.toordinal() + window)
+        return transactions[start:end]
+    
+    def similar(self, cents: int, day: date, tolerance_cents: int, window: int = RECONCILIATION_WINDOW_DAYS) -> List[Dict[str, Any]]:
+        """Same-sign transactions within tolerance_cents of the amount (exact amount excluded) in the window"""
+        start = bisect_left(self.amounts, cents - tolerance_cents)
+        end = bisect_right(self.amounts, cents + tolerance_cents)
+        matches = []
+        for other in self.amounts[start:end]:
+            if other != cents and same_sign(other, cents):
+                matches.extend(self.exact(other, day, window))
+        return matches
+
+def name_tokens(*values: Optional[str]) -> set:
+    """Lowercased words of three or more characters, for cheap name overlap checks"""
+    return {word for value in values if value for word in re.findall(r"[a-z0-9]{3,}", value.lower())}
+
+def pays_in_full(bank: Dict[str, Any], transaction: Dict[str, Any]) -> bool:
+    """Whether the bank amount equals the open amount of the transaction, in cents"""
+    return amount_to_cents(bank.get('amount')) == amount_to_cents(transaction_open_amount(transaction))
+
+def score_transaction_match(bank: Dict[str, Any], transaction: Dict[str, Any]) -> tuple:
+    """Score a bank/cashflow pair: 95 for an exact amount, 75 for a similar one (99/90 when the
+    description names the invoice number), plus up to 3 for date proximity and up to 2 for name
+    overlap so that equal-amount candidates can be told apart. Capped at 100, and at
+    NON_EXACT_MATCH_MAX_SCORE when the amounts differ, so only exact amounts reach auto-apply."""
+    exact = pays_in_full(bank, transaction)
+    if transaction.get('invoice_number') and transaction['invoice_number'] in bank_invoice_numbers(bank):
+        score = 99.0 if exact else 90.0
+        reasons = ["Factuurnummer in omschrijving" if exact else "Factuurnummer in omschrijving, ander bedrag"]
+    else:
+        score = 95.0 if exact else 75.0
+        reasons = ["Exacte bedrag en datum match" if exact else "Zeer vergelijkbaar bedrag"]
+    
+    bank_day = parse_iso_day(bank.get('date'))
+    transaction_day = parse_iso_day(transaction.get('date'))
+    if bank_day and transaction_day:
+        days_apart = abs((bank_day - transaction_day).days)
+        score += 3.0 * max(RECONCILIATION_WINDOW_DAYS - days_apart, 0) / RECONCILIATION_WINDOW_DAYS
+    
+    transaction_words = name_tokens(transaction.get('patient_name'))
+    if transaction_words:
+        overlap = len(transaction_words & name_tokens(bank.get('counterparty'), bank.get('description')))
+        if overlap:
+            score += 2.0 * overlap / len(transaction_words)
+            reasons.append("Naam match")
+    
+    return round(min(score, 100.0 if exact else NON_EXACT_MATCH_MAX_SCORE), 2), ", ".join(reasons)
+
+def index_by_invoice_number(transactions) -> Dict[str, List[Dict[str, Any]]]:
+    by_invoice = {}
+    for transaction in transactions:
+        if transaction.get('invoice_number'):
+            by_invoice.setdefault(transaction['invoice_number'], []).append(transaction)
+    return by_invoice
+
+def invoice_candidates(bank: Dict[str, Any], by_invoice: Dict[str, List[Dict[str, Any]]], exact_only: bool = False) -> List[Dict[str, Any]]:
+    """Open transactions whose invoice number appears in the bank description (same sign, any date)"""
+    bank_amount = bank.get('amount', 0.0)
+    return [
+        transaction
+        for invoice_number in bank_invoice_numbers(bank)
+        for transaction in by_invoice.get(invoice_number, ())
+        if same_sign(transaction.get('amount', 0.0), bank_amount)
+        and (not exact_only or amount_to_cents(transaction_open_amount(transaction)) == amount_to_cents(bank_amount))
+    ]
+
+def transaction_candidate_edges(bank_transactions: List[Dict[str, Any]], index: TransactionAmountIndex, include_similar: bool = False,
+                                by_invoice: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                                registry: Optional[Dict[str, Dict[str, Any]]] = None) -> List[tuple]:
+    """(bank, transaction, score, reason) for every candidate pair, using the suggestion rules:
+    invoice numbers named in the description first, then exact amounts within the date window,
+    or similar amounts only when there is no exact one. When the registry knows the verzekeraar
+    behind the bank row's IBAN, candidates of other verzekeraars are dropped."""
+    edges = []
+    for bank in bank_transactions:
+        candidates = invoice_candidates(bank, by_invoice or {}, exact_only=not include_similar)
+        day = parse_iso_day(bank.get('date'))
+        if day is not None:
+            bank_amount = bank.get('amount', 0.0)
+            cents = amount_to_cents(bank_amount)
+            by_amount = index.exact(cents, day)
+            if not by_amount and include_similar:
+                tolerance_cents = amount_to_cents(min(abs(bank_amount) * 0.01, 1.0))
+                by_amount = index.similar(cents, day, tolerance_cents)
+            candidates = candidates + by_amount
+        counterparty = known_counterparty(registry or {}, bank)
+        known = [transaction for transaction in candidates if fits_counterparty(transaction, counterparty)]
+        seen_ids = set()
+        for transaction in known or candidates:
+            if transaction['id'] not in seen_ids:
+                seen_ids.add(transaction['id'])
+                score, reason = score_transaction_match(bank, transaction)
+                edges.append((bank, transaction, score, f"{reason}, IBAN bekend ({counterparty['name']})" if known else reason))
+    return edges
+
+ASSIGNMENT_MAX_COMPONENT = int(os.environ.get('ASSIGNMENT_MAX_COMPONENT', '300'))  # Larger components fall back to greedy
+
+def max_weight_assignment(weights: Dict[tuple, float], rows: int, cols: int) -> List[tuple]:
+    """Hungarian algorithm on a rows x cols matrix; (row, col) pairs without a weight are never returned"""
+    if rows > cols:
+        transposed = {(col, row): weight for (row, col), weight in weights.items()}
+        return [(row, col) for col, row in max_weight_assignment(transposed, cols, rows)]
+    
+    infinity = float('inf')
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (cols + 1)
+    owner = [0] * (cols + 1)
+    way = [0] * (cols + 1)
+    for row in range(1, rows + 1):
+        owner[0] = row
+        col0 = 0
+        min_values = [infinity] * (cols + 1)
+        used = [False] * (cols + 1)
+        while True:
+            used[col0] = True
+            row0 = owner[col0]
+            delta = infinity
+            col1 = 0
+            for col in range(1, cols + 1):
+                if not used[col]:
+                    cost = -weights.get((row0 - 1, col - 1), 0.0) - u[row0] - v[col]
+                    if cost < min_values[col]:
+                        min_values[col] = cost
+                        way[col] = col0
+                    if min_values[col] < delta:
+                        delta = min_values[col]
+                        col1 = col
+            for col in range(cols + 1):
+                if used[col]:
+                    u[owner[col]] += delta
+                    v[col] -= delta
+                else:
+                    min_values[col] -= delta
+            col0 = col1
+            if owner[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            owner[col0] = owner[col1]
+            col0 = col1
+    
+    return [(owner[col] - 1, col - 1) for col in range(1, cols + 1)
+            if owner[col] and (owner[col] - 1, col - 1) in weights]
+
+def solve_reconciliation_assignment(edges: List[tuple]) -> List[tuple]:
+    """One-to-one selection of candidate edges with the highest total score.
+    
+    The candidate graph is split into connected components first, so the work follows the
+    number of candidate edges instead of bank rows x transactions.
+    """
+    parent = {}
+    
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    
+    for bank, transaction, _, _ in edges:
+        parent[find(('bank', bank['id']))] = find(('transaction', transaction['id']))
+    
+    components = {}
+    for edge in edges:
+        components.setdefault(find(('bank', edge[0]['id'])), []).append(edge)
+    
+    chosen = []
+    for component in components.values():
+        bank_ids = list(dict.fromkeys(edge[0]['id'] for edge in component))
+        transaction_ids = list(dict.fromkeys(edge[1]['id'] for edge in component))
+        if len(component) == 1:
+            chosen.extend(component)
+        elif max(len(bank_ids), len(transaction_ids)) > ASSIGNMENT_MAX_COMPONENT:
+            taken = set()
+            for edge in sorted(component, key=lambda edge: edge[2], reverse=True):
+                if edge[0]['id'] not in taken and edge[1]['id'] not in taken:
+                    taken.update((edge[0]['id'], edge[1]['id']))
+                    chosen.append(edge)
+        else:
+            bank_positions = {bank_id: position for position, bank_id in enumerate(bank_ids)}
+            transaction_positions = {transaction_id: position for position, transaction_id in enumerate(transaction_ids)}
+            by_position = {}
+            for edge in component:
+                key = (bank_positions[edge[0]['id']], transaction_positions[edge[1]['id']])
+                if key not in by_position or edge[2] > by_position[key][2]:
+                    by_position[key] = edge
+            weights = {key: edge[2] for key, edge in by_position.items()}
+            chosen.extend(by_position[key] for key in max_weight_assignment(weights, len(bank_ids), len(transaction_ids)))
+    return chosen
+
+# Shared caches
+# Match indexes and the counterparty registry are cached per worker process. Writers bump a version
+# stamp in Mongo, and every worker compares it before reusing its cache, so a write in one worker
+# invalidates the caches of all of them.
+async def cache_version(name: str) -> Optional[str]:
+    """Current version stamp of a shared cache, None until it is first bumped"""
+    stamp = await db.cache_versions.find_one({"_id": name})
+    return stamp['version'] if stamp else None
+
+async def bump_cache_version(name: str):
+    await db.cache_versions.update_one({"_id": name}, {"$set": {"version": str(uuid.uuid4())}}, upsert=True)
+
+# Crediteur matching
+CREDITEUR_INDEX_TTL = float(os.environ.get('CREDITEUR_INDEX_TTL', '300'))  # Seconds; writes invalidate it sooner
+
+def normalize_iban(value: Optional[str]) -> str:
+    return re.sub(r"\s", "", value or "").upper()
+
+class CrediteurMatchIndex:
+    """Lookup tables over the active crediteuren so a bank row is matched with a few dict probes.
+    
+    Candidates come from an inverted index on name words, whole-euro amount buckets and the IBAN;
+    only those candidates are scored, with the same rules as the original per-crediteur scan.
+    """
+    
+    def __init__(self, crediteuren: List[Dict[str, Any]]):
+        self.crediteuren = {crediteur['id']: crediteur for crediteur in crediteuren}
+        self.words = {}
+        self.amount_buckets = {}
+        self.ibans = {}
+        for crediteur_id, crediteur in self.crediteuren.items():
+            for word in re.findall(r"[a-z0-9]+", crediteur.get('crediteur', '').lower()):
+                self.words.setdefault(word, set()).add(crediteur_id)
+            self.amount_buckets.setdefault(int(crediteur.get('bedrag', 0)), set()).add(crediteur_id)
+            iban = normalize_iban(crediteur.get('iban'))
+            if iban:
+                self.ibans.setdefault(iban, set()).add(crediteur_id)
+    
+    def candidates(self, bank_abs_amount: float, text: str, account_number: Optional[str]) -> set:
+        candidate_ids = set()
+        for word in set(re.findall(r"[a-z0-9]+", text)):
+            candidate_ids |= self.words.get(word, set())
+        # The amount tolerance is at most €2, so neighbouring euro buckets cover it
+        bucket = int(bank_abs_amount)
+        for offset in range(-2, 3):
+            candidate_ids |= self.amount_buckets.get(bucket + offset, set())
+        candidate_ids |= self.ibans.get(normalize_iban(account_number), set())
+        return candidate_ids
+    
+    def suggestions(self, bank_trans: Dict[str, Any], similar_names: Optional[Dict[str, float]] = None,
+                    known_crediteur_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Crediteur suggestions for an outgoing bank transaction (score >= 70).
+        
+        similar_names maps crediteur ids to a trigram similarity with the counterparty; those
+        crediteuren are candidates and count as a name match even without a shared word.
+        known_crediteur_id is the crediteur the counterparty registry holds for the IBAN; it
+        counts as an IBAN match.
+        """
+        similar_names = similar_names or {}
+        bank_amount = bank_trans.get('amount', 0)
+        if bank_amount >= 0:
+            return []
+        
+        bank_abs_amount = abs(bank_amount)
+        bank_description = (bank_trans.get('description') or '').lower()
+        bank_counterparty = (bank_trans.get('counterparty') or '').lower()
+        bank_iban = normalize_iban(bank_trans.get('account_number'))
+        bank_words = set(re.findall(r"[a-z0-9]+", f"{bank_description} {bank_counterparty}"))
+        counterparty_words = set(re.findall(r"[a-z0-9]+", bank_counterparty))
+        
+        suggestions = []
+        candidate_ids = self.candidates(bank_abs_amount, f"{bank_description} {bank_counterparty}", bank_iban)
+        candidate_ids |= {crediteur_id for crediteur_id in similar_names if crediteur_id in self.crediteuren}
+        if known_crediteur_id in self.crediteuren:
+            candidate_ids.add(known_crediteur_id)
+        for crediteur_id in candidate_ids:
+            crediteur = self.crediteuren[crediteur_id]
+            crediteur_amount = crediteur.get('bedrag', 0)
+            crediteur_naam = crediteur.get('crediteur', '').lower()
+            
+            # Much stricter amount matching - must be very close (within €2 or 2%)
+            amount_tolerance = min(crediteur_amount * 0.02, 2.0)
+            amount_diff = abs(bank_abs_amount - crediteur_amount)
+            amount_match = amount_diff <= amount_tolerance
+            
+            # Names match on whole words: 'Huur' is not found in 'huurtoeslag'
+            crediteur_words = set(re.findall(r"[a-z0-9]+", crediteur_naam))
+            iban_match = bool(bank_iban) and normalize_iban(crediteur.get('iban')) == bank_iban or crediteur_id == known_crediteur_id
+            name_match = iban_match or bool(crediteur_words) and (
+                crediteur_words <= bank_words or
+                bool(counterparty_words) and counterparty_words <= crediteur_words or
+                any(word in bank_words for word in crediteur_words if len(word) > 3)
+            )
+            if not name_match and crediteur_id in similar_names:
+                name_match = True
+                name_reason = f"Naam lijkt op ({similar_names[crediteur_id]:.0%})"
+            else:
+                name_reason = "IBAN match" if iban_match else "Naam match"
+            
+            score = 0
+            reasons = []
+            if amount_match and name_match:
+                score = 95
+                reasons = ["Exacte bedrag match", name_reason]
+            elif amount_match:
+                score = 85
+                reasons = ["Exacte bedrag match"]
+            elif name_match and amount_diff <= crediteur_amount * 0.1:  # Name match with reasonable amount
+                score = 70
+                reasons = [name_reason, f"Redelijk bedrag (verschil: €{amount_diff:.2f})"]
+            
+            if score >= 70:
+                suggestions.append({
+                    "id": crediteur['id'],
+                    "type": "expense",
+                    "category": "crediteur",
+                    "amount": crediteur_amount,
+                    "description": f"Maandelijkse betaling {crediteur_naam}",
+                    "patient_name": crediteur_naam,
+                    "invoice_number": f"Crediteur-{crediteur['dag']}e",
+                    "match_type": "crediteur",
+                    "match_score": score,
+                    "match_reason": ", ".join(reasons),
+                    "crediteur_dag": crediteur.get('dag', 1)
+                })
+        return suggestions
+
+_crediteur_match_index: Optional[CrediteurMatchIndex] = None
+_crediteur_match_index_built_at = 0.0
+_crediteur_match_index_version: Optional[str] = None
+
+async def get_crediteur_match_index() -> CrediteurMatchIndex:
+    """Cached CrediteurMatchIndex, rebuilt after a crediteur write in any worker or when older than the TTL"""
+    global _crediteur_match_index, _crediteur_match_index_built_at, _crediteur_match_index_version
+    version = await cache_version("match_indexes")
+    if (_crediteur_match_index is None or version != _crediteur_match_index_version
+            or time.monotonic() - _crediteur_match_index_built_at > CREDITEUR_INDEX_TTL):
+        crediteuren = await db.crediteuren.find({"actief": True}, {"_id": 0}).to_list(None)
+        _crediteur_match_index = CrediteurMatchIndex(crediteuren)
+        _crediteur_match_index_built_at = time.monotonic()
+        _crediteur_match_index_version = version
+    return _crediteur_match_index
+
+# Name similarity
+NAME_INDEX_TTL = float(os.environ.get('NAME_INDEX_TTL', '300'))  # Seconds; writes invalidate it sooner
+NAME_STOP_WORDS = {'van', 'de', 'der', 'den', 'het', 'een', 'en', 'te', 'voor', 'naar', 'bij', 'bv', 'nv', 'vof'}
+
+def name_trigrams(name: Optional[str]) -> set:
+    """Character trigrams of each word, padded like '  word ' so word starts weigh more"""
+    grams = set()
+    for word in re.findall(r"[a-z0-9]+", (name or '').lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def name_acronyms(name: Optional[str]) -> set:
+    """'Zilveren Kruis Achmea' -> {'zka', 'zk'}: initials of all words and of the first two"""
+    words = [word for word in re.findall(r"[a-z0-9]+", (name or '').lower()) if word not in NAME_STOP_WORDS]
+    if len(words) < 2:
+        return set()
+    return {''.join(word[0] for word in words), words[0][0] + words[1][0]}
+
+def trigram_similarity(name_a: Optional[str], name_b: Optional[str]) -> float:
+    """Dice coefficient of the trigram sets (0-1)"""
+    grams_a = name_trigrams(name_a)
+    grams_b = name_trigrams(name_b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+class TrigramIndex:
+    """Inverted trigram index over patient, crediteur and verzekeraar names.
+    
+    A lookup only touches the postings of the query's trigrams, so its cost follows the number of
+    names that share trigrams with the query rather than the number of names indexed. Acronyms are
+    indexed as aliases so that 'ZK' finds 'Zilveren Kruis Achmea'.
+    """
+    ACRONYM_SCORE = 0.8
+    
+    def __init__(self):
+        self.entries = []  # (name, kind, ref, trigram count)
+        self.postings = {}
+        self.acronyms = {}
+    
+    def add(self, name: Optional[str], kind: str, ref: Optional[str] = None):
+        grams = name_trigrams(name)
+        if not grams:
+            return
+        entry = len(self.entries)
+        self.entries.append((name, kind, ref, len(grams)))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(entry)
+        for acronym in name_acronyms(name):
+            self.acronyms.setdefault(acronym, []).append(entry)
+    
+    def search(self, query: Optional[str], k: int = 5, min_score: float = 0.3, kinds: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Top-k names most similar to the query: [{name, kind, ref, score}]"""
+        query_grams = name_trigrams(query)
+        if not query_grams:
+            return []
+        
+        shared = {}
+        for gram in query_grams:
+            for entry in self.postings.get(gram, ()):
+                shared[entry] = shared.get(entry, 0) + 1
+        scores = {entry: 2 * count / (len(query_grams) + self.entries[entry][3]) for entry, count in shared.items()}
+        
+        for word in re.findall(r"[a-z0-9]+", query.lower()):
+            for entry in self.acronyms.get(word, ()):
+                scores[entry] = max(scores.get(entry, 0.0), self.ACRONYM_SCORE)
+        
+        ranked = sorted(
+            (entry for entry, score in scores.items()
+             if score >= min_score and (kinds is None or self.entries[entry][1] in kinds)),
+            key=lambda entry: scores[entry], reverse=True
+        )[:k]
+        return [
+            {"name": self.entries[entry][0], "kind": self.entries[entry][1], "ref": self.entries[entry][2], "score": round(scores[entry], 3)}
+            for entry in ranked
+        ]
+
+def with_name_similarity(suggestion: Dict[str, Any], similar_patients: Dict[str, float]) -> Dict[str, Any]:
+    """Raise a transaction suggestion by up to 4 points when its name resembles the counterparty"""
+    similarity = similar_patients.get(suggestion.get('patient_name'))
+    if similarity:
+        suggestion["match_score"] = round(suggestion["match_score"] + 4 * similarity, 1)
+        suggestion["match_reason"] += f", Naam lijkt op ({similarity:.0%})"
+    return suggestion
+
+_name_index: Optional[TrigramIndex] = None
+_name_index_built_at = 0.0
+_name_index_version: Optional[str] = None
+
+async def get_name_index() -> TrigramIndex:
+    """Cached TrigramIndex over distinct patient names, active crediteuren and verzekeraars"""
+    global _name_index, _name_index_built_at, _name_index_version
+    version = await cache_version("match_indexes")
+    if _name_index is None or version != _name_index_version or time.monotonic() - _name_index_built_at > NAME_INDEX_TTL:
+        index = TrigramIndex()
+        for patient_name in await db.transactions.distinct("patient_name"):
+            index.add(patient_name, 'patient', patient_name)
+        async for crediteur in db.crediteuren.find({"actief": True}, {"_id": 0, "id": 1, "crediteur": 1}):
+            index.add(crediteur.get('crediteur'), 'crediteur', crediteur['id'])
+        async for verzekeraar in db.verzekeraars.find({"actief": True}, {"_id": 0, "id": 1, "naam": 1}):
+            index.add(verzekeraar.get('naam'), 'verzekeraar', verzekeraar['id'])
+        _name_index = index
+        _name_index_built_at = time.monotonic()
+        _name_index_version = version
+    return _name_index
+
+async def invalidate_match_indexes():
+    """Drop the cached crediteur and name indexes in every worker; the next lookup rebuilds them"""
+    global _crediteur_match_index, _name_index
+    _crediteur_match_index = None
+    _name_index = None
+    await bump_cache_version("match_indexes")
+
+# Counterparty registry
+# IBAN -> the crediteur or verzekeraar behind it, learned from confirmed reconciliations.
+# Matching consults a cached dict, so recognising a known counterparty is one lookup.
+COUNTERPARTY_REGISTRY_TTL = float(os.environ.get('COUNTERPARTY_REGISTRY_TTL', '300'))  # Seconds; learning invalidates it sooner
+LEARNED_RECONCILIATION_STATUSES = ['matched', 'matched_split', 'matched_crediteur', 'matched_specification', 'partial_payment']
+
+_counterparty_registry: Optional[Dict[str, Dict[str, Any]]] = None
+_counterparty_registry_built_at = 0.0
+_counterparty_registry_version: Optional[str] = None
+
+async def get_counterparty_registry() -> Dict[str, Dict[str, Any]]:
+    """Cached {iban: counterparty} over the registry, rebuilt after learning in any worker"""
+    global _counterparty_registry, _counterparty_registry_built_at, _counterparty_registry_version
+    version = await cache_version("counterparty_registry")
+    if (_counterparty_registry is None or version != _counterparty_registry_version
+            or time.monotonic() - _counterparty_registry_built_at > COUNTERPARTY_REGISTRY_TTL):
+        _counterparty_registry = {
+            counterparty['iban']: counterparty async for counterparty in db.counterparties.find({}, {"_id": 0})
+        }
+        _counterparty_registry_built_at = time.monotonic()
+        _counterparty_registry_version = version
+    return _counterparty_registry
+
+def known_counterparty(registry: Dict[str, Dict[str, Any]], bank_trans: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    iban = normalize_iban(bank_trans.get('account_number'))
+    return registry.get(iban) if iban else None
+
+def fits_counterparty(transaction: Dict[str, Any], counterparty: Optional[Dict[str, Any]]) -> bool:
+    """Whether a declaratie belongs to the verzekeraar a bank row's IBAN is known for"""
+    return (
+        counterparty is not None and counterparty['kind'] == 'verzekeraar'
+        and bool(insurer_tokens(transaction.get('patient_name')) & insurer_tokens(counterparty['name']))
+    )
+
+def with_counterparty(suggestion: Dict[str, Any], counterparty: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Raise a transaction suggestion by 3 points when it belongs to the known verzekeraar of the IBAN"""
+    if fits_counterparty(suggestion, counterparty):
+        suggestion["match_score"] = round(suggestion["match_score"] + 3, 1)
+        suggestion["match_reason"] += f", IBAN bekend ({counterparty['name']})"
+    return suggestion
+
+class CounterpartyResolver:
+    """Finds the crediteur or verzekeraar a reconciled transaction was paid by or to"""
+    
+    def __init__(self, crediteuren: List[Dict[str, Any]], verzekeraars: List[Dict[str, Any]]):
+        # Crediteur expenses carry invoice number CRED-<first 8 characters of the crediteur id>
+        self.crediteuren_by_prefix = {crediteur['id'][:8]: crediteur for crediteur in crediteuren}
+        self.crediteuren_by_name = {normalize_name(crediteur.get('crediteur', '')): crediteur for crediteur in crediteuren}
+        self.verzekeraars = [(insurer_tokens(verzekeraar.get('naam')), verzekeraar) for verzekeraar in verzekeraars]
+    
+    def resolve(self, bank_trans: Dict[str, Any], transaction: Dict[str, Any]) -> Optional[tuple]:
+        """(kind, id, name), or None when the counterparty is not (unambiguously) known"""
+        if transaction.get('category') == 'crediteur':
+            invoice_number = transaction.get('invoice_number') or ''
+            crediteur = (
+                self.crediteuren_by_prefix.get(invoice_number[5:]) if invoice_number.startswith('CRED-') else None
+            ) or self.crediteuren_by_name.get(normalize_name(transaction.get('patient_name') or ''))
+            return ('crediteur', crediteur['id'], crediteur['crediteur']) if crediteur else None
+        if transaction.get('category') == 'zorgverzekeraar':
+            for name in (transaction.get('patient_name'), bank_trans.get('counterparty')):
+                words = insurer_tokens(name)
+                found = [verzekeraar for tokens, verzekeraar in self.verzekeraars if tokens and tokens & words]
+                if len(found) == 1:
+                    return ('verzekeraar', found[0]['id'], found[0]['naam'])
+        return None
+
+def learned_target_key(target: tuple) -> str:
+    """Field-name-safe key for a learned target (category names may contain dots)"""
+    return hashlib.sha1('\x1f'.join(str(part) for part in target).encode('utf-8')).hexdigest()[:16]
+
+async def record_learned_targets(collection, observations: List[tuple], target_fields: tuple, count_field: str,
+                                 full: bool, set_fields: Optional[Dict[str, Any]] = None,
+                                 insert_fields: Optional[Callable[[], Dict[str, Any]]] = None):
+    """Count observed targets per document and point each document at its most frequent target.
+    
+    observations holds (filter, {target tuple: count}) pairs. The counts live in the document
+    under targets.<key>; a full run replaces them, otherwise they are $inc'ed, after which the
+    winner is derived from the stored counts. A tie keeps the current target. insert_fields
+    builds the extra fields of a new document.
+    """
+    now_fields = set_fields or {}
+    updates = []
+    for query, counts in observations:
+        entries = {learned_target_key(target): {**dict(zip(target_fields, target)), "count": count} for target, count in counts.items()}
+        winner, winner_count = max(counts.items(), key=lambda item: item[1])
+        if full:
+            update = {"$set": {**now_fields, **dict(zip(target_fields, winner)), count_field: winner_count, "targets": entries}}
+        else:
+            update = {
+                "$set": {**now_fields, **{f"targets.{key}.{field}": entry[field] for key, entry in entries.items() for field in target_fields}},
+                "$inc": {f"targets.{key}.count": entry['count'] for key, entry in entries.items()},
+                "$setOnInsert": {**dict(zip(target_fields, winner)), count_field: winner_count}
+            }
+        if insert_fields:
+            update.setdefault("$setOnInsert", {}).update(insert_fields())
+        updates.append(UpdateOne(query, update, upsert=True))
+    await collection.bulk_write(updates, ordered=False)
+    if full:
+        return
+    
+    corrections = []
+    async for document in collection.find({"$or": [query for query, _ in observations]}):
+        current = tuple(document.get(field) for field in target_fields)
+        current_key = learned_target_key(current)
+        targets = dict(document.get('targets') or {})
+        fix = {}
+        if current_key not in targets:
+            # Learned before counts were kept: its count field is the only record of the current target
+            targets[current_key] = {**dict(zip(target_fields, current)), "count": document.get(count_field, 0)}
+            fix[f"targets.{current_key}"] = targets[current_key]
+        winner_key, winner = max(targets.items(), key=lambda item: (item[1]['count'], item[0] == current_key))
+        if winner_key != current_key or document.get(count_field) != winner['count']:
+            fix.update({field: winner[field] for field in target_fields})
+            fix[count_field] = winner['count']
+        if fix:
+            corrections.append(UpdateOne({"_id": document['_id']}, {"$set": fix}))
+    if corrections:
+        await collection.bulk_write(corrections, ordered=False)
+
+async def learn_counterparties(bank_transaction_ids: Optional[List[str]] = None) -> int:
+    """Record the IBANs of reconciled bank rows (default: all of them) in the registry.
+    
+    Per IBAN the counterparty seen most often wins, counted over all confirmations so far. A full
+    run recounts from scratch; after a match the new bank rows are added to the stored counts. Returns the number of IBANs written; failures are
+    logged, since a match must not fail on learning.
+    """
+    try:
+        query = {"reconciliation_status": {"$in": LEARNED_RECONCILIATION_STATUSES}}
+        if bank_transaction_ids is not None:
+            if not bank_transaction_ids:
+                return 0
+            query["bank_transaction_id"] = {"$in": list(bank_transaction_ids)}
+        reconciliations = await db.reconciliations.find(
+            query, {"_id": 0, "bank_transaction_id": 1, "matched_transaction_id": 1}
+        ).to_list(None)
+        if not reconciliations:
+            return 0
+        
+        bank_by_id = {
+            bank['id']: bank async for bank in db.bank_transactions.find(
+                {"id": {"$in": list({rec['bank_transaction_id'] for rec in reconciliations})}, "account_number": {"$nin": [None, ""]}},
+                {"_id": 0, "id": 1, "account_number": 1, "counterparty": 1}
+            )
+        }
+        transaction_by_id = {
+            transaction['id']: transaction async for transaction in db.transactions.find(
+                {"id": {"$in": list({rec['matched_transaction_id'] for rec in reconciliations if rec['bank_transaction_id'] in bank_by_id})}},
+                {"_id": 0, "id": 1, "category": 1, "patient_name": 1, "invoice_number": 1}
+            )
+        }
+        resolver = CounterpartyResolver(
+            await db.crediteuren.find({}, {"_id": 0, "id": 1, "crediteur": 1}).to_list(None),
+            await db.verzekeraars.find({"actief": True}, {"_id": 0, "id": 1, "naam": 1}).to_list(None)
+        )
+        
+        # Count bank rows, not reconciliation records: a split payment is one observation
+        seen = {}
+        for rec in reconciliations:
+            bank = bank_by_id.get(rec['bank_transaction_id'])
+            transaction = transaction_by_id.get(rec['matched_transaction_id'])
+            target = resolver.resolve(bank, transaction) if bank and transaction else None
+            if target:
+                seen.setdefault(normalize_iban(bank['account_number']), {}).setdefault(target, set()).add(bank['id'])
+        if not seen:
+            return 0
+        
+        await record_learned_targets(
+            db.counterparties,
+            [({"iban": iban}, {target: len(bank_ids) for target, bank_ids in targets.items()}) for iban, targets in seen.items()],
+            ("kind", "target_id", "name"), "match_count", full=bank_transaction_ids is None,
+            set_fields={"last_matched_at": datetime.now(timezone.utc).isoformat()}
+        )
+        await invalidate_counterparty_registry()
+        
+        # Open rows from these accounts were scored without the registry entry
+        accounts = list({bank['account_number'] for bank in bank_by_id.values()})
+        open_ids = await db.bank_transactions.distinct("id", {"reconciled": False, "account_number": {"$in": accounts}})
+        if open_ids:
+            await discard_reconciliation_candidates(open_ids)
+        return len(seen)
+    except Exception as e:
+        logger.warning(f"Learning counterparties failed: {str(e)}")
+        return 0
+
+async def invalidate_counterparty_registry():
+    global _counterparty_registry
+    _counterparty_registry = None
+    await bump_cache_version("counterparty_registry")
+
+# One bank payment covering many declaraties
+SPLIT_MATCH_LOOKBACK_DAYS = int(os.environ.get('SPLIT_MATCH_LOOKBACK_DAYS', '120'))  # Declaraties dated up to this long before the payment
+SPLIT_MATCH_MAX_CANDIDATES = int(os.environ.get('SPLIT_MATCH_MAX_CANDIDATES', '80'))
+SPLIT_MATCH_MAX_STATES = int(os.environ.get('SPLIT_MATCH_MAX_STATES', '250000'))
+SPLIT_MATCH_TIME_LIMIT = float(os.environ.get('SPLIT_MATCH_TIME_LIMIT', '0.5'))  # Seconds
+INSURER_GENERIC_WORDS = {'zorgverzekeraar', 'zorgverzekeraars', 'zorgverzekering', 'zorgverzekeringen',
+                         'verzekeraar', 'verzekeringen', 'groep', 'zorg', 'nv', 'bv', 'ua', 'de', 'het'}
+
+def insurer_tokens(name: Optional[str]) -> set:
+    """Distinguishing words of an insurer name ('CZ Groep' -> {'cz'})"""
+    return {word for word in re.findall(r"[a-z0-9]+", (name or '').lower()) if word not in INSURER_GENERIC_WORDS}
+
+def find_exact_subset(amounts: List[int], target: int, max_states: int = SPLIT_MATCH_MAX_STATES,
+                      time_limit: float = SPLIT_MATCH_TIME_LIMIT) -> tuple:
+    """Indexes of amounts (in cents) that add up to exactly target.
+    
+    Dynamic program over reachable sums; each sum remembers the item that first reached it, so a
+    combination can be rebuilt by walking back. Returns (indexes or None, whether a limit was hit).
+    """
+    if target <= 0 or sum(amounts) < target:
+        return None, False
+    
+    reached = {0: None}  # sum -> (previous sum, item index)
+    deadline = time.perf_counter() + time_limit
+    for index, amount in enumerate(amounts):
+        if amount <= 0:
+            continue
+        for subtotal in list(reached):
+            new_total = subtotal + amount
+            if new_total <= target and new_total not in reached:
+                reached[new_total] = (subtotal, index)
+        if target in reached:
+            combination = []
+            total = target
+            while total:
+                total, item = reached[total]
+                combination.append(item)
+            return sorted(combination), False
+        if len(reached) > max_states or time.perf_counter() > deadline:
+            return None, True
+    return None, False
+
+def build_reconciliation_record(bank_trans: Dict[str, Any], matched_transaction_id: str, reconciliation_status: str,
+                                match_confidence: float, matched_amount: Optional[float] = None,
+                                notes: Optional[str] = None) -> Dict[str, Any]:
+    """Reconciliation document for a matched bank transaction, ready for insertion"""
+    reconciliation = BankReconciliation(
+        bank_transaction_id=bank_trans['id'],
+        bank_date=parse_iso_day(bank_trans.get('date')) or date.today(),
+        bank_amount=bank_trans.get('amount', 0.0),
+        bank_description=bank_trans.get('description', ''),
+        matched_transaction_id=matched_transaction_id,
+        reconciliation_status=reconciliation_status,
+        match_confidence=match_confidence,
+        matched_amount=matched_amount,
+        notes=notes
+    )
+    return prepare_for_mongo(reconciliation.dict())
+
+def crediteur_expense_transaction(bank_trans: Dict[str, Any], crediteur: Dict[str, Any]) -> Transaction:
+    """Expense transaction recording a bank payment to a crediteur"""
+    return Transaction(
+        type="expense",
+        category="crediteur",
+        amount=crediteur['bedrag'],
+        description=f"Maandelijkse betaling {crediteur['crediteur']}",
+        date=bank_trans['date'] if isinstance(bank_trans['date'], str) else bank_trans['date'].isoformat(),
+        patient_name=crediteur['crediteur'],
+        invoice_number=f"CRED-{crediteur['id'][:8]}",
+        notes=f"Automatisch gekoppeld aan bank transactie {bank_trans['id'][:8]}",
+        reconciled=True,
+        open_amount=0.0
+    )
+
+# Concurrency-safe reconciliation writes
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(7 * 24 * 3600)))
+
+class IdempotentRequest:
+    """Reserve an idempotency key for the duration of a request.
+    
+    The first request with a key stores its response; a retry gets that response back as
+    `replay` instead of acting again, and a concurrent duplicate is refused with 409. A failed
+    request releases the key so it can be retried.
+    """
+    
+    def __init__(self, key: Optional[str], operation: str):
+        self.key = key
+        self.operation = operation
+        self.replay = None
+        self.response = None
+    
+    async def __aenter__(self):
+        if not self.key:
+            return self
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": self.key,
+                "operation": self.operation,
+                "status": "pending",
+                "created_at": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            existing = await db.idempotency_keys.find_one({"_id": self.key})
+            if existing and existing.get('status') == 'done':
+                if existing.get('operation') != self.operation:
+                    raise HTTPException(status_code=422, detail="Idempotency key is al gebruikt voor een andere actie")
+                self.replay = existing['response']
+            else:
+                raise HTTPException(status_code=409, detail="Verzoek met deze idempotency key is nog in behandeling")
+        return self
+    
+    def complete(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        self.response = response
+        return response
+    
+    async def __aexit__(self, exc_type, exc, traceback):
+        if not self.key or self.replay is not None:
+            return False
+        if exc_type is None and self.response is not None:
+            await db.idempotency_keys.update_one(
+                {"_id": self.key}, {"$set": {"status": "done", "response": jsonable_encoder(self.response)}}
+            )
+        else:
+            await db.idempotency_keys.delete_one({"_id": self.key, "status": "pending"})
+        return False
+
+async def claim_unreconciled(collection, ids: List[str], claim_id: str, fields: Optional[Dict[str, Any]] = None) -> set:
+    """Flag the still-unreconciled documents among ids as reconciled under claim_id, setting
+    any extra fields in the same update.
+    
+    The filter on reconciled: False makes each document update atomic, so of two concurrent
+    claims only one can win a document; the ids this claim won are returned.
+    """
+    if not ids:
+        return set()
+    await collection.update_many(
+        {"id": {"$in": list(ids)}, "reconciled": False},
+        {"$set": {"reconciled": True, "reconciliation_claim": claim_id, **(fields or {})}}
+    )
+    return set(await collection.distinct("id", {"id": {"$in": list(ids)}, "reconciliation_claim": claim_id}))
+
+async def release_claim(collection, ids, claim_id: str):
+    """Undo claim_unreconciled for documents that could not be matched after all"""
+    if ids:
+        await collection.update_many(
+            {"id": {"$in": list(ids)}, "reconciliation_claim": claim_id},
+            {"$set": {"reconciled": False}, "$unset": {"reconciliation_claim": ""}}
+        )
+
+async def settle_claimed(transaction_ids, claim_id: str):
+    """Close the open balance of transactions this claim matched in full"""
+    if transaction_ids:
+        await db.transactions.update_many(
+            {"id": {"$in": list(transaction_ids)}, "reconciliation_claim": claim_id},
+            {"$set": {"open_amount": 0.0}}
+        )
+
+async def book_partial_payments(payments: List[tuple]):
+    """Lower open balances by (transaction id, amount paid) in one bulk write.
+    
+    $inc composes with concurrent instalments and corrections, so no paid total has to be
+    re-read or recomputed; transactions closed in the meantime are left alone.
+    """
+    if payments:
+        await db.transactions.bulk_write([
+            UpdateOne({"id": transaction_id, "reconciled": False}, {"$inc": {"open_amount": -round(paid, 2)}})
+            for transaction_id, paid in payments
+        ], ordered=False)
+
+async def update_transaction_fields(transaction_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """$set fields on a transaction and carry amount or reconciled changes over to its open balance.
+    Returns the document as it was before, or None when it does not exist."""
+    before = await db.transactions.find_one_and_update(
+        {"id": transaction_id}, {"$set": fields}, projection={"_id": 0, "amount": 1}
+    )
+    if before is None:
+        return None
+    if 'reconciled' in fields:
+        open_amount = 0.0 if fields['reconciled'] else fields.get('amount', before['amount'])
+        await db.transactions.update_one({"id": transaction_id}, {"$set": {"open_amount": open_amount}})
+    elif 'amount' in fields and fields['amount'] != before['amount']:
+        await db.transactions.update_one(
+            {"id": transaction_id, "reconciled": False}, {"$inc": {"open_amount": round(fields['amount'] - before['amount'], 2)}}
+        )
+    return before
+
+async def reconciliation_conflict(collection, document_id: str, label: str) -> HTTPException:
+    """409 when the document exists but is already reconciled, 404 when it does not exist"""
+    if await collection.count_documents({"id": document_id}, limit=1):
+        return HTTPException(status_code=409, detail=f"{label} is al gekoppeld")
+    return HTTPException(status_code=404, detail=f"{label} niet gevonden")
+
+async def apply_reconciliation_matches(pairs: List[tuple], match_confidence: float = 1.0) -> List[tuple]:
+    """Mark (bank transaction, cashflow transaction[, confidence]) pairs reconciled with one write per collection.
+    
+    Both sides are claimed first; pairs where either side was reconciled concurrently are
+    skipped. Returns the pairs that were applied.
+    """
+    if not pairs:
+        return []
+    
+    claim_id = str(uuid.uuid4())
+    claimed_banks = await claim_unreconciled(db.bank_transactions, [pair[0]['id'] for pair in pairs], claim_id)
+    claimed_transactions = await claim_unreconciled(db.transactions, [pair[1]['id'] for pair in pairs], claim_id)
+    applied = [pair for pair in pairs if pair[0]['id'] in claimed_banks and pair[1]['id'] in claimed_transactions]
+    
+    bank_ids = [pair[0]['id'] for pair in applied]
+    transaction_ids = [pair[1]['id'] for pair in applied]
+    await release_claim(db.bank_transactions, claimed_banks - set(bank_ids), claim_id)
+    await release_claim(db.transactions, claimed_transactions - set(transaction_ids), claim_id)
+    await settle_claimed(transaction_ids, claim_id)
+    
+    if applied:
+        await db.reconciliations.insert_many([
+            build_reconciliation_record(bank, transaction['id'], "matched", pair_confidence[0] if pair_confidence else match_confidence)
+            for bank, transaction, *pair_confidence in applied
+        ])
+        await discard_reconciliation_candidates(bank_ids, transaction_ids)
+        await learn_counterparties(bank_ids)
+    return applied
+
+# Precomputed reconciliation candidates
+SUGGESTIONS_BATCH_MAX = int(os.environ.get('SUGGESTIONS_BATCH_MAX', '200'))
+
+def score_bank_suggestions(bank_trans: Dict[str, Any], index: TransactionAmountIndex, crediteur_index: CrediteurMatchIndex,
+                           name_index: TrigramIndex, by_invoice: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                           counterparty: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Suggestions for one bank transaction from in-memory candidates, with the rules of the suggestions endpoint.
+    counterparty is the registry entry for the bank row's IBAN, if any."""
+    bank_amount = bank_trans.get('amount', 0)  # Keep original sign!
+    bank_day = parse_iso_day(bank_trans.get('date'))
+    
+    # Names resembling the counterparty, tolerant of typos and abbreviations
+    name_hits = name_index.search(bank_trans.get('counterparty') or bank_trans.get('description'), k=10)
+    similar_patients = {hit['ref']: hit['score'] for hit in name_hits if hit['kind'] == 'patient'}
+    
+    suggestions = []
+    
+    # A factuurnummer named in the description is an exact hit, whatever the date
+    for match in invoice_candidates(bank_trans, by_invoice or {}):
+        score, reason = score_transaction_match(bank_trans, match)
+        suggestions.append(with_counterparty({
+            **Transaction(**parse_from_mongo(dict(match))).dict(),
+            "match_type": "transaction",
+            "match_score": score,
+            "match_reason": reason
+        }, counterparty))
+    invoice_matched_ids = {suggestion['id'] for suggestion in suggestions}
+    
+    if bank_day and not invoice_matched_ids:
+        # Exact amount (including sign) within ±7 days first
+        cents = amount_to_cents(bank_amount)
+        for match in index.exact(cents, bank_day)[:3]:
+            suggestions.append(with_counterparty(with_name_similarity({
+                **Transaction(**parse_from_mongo(dict(match))).dict(),
+                "match_type": "transaction",
+                "match_score": 95,
+                "match_reason": "Exacte bedrag en datum match"
+            }, similar_patients), counterparty))
+        
+        # Only look for similar amounts if no exact matches: €1 or 1% difference, whichever is smaller
+        if not suggestions:
+            amount_tolerance = min(abs(bank_amount) * 0.01, 1.0)
+            for match in index.similar(cents, bank_day, amount_to_cents(amount_tolerance))[:2]:
+                suggestions.append(with_counterparty(with_name_similarity({
+                    **Transaction(**parse_from_mongo(dict(match))).dict(),
+                    "match_type": "transaction",
+                    "match_score": 75,
+                    "match_reason": f"Zeer vergelijkbaar bedrag (±€{amount_tolerance:.2f})"
+                }, similar_patients), counterparty))
+    
+    # Crediteuren only for outgoing payments
+    suggestions.extend(crediteur_index.suggestions(
+        bank_trans, {hit['ref']: hit['score'] for hit in name_hits if hit['kind'] == 'crediteur'},
+        counterparty['target_id'] if counterparty and counterparty['kind'] == 'crediteur' else None
+    ))
+    
+    # Sort by match score
+    suggestions.sort(key=lambda x: x.get("match_score", 0), reverse=True)
+    return jsonable_encoder(suggestions[:8])  # Top 8 matches, stored as plain JSON
+
+async def compute_reconciliation_suggestions(bank_transactions: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Suggestions for many bank transactions with one query over the union of their date windows"""
+    days = [day for day in (parse_iso_day(bank.get('date')) for bank in bank_transactions) if day]
+    open_filter = open_balance_filter([bank.get('amount', 0.0) for bank in bank_transactions])
+    transactions = []
+    if days:
+        transactions = await db.transactions.find({
+            "reconciled": False,
+            "open_amount": open_filter,
+            "date": {
+                "$gte": (min(days) - timedelta(days=RECONCILIATION_WINDOW_DAYS)).isoformat(),
+                "$lte": (max(days) + timedelta(days=RECONCILIATION_WINDOW_DAYS)).isoformat()
+            }
+        }, {"_id": 0}).to_list(None)
+    
+    # Invoice numbers named in the descriptions, joined in one query on the invoice_number index
+    invoice_numbers = list({number for bank in bank_transactions for number in bank_invoice_numbers(bank)})
+    by_invoice = {}
+    if invoice_numbers:
+        by_invoice = index_by_invoice_number(
+            await db.transactions.find({"invoice_number": {"$in": invoice_numbers}, "reconciled": False, "open_amount": open_filter}, {"_id": 0}).to_list(None)
+        )
+    
+    index = TransactionAmountIndex(transactions)
+    crediteur_index = await get_crediteur_match_index()
+    name_index = await get_name_index()
+    registry = await get_counterparty_registry()
+    return {
+        bank['id']: score_bank_suggestions(bank, index, crediteur_index, name_index, by_invoice, known_counterparty(registry, bank))
+        for bank in bank_transactions
+    }
+
+async def store_reconciliation_candidates(suggestions_by_bank: Dict[str, List[Dict[str, Any]]], bank_transactions: List[Dict[str, Any]]):
+    """Replace the stored candidates of these bank transactions"""
+    if not suggestions_by_bank:
+        return
+    amounts = {bank['id']: bank.get('amount', 0.0) for bank in bank_transactions}
+    computed_at = datetime.now(timezone.utc).isoformat()
+    await db.reconciliation_candidates.bulk_write([
+        ReplaceOne(
+            {"bank_transaction_id": bank_id},
+            {
+                "bank_transaction_id": bank_id,
+                "bank_amount": amounts.get(bank_id, 0.0),
+                "suggestions": suggestions,
+                "transaction_ids": [s['id'] for s in suggestions if s.get('match_type') == 'transaction'],
+                "computed_at": computed_at
+            },
+            upsert=True
+        )
+        for bank_id, suggestions in suggestions_by_bank.items()
+    ], ordered=False)
+
+async def refresh_reconciliation_candidates(bank_transaction_ids: Optional[List[str]] = None) -> int:
+    """Recompute and store candidates for the given (default: all) open bank transactions"""
+    query = {"reconciled": False}
+    if bank_transaction_ids is not None:
+        query["id"] = {"$in": list(bank_transaction_ids)}
+    bank_transactions = await db.bank_transactions.find(query, {"_id": 0}).to_list(None)
+    suggestions_by_bank = await compute_reconciliation_suggestions(bank_transactions)
+    await store_reconciliation_candidates(suggestions_by_bank, bank_transactions)
+    return len(suggestions_by_bank)
+
+async def refresh_candidates_after_import(created_ids: List[str]):
+    """Background task after an import: new bank rows get candidates, new transactions refresh
+    the open bank rows whose date window they fall into"""
+    try:
+        if not created_ids:
+            return
+        bank_ids = await db.bank_transactions.distinct("id", {"id": {"$in": created_ids}})
+        days = [
+            day for day in (parse_iso_day(value) for value in await db.transactions.distinct("date", {"id": {"$in": created_ids}}))
+            if day
+        ]
+        if days:
+            bank_ids += await db.bank_transactions.distinct("id", {
+                "reconciled": False,
+                "date": {
+                    "$gte": (min(days) - timedelta(days=RECONCILIATION_WINDOW_DAYS)).isoformat(),
+                    "$lte": (max(days) + timedelta(days=RECONCILIATION_WINDOW_DAYS)).isoformat()
+                }
+            })
+        if bank_ids:
+            await refresh_reconciliation_candidates(list(set(bank_ids)))
+    except Exception as e:
+        logger.warning(f"Refreshing reconciliation candidates failed: {str(e)}")
+
+async def discard_reconciliation_candidates(bank_transaction_ids: Optional[List[str]] = None,
+                                            transaction_ids: Optional[List[str]] = None,
+                                            outgoing: bool = False):
+    """Drop stored candidates that may be stale; they are recomputed on the next read.
+    
+    Covers the matched bank rows themselves, every bank row that offered one of the matched
+    transactions, and (outgoing=True, after crediteur changes) all outgoing bank rows.
+    """
+    conditions = []
+    if bank_transaction_ids:
+        conditions.append({"bank_transaction_id": {"$in": list(bank_transaction_ids)}})
+    if transaction_ids:
+        conditions.append({"transaction_ids": {"$in": list(transaction_ids)}})
+    if outgoing:
+        conditions.append({"bank_amount": {"$lt": 0}})
+    if conditions:
+        await db.reconciliation_candidates.delete_many({"$or": conditions})
+
 # Bank Reconciliation Endpoints
 @api_router.get("/bank-reconciliation/unmatched")
 async def get_unmatched_bank_transactions():
@@ -1277,257 +3407,720 @@ async def get_unmatched_bank_transactions():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bank transactions: {str(e)}")
 
+@api_router.get("/bank-reconciliation/unmatched/clusters")
+async def get_unmatched_bank_clusters(
+    min_count: int = Query(1, ge=1),
+    limit: int = Query(200, ge=1, le=1000)
+):
+    """Unmatched bank transactions grouped per counterparty and direction, largest groups first.
+    
+    One $group aggregation over the counterparty_key index; each cluster carries its bank
+    transaction ids so it can be matched or classified as a whole.
+    """
+    try:
+        clusters = await db.bank_transactions.aggregate([
+            {"$match": {"reconciled": False}},
+            {"$group": {
+                "_id": {
+                    "counterparty_key": "$counterparty_key",
+                    "direction": {"$cond": [{"$lt": ["$amount", 0]}, "uitgaand", "inkomend"]}
+                },
+                "counterparty": {"$first": "$counterparty"},
+                "count": {"$sum": 1},
+                "total_amount": {"$sum": "$amount"},
+                "min_amount": {"$min": "$amount"},
+                "max_amount": {"$max": "$amount"},
+                "avg_amount": {"$avg": "$amount"},
+                "first_date": {"$min": "$date"},
+                "last_date": {"$max": "$date"},
+                "bank_transaction_ids": {"$push": "$id"}
+            }},
+            {"$match": {"count": {"$gte": min_count}}},
+            {"$sort": {"count": -1, "total_amount": 1}},
+            {"$limit": limit}
+        ]).to_list(None)
+        
+        return [
+            {
+                "counterparty_key": cluster['_id'].get('counterparty_key') or '',
+                "counterparty": cluster.get('counterparty') or '',
+                "direction": cluster['_id']['direction'],
+                "count": cluster['count'],
+                "total_amount": round(cluster['total_amount'], 2),
+                "min_amount": cluster['min_amount'],
+                "max_amount": cluster['max_amount'],
+                "avg_amount": round(cluster['avg_amount'], 2),
+                "amount_spread": round(cluster['max_amount'] - cluster['min_amount'], 2),
+                "first_date": cluster['first_date'],
+                "last_date": cluster['last_date'],
+                "bank_transaction_ids": cluster['bank_transaction_ids']
+            }
+            for cluster in clusters
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error clustering bank transactions: {str(e)}")
+
 @api_router.post("/bank-reconciliation/match")
 async def match_bank_transaction(
     bank_transaction_id: str = Query(...),
-    cashflow_transaction_id: str = Query(...)
+    cashflow_transaction_id: str = Query(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    """Match a bank transaction with a cashflow transaction"""
+    """Match a bank transaction with a cashflow transaction. A bank amount below the open amount
+    books an instalment: the open balance goes down and the transaction stays open for the rest."""
+    try:
+        async with IdempotentRequest(idempotency_key, "match") as request_key:
+            if request_key.replay is not None:
+                return request_key.replay
+            
+            # Conditional updates: if either side was matched concurrently, this request fails instead of double-booking
+            bank_trans = await db.bank_transactions.find_one_and_update(
+                {"id": bank_transaction_id, "reconciled": False},
+                {"$set": {"reconciled": True}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not bank_trans:
+                raise await reconciliation_conflict(db.bank_transactions, bank_transaction_id, "Bank transactie")
+            
+            transaction = await db.transactions.find_one(
+                {"id": cashflow_transaction_id, "reconciled": False}, {"_id": 0, "id": 1, "amount": 1, "open_amount": 1}
+            )
+            bank_cents = amount_to_cents(bank_trans.get('amount'))
+            open_cents = amount_to_cents(transaction_open_amount(transaction)) if transaction else 0
+            partial = transaction is not None and same_sign(bank_cents, open_cents) and abs(bank_cents) < abs(open_cents)
+            if partial:
+                transaction = await db.transactions.find_one_and_update(
+                    {"id": cashflow_transaction_id, "reconciled": False},
+                    {"$inc": {"open_amount": -round(bank_trans['amount'], 2)}},
+                    projection={"_id": 0, "id": 1}
+                )
+            elif transaction is not None:
+                transaction = await db.transactions.find_one_and_update(
+                    {"id": cashflow_transaction_id, "reconciled": False},
+                    {"$set": {"reconciled": True, "open_amount": 0.0}},
+                    projection={"_id": 0, "id": 1}
+                )
+            if not transaction:
+                await db.bank_transactions.update_one({"id": bank_transaction_id}, {"$set": {"reconciled": False}})
+                raise await reconciliation_conflict(db.transactions, cashflow_transaction_id, "Transactie")
+            
+            await db.reconciliations.insert_one(build_reconciliation_record(
+                bank_trans, cashflow_transaction_id, "partial_payment" if partial else "matched", 1.0,
+                bank_trans['amount'] if partial else None
+            ))
+            await discard_reconciliation_candidates([bank_transaction_id], [cashflow_transaction_id])
+            await learn_counterparties([bank_transaction_id])
+            
+            if partial:
+                return request_key.complete({
+                    "message": "Deelbetaling geboekt",
+                    "open_amount": round((open_cents - bank_cents) / 100, 2)
+                })
+            return request_key.complete({"message": "Transacties succesvol gekoppeld"})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error matching transactions: {str(e)}")
+
+@api_router.post("/bank-reconciliation/match/batch")
+async def match_bank_transactions_batch(request: BatchMatchRequest):
+    """Confirm many matches at once: each bank transaction with a cashflow transaction or a crediteur.
+    
+    Reads and writes are grouped per collection, so the number of round trips does not grow with
+    the number of pairs. Rows are claimed atomically, so concurrent batches never book the same
+    bank row or transaction twice. As with /match, a bank amount below the open amount books an
+    instalment and leaves the transaction open.
+    """
     try:
-        # Update bank transaction
-        await db.bank_transactions.update_one(
-            {"id": bank_transaction_id},
-            {"$set": {"reconciled": True}}
+        async with IdempotentRequest(request.idempotency_key, "match_batch") as request_key:
+            if request_key.replay is not None:
+                return request_key.replay
+            
+            errors = []
+            items = []
+            seen_bank_ids = set()
+            for item in request.matches:
+                if bool(item.cashflow_transaction_id) == bool(item.crediteur_id):
+                    errors.append(f"{item.bank_transaction_id}: geef een transactie of een crediteur op")
+                elif item.bank_transaction_id in seen_bank_ids:
+                    errors.append(f"{item.bank_transaction_id}: dubbel in verzoek")
+                else:
+                    seen_bank_ids.add(item.bank_transaction_id)
+                    items.append(item)
+            
+            bank_by_id = {
+                bank['id']: bank async for bank in db.bank_transactions.find({"id": {"$in": list(seen_bank_ids)}}, {"_id": 0})
+            }
+            crediteur_ids = list({item.crediteur_id for item in items if item.crediteur_id})
+            crediteur_by_id = {
+                crediteur['id']: crediteur async for crediteur in db.crediteuren.find({"id": {"$in": crediteur_ids}}, {"_id": 0})
+            } if crediteur_ids else {}
+            
+            planned = []
+            for item in items:
+                if item.bank_transaction_id not in bank_by_id:
+                    errors.append(f"{item.bank_transaction_id}: bank transactie niet gevonden")
+                elif item.crediteur_id and item.crediteur_id not in crediteur_by_id:
+                    errors.append(f"{item.bank_transaction_id}: crediteur niet gevonden")
+                else:
+                    planned.append(item)
+            
+            # Claim both sides in one update each; anything already reconciled is reported, not booked twice
+            claim_id = str(uuid.uuid4())
+            claimed_banks = await claim_unreconciled(db.bank_transactions, [item.bank_transaction_id for item in planned], claim_id)
+            claimed_transactions = await claim_unreconciled(
+                db.transactions, [item.cashflow_transaction_id for item in planned if item.cashflow_transaction_id], claim_id
+            )
+            open_by_id = {
+                transaction['id']: transaction_open_amount(transaction) async for transaction in db.transactions.find(
+                    {"id": {"$in": list(claimed_transactions)}}, {"_id": 0, "id": 1, "amount": 1, "open_amount": 1}
+                )
+            } if claimed_transactions else {}
+            
+            expense_transactions = []
+            reconciliations = []
+            transaction_ids = []
+            settled_ids = []
+            partial_payments = []
+            for item in planned:
+                bank_trans = bank_by_id[item.bank_transaction_id]
+                if item.bank_transaction_id not in claimed_banks:
+                    errors.append(f"{item.bank_transaction_id}: bank transactie is al gekoppeld")
+                elif item.crediteur_id:
+                    expense_transaction = crediteur_expense_transaction(bank_trans, crediteur_by_id[item.crediteur_id])
+                    expense_transactions.append(expense_transaction)
+                    reconciliations.append(build_reconciliation_record(bank_trans, expense_transaction.id, "matched_crediteur", 0.9))
+                elif item.cashflow_transaction_id not in claimed_transactions or item.cashflow_transaction_id in transaction_ids:
+                    errors.append(f"{item.bank_transaction_id}: transactie {item.cashflow_transaction_id} is al gekoppeld")
+                else:
+                    transaction_ids.append(item.cashflow_transaction_id)
+                    bank_cents = amount_to_cents(bank_trans.get('amount'))
+                    open_cents = amount_to_cents(open_by_id.get(item.cashflow_transaction_id, 0.0))
+                    if same_sign(bank_cents, open_cents) and abs(bank_cents) < abs(open_cents):
+                        partial_payments.append((item.cashflow_transaction_id, bank_trans['amount']))
+                        reconciliations.append(build_reconciliation_record(
+                            bank_trans, item.cashflow_transaction_id, "partial_payment", 1.0, bank_trans['amount']
+                        ))
+                    else:
+                        settled_ids.append(item.cashflow_transaction_id)
+                        reconciliations.append(build_reconciliation_record(bank_trans, item.cashflow_transaction_id, "matched", 1.0))
+            
+            bank_ids = [reconciliation['bank_transaction_id'] for reconciliation in reconciliations]
+            await release_claim(db.bank_transactions, claimed_banks - set(bank_ids), claim_id)
+            # Transactions paid in part are released again and stay open for the rest
+            await release_claim(db.transactions, claimed_transactions - set(settled_ids), claim_id)
+            await settle_claimed(settled_ids, claim_id)
+            await book_partial_payments(partial_payments)
+            if expense_transactions:
+                await db.transactions.insert_many([prepare_for_mongo(expense.dict()) for expense in expense_transactions])
+            if reconciliations:
+                await db.reconciliations.insert_many(reconciliations)
+                await discard_reconciliation_candidates(bank_ids, transaction_ids)
+                await learn_counterparties(bank_ids)
+            
+            return request_key.complete({
+                "message": f"{len(reconciliations)} banktransacties gekoppeld",
+                "matched_count": len(reconciliations),
+                "partial_count": len(partial_payments),
+                "created_expense_ids": [expense.id for expense in expense_transactions],
+                "error_count": len(errors),
+                "errors": errors
+            })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error matching transactions: {str(e)}")
+
+@api_router.post("/bank-reconciliation/auto-match")
+async def auto_match_bank_transactions(
+    dry_run: bool = Query(False),
+    mode: str = Query("unique"),
+    min_score: float = Query(95.0)
+):
+    """Reconcile open bank transactions against open cashflow transactions in one pass.
+    
+    mode=unique applies only exact matches where both sides have a single candidate.
+    mode=assignment also considers similar amounts and picks the one-to-one pairing with the
+    highest total score, so two equal bank lines are never offered the same declaratie;
+    assigned pairs scoring at least min_score are applied.
+    """
+    try:
+        if mode not in ("unique", "assignment"):
+            raise HTTPException(status_code=400, detail=f"Onbekende modus: {mode}")
+        
+        bank_transactions = await db.bank_transactions.find({"reconciled": False}, {"_id": 0}).to_list(None)
+        transactions = await db.transactions.find(
+            {"reconciled": False, "open_amount": open_balance_filter([bank.get('amount', 0.0) for bank in bank_transactions])},
+            {"_id": 0}
+        ).to_list(None)
+        index = TransactionAmountIndex(transactions)
+        edges = transaction_candidate_edges(
+            bank_transactions, index, include_similar=(mode == "assignment"), by_invoice=index_by_invoice_number(transactions),
+            registry=await get_counterparty_registry()
         )
         
-        # Update cashflow transaction
-        await db.transactions.update_one(
-            {"id": cashflow_transaction_id},
-            {"$set": {"reconciled": True}}
+        candidate_bank_ids = {edge[0]['id'] for edge in edges}
+        if mode == "assignment":
+            assigned = await asyncio.get_running_loop().run_in_executor(None, solve_reconciliation_assignment, edges)
+            # Applying closes the transaction, so only pairs that pay the open amount in full qualify
+            selected = [edge for edge in assigned if edge[2] >= min_score and pays_in_full(edge[0], edge[1])]
+            review_count = len(candidate_bank_ids) - len(selected)
+        else:
+            # Only unambiguous pairs are applied; anything contested is left for review
+            bank_counts = {}
+            transaction_counts = {}
+            for bank, transaction, _, _ in edges:
+                bank_counts[bank['id']] = bank_counts.get(bank['id'], 0) + 1
+                transaction_counts[transaction['id']] = transaction_counts.get(transaction['id'], 0) + 1
+            selected = [edge for edge in edges
+                        if bank_counts[edge[0]['id']] == 1 and transaction_counts[edge[1]['id']] == 1]
+            review_count = len(candidate_bank_ids) - len(selected)
+        
+        if not dry_run:
+            applied = await apply_reconciliation_matches([(bank, transaction, score / 100) for bank, transaction, score, _ in selected])
+            # Rows matched elsewhere in the meantime are skipped by the claim
+            applied_bank_ids = {pair[0]['id'] for pair in applied}
+            review_count += len(selected) - len(applied)
+            selected = [edge for edge in selected if edge[0]['id'] in applied_bank_ids]
+        
+        return {
+            "message": f"{len(selected)} banktransacties automatisch gekoppeld" if not dry_run else f"{len(selected)} banktransacties kunnen automatisch gekoppeld worden",
+            "dry_run": dry_run,
+            "mode": mode,
+            "matched_count": len(selected),
+            "ambiguous_count": review_count,
+            "unmatched_count": len(bank_transactions) - len(candidate_bank_ids),
+            "candidate_edges": len(edges),
+            "matches": [
+                {
+                    "bank_transaction_id": bank['id'],
+                    "transaction_id": transaction['id'],
+                    "amount": bank.get('amount', 0.0),
+                    "bank_date": bank.get('date'),
+                    "transaction_date": transaction.get('date'),
+                    "bank_description": bank.get('description', ''),
+                    "transaction_description": transaction.get('description', ''),
+                    "match_score": score,
+                    "match_reason": reason
+                }
+                for bank, transaction, score, reason in selected
+            ]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error auto-matching transactions: {str(e)}")
+
+@api_router.get("/bank-reconciliation/split-suggestions/{bank_transaction_id}")
+async def get_split_suggestions(bank_transaction_id: str):
+    """Suggest a set of open declaraties of the paying insurer that add up exactly to one bank payment"""
+    try:
+        bank_trans = await db.bank_transactions.find_one({"id": bank_transaction_id}, {"_id": 0})
+        if not bank_trans:
+            raise HTTPException(status_code=404, detail="Bank transactie niet gevonden")
+        
+        bank_amount = bank_trans.get('amount', 0)
+        bank_day = parse_iso_day(bank_trans.get('date'))
+        counterparty = known_counterparty(await get_counterparty_registry(), bank_trans)
+        counterparty_words = (
+            (insurer_tokens(counterparty['name']) if counterparty and counterparty['kind'] == 'verzekeraar' else set())
+            or insurer_tokens(bank_trans.get('counterparty')) or insurer_tokens(bank_trans.get('description'))
         )
+        result = {
+            "bank_transaction_id": bank_transaction_id,
+            "bank_amount": bank_amount,
+            "candidate_count": 0,
+            "transactions": [],
+            "total": 0.0,
+            "limit_reached": False
+        }
+        # Insurers only pay in; without a date or counterparty there is nothing to restrict on
+        if bank_amount <= 0 or bank_day is None or not counterparty_words:
+            return result
+        
+        declaraties = await db.transactions.find({
+            "reconciled": False,
+            "open_amount": {"$gt": 0},
+            "type": "income",
+            "category": "zorgverzekeraar",
+            "date": {
+                "$gte": (bank_day - timedelta(days=SPLIT_MATCH_LOOKBACK_DAYS)).isoformat(),
+                "$lte": bank_day.isoformat()
+            }
+        }, {"_id": 0}).sort([("date", 1)]).to_list(None)
+        
+        # Oldest open declaraties first: insurers settle in order of submission
+        candidates = [
+            declaratie for declaratie in declaraties
+            if insurer_tokens(declaratie.get('patient_name')) & counterparty_words
+        ][:SPLIT_MATCH_MAX_CANDIDATES]
+        result["candidate_count"] = len(candidates)
         
-        # Get bank transaction details for reconciliation record
-        bank_trans = await db.bank_transactions.find_one({"id": bank_transaction_id})
-        bank_amount = bank_trans.get('amount', 0.0) if bank_trans else 0.0
-        bank_description = bank_trans.get('description', '') if bank_trans else ''
-        bank_date_str = bank_trans.get('date', '') if bank_trans else date.today().isoformat()
-        
-        # Create reconciliation record
-        reconciliation = BankReconciliation(
-            bank_transaction_id=bank_transaction_id,
-            bank_date=bank_date_str if isinstance(bank_date_str, str) else date.today(),
-            bank_amount=bank_amount,
-            bank_description=bank_description,
-            matched_transaction_id=cashflow_transaction_id,
-            reconciliation_status="matched",
-            match_confidence=1.0
+        combination, limit_reached = await asyncio.get_running_loop().run_in_executor(
+            None, find_exact_subset, [amount_to_cents(transaction_open_amount(candidate)) for candidate in candidates], amount_to_cents(bank_amount)
         )
+        result["limit_reached"] = limit_reached
+        if combination:
+            matched = [candidates[index] for index in combination]
+            result["transactions"] = [Transaction(**parse_from_mongo(declaratie)).dict() for declaratie in matched]
+            result["total"] = round(sum(transaction_open_amount(declaratie) for declaratie in matched), 2)
+        return result
         
-        reconciliation_dict = prepare_for_mongo(reconciliation.dict())
-        await db.reconciliations.insert_one(reconciliation_dict)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error finding split suggestions: {str(e)}")
+
+@api_router.post("/bank-reconciliation/match-split")
+async def match_bank_transaction_split(request: SplitMatchRequest):
+    """Match one bank payment with several declaraties that together add up to its amount"""
+    try:
+        async with IdempotentRequest(request.idempotency_key, "match_split") as request_key:
+            if request_key.replay is not None:
+                return request_key.replay
+            
+            if not request.transaction_ids:
+                raise HTTPException(status_code=400, detail="Geen declaraties opgegeven")
+            
+            bank_trans = await db.bank_transactions.find_one({"id": request.bank_transaction_id}, {"_id": 0})
+            if not bank_trans:
+                raise HTTPException(status_code=404, detail="Bank transactie niet gevonden")
+            if bank_trans.get('reconciled'):
+                raise HTTPException(status_code=409, detail="Bank transactie is al gekoppeld")
+            
+            transaction_ids = list(dict.fromkeys(request.transaction_ids))
+            transactions = await db.transactions.find(
+                {"id": {"$in": transaction_ids}, "reconciled": False}, {"_id": 0}
+            ).to_list(None)
+            if len(transactions) != len(transaction_ids):
+                raise HTTPException(status_code=400, detail="Niet alle declaraties gevonden of ze zijn al gekoppeld")
+            
+            total_cents = sum(amount_to_cents(transaction_open_amount(transaction)) for transaction in transactions)
+            if total_cents != amount_to_cents(bank_trans.get('amount')):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Som van declaraties (€{total_cents / 100:.2f}) is niet gelijk aan het bankbedrag (€{bank_trans.get('amount', 0):.2f})"
+                )
+            
+            # Claim the bank row and all declaraties; if any was matched concurrently, undo and refuse
+            claim_id = str(uuid.uuid4())
+            bank_claimed = await db.bank_transactions.find_one_and_update(
+                {"id": request.bank_transaction_id, "reconciled": False},
+                {"$set": {"reconciled": True, "reconciliation_claim": claim_id}},
+                projection={"_id": 0, "id": 1}
+            )
+            if not bank_claimed:
+                raise HTTPException(status_code=409, detail="Bank transactie is al gekoppeld")
+            claimed_transactions = await claim_unreconciled(db.transactions, transaction_ids, claim_id)
+            if len(claimed_transactions) != len(transaction_ids):
+                await release_claim(db.bank_transactions, [request.bank_transaction_id], claim_id)
+                await release_claim(db.transactions, claimed_transactions, claim_id)
+                raise HTTPException(status_code=409, detail="Niet alle declaraties zijn nog open")
+            
+            await settle_claimed(transaction_ids, claim_id)
+            await db.reconciliations.insert_many([
+                build_reconciliation_record(bank_trans, transaction['id'], "matched_split", 1.0, transaction_open_amount(transaction))
+                for transaction in transactions
+            ])
+            await discard_reconciliation_candidates([request.bank_transaction_id], transaction_ids)
+            await learn_counterparties([request.bank_transaction_id])
+            
+            return request_key.complete({
+                "message": f"Bank transactie gekoppeld aan {len(transactions)} declaraties",
+                "matched_count": len(transactions)
+            })
         
-        return {"message": "Transacties succesvol gekoppeld"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error matching split payment: {str(e)}")
+
+# Statuses of specification lines that produce a reconciliation record
+SPECIFICATION_RECORD_STATUS = {'paid': 'matched_specification', 'partial': 'partial_payment', 'rejected': 'rejected'}
+
+def classify_specification_line(item: ImportPreviewItem, by_invoice: Dict[str, List[Dict[str, Any]]],
+                                used_ids: set) -> Dict[str, Any]:
+    """Outcome of one specification line: paid, partial, rejected, or why it cannot be booked"""
+    data = item.mapped_data
+    line = {
+        "row_number": item.row_number,
+        "invoice_number": data.get('invoice_number'),
+        "paid_amount": data.get('paid_amount'),
+        "reason": data.get('reason'),
+        "transaction_id": None
+    }
+    if item.validation_errors:
+        return {**line, "status": "error", "message": "; ".join(item.validation_errors)}
+    matches = by_invoice.get(data['invoice_number'], [])
+    if not matches:
+        return {**line, "status": "not_found", "message": "Factuurnummer niet gevonden"}
+    if len(matches) > 1:
+        return {**line, "status": "ambiguous", "message": "Factuurnummer komt bij meerdere transacties voor"}
+    transaction = matches[0]
+    line["transaction_id"] = transaction['id']
+    if transaction.get('reconciled'):
+        return {**line, "status": "already_reconciled", "message": "Declaratie is al gekoppeld"}
+    if transaction['id'] in used_ids:
+        return {**line, "status": "duplicate", "message": "Factuurnummer staat meerdere keren in de specificatie"}
+    used_ids.add(transaction['id'])
+    
+    paid_cents = amount_to_cents(data['paid_amount'])
+    open_cents = amount_to_cents(transaction_open_amount(transaction))
+    if paid_cents <= 0:
+        return {**line, "status": "rejected", "message": data.get('reason') or "Afgewezen door verzekeraar"}
+    if paid_cents < open_cents:
+        return {**line, "status": "partial", "message": f"Deels betaald: €{paid_cents / 100:.2f} van €{open_cents / 100:.2f} open"}
+    return {**line, "status": "paid", "message": "Volledig betaald"}
+
+@api_router.post("/bank-reconciliation/specification")
+async def match_payment_specification(
+    bank_transaction_id: str = Form(...),
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Split a lump-sum insurer payment over the declaraties in its specification (CSV or XML).
+    Every line is joined on factuurnummer; fully paid declaraties are closed, partial payments
+    lower the open amount and rejections are only recorded, both flagged and leaving the
+    declaratie open. All reconciliation records are written in one bulk insert."""
+    filename = (file.filename or '').lower()
+    if not filename.endswith(('.csv', '.xml')):
+        raise HTTPException(status_code=400, detail="Alleen .csv of .xml specificaties zijn toegestaan")
+    
+    try:
+        async with IdempotentRequest(idempotency_key, "match_specification") as request_key:
+            if request_key.replay is not None:
+                return request_key.replay
+            
+            timer = ImportTimer('specification', file_name=file.filename, bank_transaction_id=bank_transaction_id)
+            bank_trans = await db.bank_transactions.find_one({"id": bank_transaction_id}, {"_id": 0})
+            if not bank_trans:
+                raise HTTPException(status_code=404, detail="Bank transactie niet gevonden")
+            if bank_trans.get('reconciled'):
+                raise HTTPException(status_code=409, detail="Bank transactie is al gekoppeld")
+            
+            with timer.stage('parse') as stage:
+                items = await run_import_task(read_specification, filename, file.file)
+                stage['rows'] = len(items)
+            if not items:
+                raise HTTPException(status_code=400, detail="Geen regels in de specificatie gevonden")
+            
+            # The specification must account for exactly this payment
+            total_cents = sum(
+                amount_to_cents(item.mapped_data['paid_amount']) for item in items if item.import_status == 'valid'
+            )
+            if total_cents != amount_to_cents(bank_trans.get('amount')):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Totaal van de specificatie (€{total_cents / 100:.2f}) is niet gelijk aan het bankbedrag (€{bank_trans.get('amount', 0):.2f})"
+                )
+            
+            # Hash join on factuurnummer: one $in query, then dictionary lookups per line
+            with timer.stage('join') as stage:
+                invoice_numbers = list({item.mapped_data['invoice_number'] for item in items if item.mapped_data.get('invoice_number')})
+                by_invoice = index_by_invoice_number(await db.transactions.find(
+                    {"invoice_number": {"$in": invoice_numbers}}, {"_id": 0}
+                ).to_list(None))
+                used_ids = set()
+                lines = [classify_specification_line(item, by_invoice, used_ids) for item in items]
+                stage['rows'] = len(by_invoice)
+            
+            if not dry_run:
+                if not any(line['status'] in SPECIFICATION_RECORD_STATUS for line in lines):
+                    raise HTTPException(status_code=400, detail="Geen enkele regel uit de specificatie kon gekoppeld worden")
+                
+                with timer.stage('write') as stage:
+                    claim_id = str(uuid.uuid4())
+                    bank_claimed = await db.bank_transactions.find_one_and_update(
+                        {"id": bank_transaction_id, "reconciled": False},
+                        {"$set": {"reconciled": True, "reconciliation_claim": claim_id}},
+                        projection={"_id": 0, "id": 1}
+                    )
+                    if not bank_claimed:
+                        raise HTTPException(status_code=409, detail="Bank transactie is al gekoppeld")
+                    
+                    # Only fully paid declaraties are closed; lines that lost a concurrent race are reported
+                    claimed = await claim_unreconciled(
+                        db.transactions, [line['transaction_id'] for line in lines if line['status'] == 'paid'], claim_id
+                    )
+                    for line in lines:
+                        if line['status'] == 'paid' and line['transaction_id'] not in claimed:
+                            line.update(status="already_reconciled", message="Declaratie is al gekoppeld")
+                    await settle_claimed(claimed, claim_id)
+                    await book_partial_payments([
+                        (line['transaction_id'], line['paid_amount']) for line in lines if line['status'] == 'partial'
+                    ])
+                    
+                    records = [
+                        build_reconciliation_record(
+                            bank_trans, line['transaction_id'], SPECIFICATION_RECORD_STATUS[line['status']],
+                            1.0, line['paid_amount'],
+                            notes=None if line['status'] == 'paid' else "; ".join(dict.fromkeys(filter(None, [line['message'], line['reason']])))
+                        )
+                        for line in lines if line['status'] in SPECIFICATION_RECORD_STATUS
+                    ]
+                    if records:
+                        await db.reconciliations.insert_many(records)
+                    await discard_reconciliation_candidates(
+                        [bank_transaction_id], [line['transaction_id'] for line in lines if line['transaction_id']]
+                    )
+                    await learn_counterparties([bank_transaction_id])
+                    stage['rows'] = len(records)
+            
+            status_counts = Counter(line['status'] for line in lines)
+            return request_key.complete({
+                "message": f"{status_counts['paid']} declaraties volledig betaald, {status_counts['partial']} deels betaald, {status_counts['rejected']} afgewezen",
+                "dry_run": dry_run,
+                "status_counts": dict(status_counts),
+                "lines": lines,
+                "timings": [timing.dict() for timing in timer.finish(line_count=len(lines), dry_run=dry_run)]
+            })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error matching transactions: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error matching payment specification: {str(e)}")
 
 @api_router.post("/bank-reconciliation/match-crediteur")
 async def match_bank_transaction_with_crediteur(
     bank_transaction_id: str = Query(...),
-    crediteur_id: str = Query(...)
+    crediteur_id: str = Query(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Match a bank transaction with a crediteur"""
     try:
-        # Get bank transaction and crediteur details
-        bank_trans = await db.bank_transactions.find_one({"id": bank_transaction_id})
-        crediteur = await db.crediteuren.find_one({"id": crediteur_id})
-        
-        if not bank_trans or not crediteur:
-            raise HTTPException(status_code=404, detail="Bank transactie of crediteur niet gevonden")
-        
-        # Create expense transaction for the crediteur payment
-        expense_transaction = Transaction(
-            type="expense",
-            category="crediteur",
-            amount=crediteur['bedrag'],
-            description=f"Maandelijkse betaling {crediteur['crediteur']}",
-            date=bank_trans['date'] if isinstance(bank_trans['date'], str) else bank_trans['date'].isoformat(),
-            patient_name=crediteur['crediteur'],
-            invoice_number=f"CRED-{crediteur_id[:8]}",
-            notes=f"Automatisch gekoppeld aan bank transactie {bank_transaction_id[:8]}",
-            reconciled=True
-        )
-        
-        # Save expense transaction
-        expense_dict = prepare_for_mongo(expense_transaction.dict())
-        await db.transactions.insert_one(expense_dict)
-        
-        # Mark bank transaction as reconciled
-        await db.bank_transactions.update_one(
-            {"id": bank_transaction_id},
-            {"$set": {"reconciled": True}}
-        )
+        async with IdempotentRequest(idempotency_key, "match_crediteur") as request_key:
+            if request_key.replay is not None:
+                return request_key.replay
+            
+            crediteur = await db.crediteuren.find_one({"id": crediteur_id}, {"_id": 0})
+            if not crediteur:
+                raise HTTPException(status_code=404, detail="Crediteur niet gevonden")
+            
+            # Claim the bank row first, so a concurrent match cannot create a second expense
+            bank_trans = await db.bank_transactions.find_one_and_update(
+                {"id": bank_transaction_id, "reconciled": False},
+                {"$set": {"reconciled": True}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not bank_trans:
+                raise await reconciliation_conflict(db.bank_transactions, bank_transaction_id, "Bank transactie")
+            
+            # Create expense transaction for the crediteur payment
+            expense_transaction = crediteur_expense_transaction(bank_trans, crediteur)
+            await db.transactions.insert_one(prepare_for_mongo(expense_transaction.dict()))
+            
+            # Create reconciliation record
+            await db.reconciliations.insert_one(
+                build_reconciliation_record(bank_trans, expense_transaction.id, "matched_crediteur", 0.9)
+            )
+            await discard_reconciliation_candidates([bank_transaction_id])
+            await learn_counterparties([bank_transaction_id])
+            
+            return request_key.complete({
+                "message": "Bank transactie succesvol gekoppeld aan crediteur",
+                "created_expense_id": expense_transaction.id
+            })
         
-        # Create reconciliation record
-        bank_date_str = bank_trans.get('date', '')
-        reconciliation = BankReconciliation(
-            bank_transaction_id=bank_transaction_id,
-            bank_date=bank_date_str if isinstance(bank_date_str, str) else date.today(),
-            bank_amount=bank_trans.get('amount', 0),
-            bank_description=bank_trans.get('description', ''),
-            matched_transaction_id=expense_transaction.id,
-            reconciliation_status="matched_crediteur",
-            match_confidence=0.9
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error matching with crediteur: {str(e)}")
+
+@api_router.post("/bank-reconciliation/suggestions/batch")
+async def get_reconciliation_suggestions_batch(request: BatchSuggestionsRequest):
+    """Suggestions for a page of bank transactions: stored candidates in one read, the rest
+    computed together with one query over the union of their date windows"""
+    try:
+        bank_transaction_ids = list(dict.fromkeys(request.bank_transaction_ids))
+        if len(bank_transaction_ids) > SUGGESTIONS_BATCH_MAX:
+            raise HTTPException(status_code=400, detail=f"Maximaal {SUGGESTIONS_BATCH_MAX} banktransacties per verzoek")
+        
+        suggestions_by_bank = {
+            stored['bank_transaction_id']: stored['suggestions']
+            async for stored in db.reconciliation_candidates.find(
+                {"bank_transaction_id": {"$in": bank_transaction_ids}},
+                {"_id": 0, "bank_transaction_id": 1, "suggestions": 1}
+            )
+        }
         
-        reconciliation_dict = prepare_for_mongo(reconciliation.dict())
-        await db.reconciliations.insert_one(reconciliation_dict)
+        missing_ids = [bank_id for bank_id in bank_transaction_ids if bank_id not in suggestions_by_bank]
+        if missing_ids:
+            bank_transactions = await db.bank_transactions.find({"id": {"$in": missing_ids}}, {"_id": 0}).to_list(None)
+            computed = await compute_reconciliation_suggestions(bank_transactions)
+            open_bank_transactions = [bank for bank in bank_transactions if not bank.get('reconciled')]
+            await store_reconciliation_candidates(
+                {bank['id']: computed[bank['id']] for bank in open_bank_transactions}, open_bank_transactions
+            )
+            suggestions_by_bank.update(computed)
         
-        return {
-            "message": "Bank transactie succesvol gekoppeld aan crediteur",
-            "created_expense_id": expense_transaction.id
-        }
+        # Unknown ids are left out
+        return {bank_id: suggestions_by_bank[bank_id] for bank_id in bank_transaction_ids if bank_id in suggestions_by_bank}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error matching with crediteur: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error finding suggestions: {str(e)}")
 
 @api_router.get("/bank-reconciliation/suggestions/{bank_transaction_id}")
 async def get_reconciliation_suggestions(bank_transaction_id: str):
     """Get suggested matches for a bank transaction (transactions + crediteuren)"""
     try:
-        # Get bank transaction
-        bank_trans = await db.bank_transactions.find_one({"id": bank_transaction_id})
+        # Candidates are precomputed after imports; compute and store them on a miss
+        stored = await db.reconciliation_candidates.find_one({"bank_transaction_id": bank_transaction_id}, {"_id": 0, "suggestions": 1})
+        if stored:
+            return stored['suggestions']
+        
+        bank_trans = await db.bank_transactions.find_one({"id": bank_transaction_id}, {"_id": 0})
         if not bank_trans:
             raise HTTPException(status_code=404, detail="Bank transactie niet gevonden")
         
-        bank_amount = bank_trans.get('amount', 0)  # Keep original sign!
-        bank_original_amount = bank_trans.get('original_amount', bank_trans.get('amount', 0))
-        bank_date = bank_trans.get('date', '')
-        bank_description = bank_trans.get('description', '').lower()
-        bank_counterparty = bank_trans.get('counterparty', '').lower()
-        
-        suggestions = []
-        
-        # Find potential cashflow transaction matches
-        if bank_date:
-            date_obj = datetime.fromisoformat(bank_date).date() if isinstance(bank_date, str) else bank_date
-            start_date = (date_obj - timedelta(days=7)).isoformat()  # Stricter: only 7 days
-            end_date = (date_obj + timedelta(days=7)).isoformat()
-            
-            # CRITICAL: Only match transactions with same sign (positive with positive, negative with negative)
-            # AND make matching much stricter
-            
-            # Match by exact amount first (same sign!)
-            exact_matches = await db.transactions.find({
-                "reconciled": False,
-                "amount": bank_amount,  # Exact amount match including sign
-                "date": {"$gte": start_date, "$lte": end_date}
-            }).to_list(3)
-            
-            for match in exact_matches:
-                suggestions.append({
-                    **Transaction(**parse_from_mongo(match)).dict(),
-                    "match_type": "transaction",
-                    "match_score": 95,
-                    "match_reason": "Exacte bedrag en datum match"
-                })
-            
-            # Only look for similar amounts if no exact matches and be MUCH stricter
-            if len(suggestions) == 0:
-                # Very strict tolerance: only €1 or 1% difference, whichever is smaller
-                amount_tolerance = min(abs(bank_amount) * 0.01, 1.0)  
-                
-                # Determine sign-based range
-                if bank_amount >= 0:
-                    # For positive amounts, only match positive transactions
-                    min_amount = bank_amount - amount_tolerance
-                    max_amount = bank_amount + amount_tolerance
-                    sign_filter = {"$gte": 0}
-                else:
-                    # For negative amounts, only match negative transactions  
-                    min_amount = bank_amount - amount_tolerance  # More negative
-                    max_amount = bank_amount + amount_tolerance  # Less negative
-                    sign_filter = {"$lt": 0}
-                
-                similar_matches = await db.transactions.find({
-                    "reconciled": False,
-                    "amount": {
-                        "$gte": min_amount,
-                        "$lte": max_amount,
-                        **sign_filter  # Ensure same sign
-                    },
-                    "date": {"$gte": start_date, "$lte": end_date}
-                }).to_list(2)  # Only 2 suggestions for similar matches
-                
-                for match in similar_matches:
-                    # Double check that signs match
-                    if (bank_amount >= 0 and match['amount'] >= 0) or (bank_amount < 0 and match['amount'] < 0):
-                        suggestions.append({
-                            **Transaction(**parse_from_mongo(match)).dict(),
-                            "match_type": "transaction", 
-                            "match_score": 75,
-                            "match_reason": f"Zeer vergelijkbaar bedrag (±€{amount_tolerance:.2f})"
-                        })
-        
-        # Find potential crediteur matches - ONLY for negative bank transactions (outgoing payments)
-        if bank_amount < 0:  # Only match crediteuren with outgoing bank transactions
-            crediteuren = await db.crediteuren.find({"actief": True}).to_list(20)
-            print(f"DEBUG: Found {len(crediteuren)} crediteuren for matching negative transaction")
-            print(f"DEBUG: Bank amount: {bank_amount}, description: '{bank_description}', counterparty: '{bank_counterparty}'")
-            
-            bank_abs_amount = abs(bank_amount)  # Get absolute value for comparison with crediteur amounts
-            
-            for crediteur in crediteuren:
-                crediteur_amount = crediteur.get('bedrag', 0)
-                crediteur_naam = crediteur.get('crediteur', '').lower()
-                
-                # Much stricter amount matching - must be very close (within €2 or 2%)
-                amount_tolerance = min(crediteur_amount * 0.02, 2.0)
-                amount_diff = abs(bank_abs_amount - crediteur_amount)
-                amount_match = amount_diff <= amount_tolerance
-                
-                if amount_match:
-                    print(f"DEBUG: Amount match for {crediteur_naam}: €{bank_abs_amount} vs €{crediteur_amount} (diff: €{amount_diff:.2f})")
-                
-                # Match by name/description
-                name_match = False
-                if crediteur_naam:
-                    # Check various name matching scenarios
-                    if (crediteur_naam in bank_description or 
-                        crediteur_naam in bank_counterparty or
-                        bank_counterparty in crediteur_naam or
-                        any(word in bank_description for word in crediteur_naam.split() if len(word) > 3)):
-                        name_match = True
-                        print(f"DEBUG: Name match for {crediteur_naam}")
-                
-                # Calculate match score - much higher standards
-                score = 0
-                reasons = []
-                if amount_match and name_match:
-                    score = 95
-                    reasons = ["Exacte bedrag match", "Naam match"]
-                elif amount_match:
-                    score = 85
-                    reasons = ["Exacte bedrag match"]
-                elif name_match and amount_diff <= crediteur_amount * 0.1:  # Name match with reasonable amount
-                    score = 70
-                    reasons = ["Naam match", f"Redelijk bedrag (verschil: €{amount_diff:.2f})"]
-                
-                # Only suggest if score is high enough (minimum 70)
-                if score >= 70:
-                    suggestions.append({
-                        "id": crediteur['id'],
-                        "type": "expense",
-                        "category": "crediteur",
-                        "amount": crediteur_amount,
-                        "description": f"Maandelijkse betaling {crediteur_naam}",
-                        "patient_name": crediteur_naam,
-                        "invoice_number": f"Crediteur-{crediteur['dag']}e",
-                        "match_type": "crediteur",
-                        "match_score": score,
-                        "match_reason": ", ".join(reasons),
-                        "crediteur_dag": crediteur.get('dag', 1)
-                    })
-        else:
-            print(f"DEBUG: Skipping crediteur matching for positive bank transaction: €{bank_amount}")
-        
-        # Sort by match score
-        suggestions.sort(key=lambda x: x.get("match_score", 0), reverse=True)
-        return suggestions[:8]  # Return top 8 matches
+        suggestions_by_bank = await compute_reconciliation_suggestions([bank_trans])
+        if not bank_trans.get('reconciled'):
+            await store_reconciliation_candidates(suggestions_by_bank, [bank_trans])
+        return suggestions_by_bank[bank_transaction_id]
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error finding suggestions: {str(e)}")
 
+@api_router.get("/counterparties", response_model=List[Counterparty])
+async def get_counterparties(kind: Optional[str] = None):
+    """IBANs the registry recognises, most matched first"""
+    try:
+        query = {"kind": kind} if kind else {}
+        counterparties = await db.counterparties.find(query, {"_id": 0}).sort([("match_count", -1)]).to_list(None)
+        return [Counterparty(**parse_from_mongo(counterparty)) for counterparty in counterparties]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching counterparties: {str(e)}")
+
+@api_router.post("/counterparties/learn")
+async def relearn_counterparties():
+    """Rebuild the registry from all confirmed reconciliations"""
+    try:
+        learned_count = await learn_counterparties()
+        return {"message": f"{learned_count} rekeningnummers geleerd", "learned_count": learned_count}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error learning counterparties: {str(e)}")
+
+@api_router.delete("/counterparties/{iban}")
+async def delete_counterparty(iban: str):
+    """Forget a wrongly learned IBAN; a later confirmed match can teach it again"""
+    try:
+        result = await db.counterparties.delete_one({"iban": normalize_iban(iban)})
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Rekeningnummer niet gevonden")
+        await invalidate_counterparty_registry()
+        return {"message": "Rekeningnummer verwijderd"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting counterparty: {str(e)}")
+
 # Nieuwe endpoints voor uitgebreide cashflow management
 
 # Bank Saldo endpoints
@@ -1629,7 +4222,7 @@ async def create_correctie(correctie: CorrectionCreate):
                 corrected_amount = original['amount'] - correction.amount
                 await db.transactions.update_one(
                     {"id": original['id']},
-                    {"$set": {"amount": corrected_amount}}
+                    amount_change(original, corrected_amount)
                 )
         
         correction_dict = prepare_for_mongo(correction.dict())
@@ -1666,7 +4259,7 @@ async def match_correctie_manual(
         corrected_amount = original['amount'] - correctie['amount']
         await db.transactions.update_one(
             {"id": original_transaction_id},
-            {"$set": {"amount": corrected_amount}}
+            amount_change(original, corrected_amount)
         )
         
         return {"message": "Correctie succesvol gekoppeld", "new_amount": corrected_amount}
@@ -1746,6 +4339,20 @@ async def get_correction_suggestions(correctie_id: str):
         # Execute aggregation
         similar_transactions = await db.transactions.aggregate(pipeline).to_list(50)
         
+        # Also consider transactions of similarly named patients/insurers, whatever their amount
+        correction_patient = correctie.get('patient_name', '').lower().strip()
+        name_index = await get_name_index()
+        similar_names = {hit['ref']: hit['score'] for hit in name_index.search(correction_patient, k=10, kinds={'patient'})}
+        if similar_names:
+            name_filter = {"patient_name": {"$in": list(similar_names)}}
+            if search_category:
+                name_filter["category"] = search_category
+            seen_ids = {transaction['id'] for transaction in similar_transactions}
+            similar_transactions.extend(
+                transaction for transaction in await db.transactions.find(name_filter).sort([("date", -1)]).to_list(50)
+                if transaction['id'] not in seen_ids
+            )
+        
         for transaction in similar_transactions:
             score = 0
             reasons = []
@@ -1758,8 +4365,7 @@ async def get_correction_suggestions(correctie_id: str):
                 reasons.append("Vergelijkbaar bedrag")
             
             # Enhanced patient name matching
-            correction_patient = correctie.get('patient_name', '').lower().strip()
-            transaction_patient = transaction.get('patient_name', '').lower().strip()
+            transaction_patient = (transaction.get('patient_name') or '').lower().strip()
             
             if correction_patient and transaction_patient:
                 # Exact match
@@ -1771,24 +4377,15 @@ async def get_correction_suggestions(correctie_id: str):
                       transaction_patient in correction_patient):
                     score += 30
                     reasons.append("Gedeeltelijke naam match")
-                # Split names and check for word matches
+                # Trigram similarity catches typos, reordered words and abbreviations
                 else:
-                    correction_words = set(correction_patient.replace(',', ' ').split())
-                    transaction_words = set(transaction_patient.replace(',', ' ').split())
-                    
-                    # Remove common words that don't help matching
-                    common_words = {'van', 'de', 'der', 'den', 'het', 'een', 'en', 'te', 'voor', 'naar', 'bij'}
-                    correction_words = correction_words - common_words
-                    transaction_words = transaction_words - common_words
-                    
-                    # Calculate word overlap
-                    matching_words = correction_words & transaction_words
-                    if len(matching_words) >= 2:  # At least 2 matching words
+                    similarity = similar_names.get(transaction.get('patient_name')) or trigram_similarity(correction_patient, transaction_patient)
+                    if similarity >= 0.6:
                         score += 25
-                        reasons.append(f"Naam woorden match ({len(matching_words)} woorden)")
-                    elif len(matching_words) >= 1 and len(correction_words) <= 2:  # For short names
+                        reasons.append(f"Naam lijkt op ({similarity:.0%})")
+                    elif similarity >= 0.4:
                         score += 15
-                        reasons.append("Enkele naam match")
+                        reasons.append(f"Naam lijkt enigszins op ({similarity:.0%})")
             
             # Date proximity bonus (but don't exclude based on date)
             try:
@@ -1832,7 +4429,10 @@ async def import_creditfactuur_particulier(request: CopyPasteImportRequest):
             "bedrag"     # Credit amount (negative)
         ]
         
-        corrections = parse_copy_paste_data(request.data, expected_columns)
+        timer = ImportTimer('import_correcties', import_type='creditfactuur_particulier')
+        with timer.stage('parse') as stage:
+            corrections = await run_import_task(parse_copy_paste_data, request.data, expected_columns)
+            stage['rows'] = len(corrections)
         
         if not corrections:
             raise HTTPException(status_code=400, detail="Geen geldige creditfacturen gevonden")
@@ -1842,6 +4442,7 @@ async def import_creditfactuur_particulier(request: CopyPasteImportRequest):
         failed_imports = []
         auto_matched = 0
         
+        match_started = time.perf_counter()
         for i, correction_data in enumerate(corrections):
             try:
                 correction_type = "creditfactuur_particulier"
@@ -1893,7 +4494,7 @@ async def import_creditfactuur_particulier(request: CopyPasteImportRequest):
                         corrected_amount = original['amount'] + correction.amount  # correction.amount is negative, so this subtracts
                         await db.transactions.update_one(
                             {"id": original['id']},
-                            {"$set": {"amount": corrected_amount}}
+                            amount_change(original, corrected_amount)
                         )
                 
                 # Enhanced automatic matching if invoice number match failed
@@ -1921,7 +4522,7 @@ async def import_creditfactuur_particulier(request: CopyPasteImportRequest):
                             corrected_amount = potential['amount'] - correction.amount
                             await db.transactions.update_one(
                                 {"id": potential['id']},
-                                {"$set": {"amount": corrected_amount}}
+                                amount_change(potential, corrected_amount)
                             )
                             break
                 
@@ -1934,13 +4535,16 @@ async def import_creditfactuur_particulier(request: CopyPasteImportRequest):
                 failed_imports.append(f"Rij {i+2}: {str(e)}")
                 continue
         
+        timer.add('match_insert', time.perf_counter() - match_started, successful_imports)
+        
         return {
             "message": f"Import voltooid: {successful_imports} creditfacturen geïmporteerd",
             "successful_imports": successful_imports,
             "failed_imports": len(failed_imports),
             "auto_matched": auto_matched,
             "errors": failed_imports[:10],
-            "total_corrections": len(corrections)
+            "total_corrections": len(corrections),
+            "timings": timer.finish(successful_imports=successful_imports, auto_matched=auto_matched)
         }
         
     except Exception as e:
@@ -1959,7 +4563,10 @@ async def import_creditdeclaratie_verzekeraar(request: CopyPasteImportRequest):
             "bedrag"             # Credit amount (negative)
         ]
         
-        corrections = parse_copy_paste_data(request.data, expected_columns)
+        timer = ImportTimer('import_correcties', import_type='creditdeclaratie_verzekeraar')
+        with timer.stage('parse') as stage:
+            corrections = await run_import_task(parse_copy_paste_data, request.data, expected_columns)
+            stage['rows'] = len(corrections)
         
         if not corrections:
             raise HTTPException(status_code=400, detail="Geen geldige creditdeclaraties gevonden")
@@ -1968,6 +4575,7 @@ async def import_creditdeclaratie_verzekeraar(request: CopyPasteImportRequest):
         failed_imports = []
         auto_matched = 0
         
+        match_started = time.perf_counter()
         for i, correction_data in enumerate(corrections):
             try:
                 correction_date = correction_data.get('datum')
@@ -2009,7 +4617,7 @@ async def import_creditdeclaratie_verzekeraar(request: CopyPasteImportRequest):
                         corrected_amount = original['amount'] + correction.amount  # correction.amount is negative
                         await db.transactions.update_one(
                             {"id": original['id']},
-                            {"$set": {"amount": corrected_amount}}
+                            amount_change(original, corrected_amount)
                         )
                 
                 correction_dict = prepare_for_mongo(correction.dict())
@@ -2020,13 +4628,16 @@ async def import_creditdeclaratie_verzekeraar(request: CopyPasteImportRequest):
                 failed_imports.append(f"Rij {i+2}: {str(e)}")
                 continue
         
+        timer.add('match_insert', time.perf_counter() - match_started, successful_imports)
+        
         return {
             "message": f"Import voltooid: {successful_imports} creditdeclaraties geïmporteerd",
             "successful_imports": successful_imports,
             "failed_imports": len(failed_imports),
             "auto_matched": auto_matched,
             "errors": failed_imports[:10],
-            "total_corrections": len(corrections)
+            "total_corrections": len(corrections),
+            "timings": timer.finish(successful_imports=successful_imports, auto_matched=auto_matched)
         }
         
     except Exception as e:
@@ -2045,7 +4656,10 @@ async def import_correctiefactuur_verzekeraar(request: CopyPasteImportRequest):
             "bedrag"             # Correction amount (negative)
         ]
         
-        corrections = parse_copy_paste_data(request.data, expected_columns)
+        timer = ImportTimer('import_correcties', import_type='correctiefactuur_verzekeraar')
+        with timer.stage('parse') as stage:
+            corrections = await run_import_task(parse_copy_paste_data, request.data, expected_columns)
+            stage['rows'] = len(corrections)
         
         if not corrections:
             raise HTTPException(status_code=400, detail="Geen geldige correctiefacturen gevonden")
@@ -2054,6 +4668,7 @@ async def import_correctiefactuur_verzekeraar(request: CopyPasteImportRequest):
         failed_imports = []
         auto_matched = 0
         
+        match_started = time.perf_counter()
         for i, correction_data in enumerate(corrections):
             try:
                 correction_date = correction_data.get('datum')
@@ -2098,7 +4713,7 @@ async def import_correctiefactuur_verzekeraar(request: CopyPasteImportRequest):
                         corrected_amount = original['amount'] + correctie_bedrag
                         await db.transactions.update_one(
                             {"id": original['id']},
-                            {"$set": {"amount": corrected_amount}}
+                            amount_change(original, corrected_amount)
                         )
                 
                 correction_dict = prepare_for_mongo(correction.dict())
@@ -2109,13 +4724,16 @@ async def import_correctiefactuur_verzekeraar(request: CopyPasteImportRequest):
                 failed_imports.append(f"Rij {i+2}: {str(e)}")
                 continue
         
+        timer.add('match_insert', time.perf_counter() - match_started, successful_imports)
+        
         return {
             "message": f"Import voltooid: {successful_imports} correctiefacturen geïmporteerd",
             "successful_imports": successful_imports,
             "failed_imports": len(failed_imports),
             "auto_matched": auto_matched,
             "errors": failed_imports[:10],
-            "total_corrections": len(corrections)
+            "total_corrections": len(corrections),
+            "timings": timer.finish(successful_imports=successful_imports, auto_matched=auto_matched)
         }
         
     except Exception as e:
@@ -2129,17 +4747,21 @@ async def cleanup_all_data():
         # Delete all collections
         await db.transactions.delete_many({})
         await db.crediteuren.delete_many({})
+        await invalidate_match_indexes()
         await db.verzekeraars.delete_many({})
         await db.correcties.delete_many({})
         await db.bank_transactions.delete_many({})
+        await db.reconciliation_candidates.delete_many({})
         await db.bank_saldos.delete_many({})
         await db.overige_omzet.delete_many({})
+        await db.counterparties.delete_many({})
+        await invalidate_counterparty_registry()
         
         return {
             "message": "Alle data succesvol verwijderd",
             "deleted_collections": [
                 "transactions", "crediteuren", "verzekeraars", 
-                "correcties", "bank_transactions", "bank_saldos", "overige_omzet"
+                "correcties", "bank_transactions", "bank_saldos", "overige_omzet", "counterparties"
             ]
         }
     except Exception as e:
@@ -2181,6 +4803,192 @@ async def cleanup_bank_transactions():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting bank transactions: {str(e)}")
 
+# Snapshot Endpoints
+# A snapshot stores every collection as one gzip-compressed columnar JSON file:
+# {"count": n, "columns": {field: [values]}, "missing": {field: [row indexes]}}.
+# Storing per-field arrays compresses far better than row documents and restores
+# with a handful of insert_many calls per collection.
+SNAPSHOT_DIR = Path(os.environ.get('SNAPSHOT_DIR', ROOT_DIR / 'snapshots'))
+SNAPSHOT_COLLECTIONS = [
+    "transactions", "bank_transactions", "correcties", "crediteuren", "verzekeraars",
+    "bank_saldos", "overige_omzet", "vaste_kosten", "variabele_kosten", "reconciliations",
+    "column_mapping_profiles", "counterparties", "classification_rules"
+]
+SNAPSHOT_FORMAT = "columnar-json-gzip-v1"
+SNAPSHOT_RESTORE_BATCH_SIZE = 1000
+SNAPSHOT_NAME_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')  # Always applied with fullmatch
+
+def documents_to_columns(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn row documents into per-field columns, remembering which rows lack a field"""
+    fields = []
+    seen = set()
+    for document in documents:
+        for field in document:
+            if field not in seen:
+                seen.add(field)
+                fields.append(field)
+    
+    columns = {field: [] for field in fields}
+    missing = {}
+    for index, document in enumerate(documents):
+        for field in fields:
+            if field in document:
+                columns[field].append(document[field])
+            else:
+                columns[field].append(None)
+                missing.setdefault(field, []).append(index)
+    return {"count": len(documents), "columns": columns, "missing": missing}
+
+def columns_to_documents(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Inverse of documents_to_columns"""
+    documents = [{} for _ in range(table['count'])]
+    for field, values in table['columns'].items():
+        missing = set(table.get('missing', {}).get(field, []))
+        for index, value in enumerate(values):
+            if index not in missing:
+                documents[index][field] = value
+    return documents
+
+def read_snapshot_collection(snapshot_path: Path, collection_name: str, expected_count: int) -> List[Dict[str, Any]]:
+    """Documents of one snapshot file, checked against the manifest before anything is replaced"""
+    try:
+        with gzip.open(snapshot_path / f"{collection_name}.json.gz", 'rt', encoding='utf-8') as f:
+            table = json.load(f)
+        if table['count'] != expected_count or any(len(values) != expected_count for values in table['columns'].values()):
+            raise ValueError("aantal rijen klopt niet met het manifest")
+        return columns_to_documents(table)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Snapshot bestand {collection_name} is beschadigd: {str(e)}")
+
+def get_snapshot_path(name: str) -> Path:
+    if not SNAPSHOT_NAME_PATTERN.fullmatch(name):
+        raise HTTPException(status_code=400, detail="Ongeldige snapshot naam")
+    return SNAPSHOT_DIR / name
+
+@api_router.post("/snapshots")
+async def create_snapshot(name: Optional[str] = Query(None, description="Naam van de snapshot (standaard: tijdstempel)")):
+    """Export all collections to compressed columnar files on local disk"""
+    try:
+        name = name or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        snapshot_path = get_snapshot_path(name)
+        if snapshot_path.exists():
+            raise HTTPException(status_code=400, detail=f"Snapshot {name} bestaat al")
+        # Written under a name no snapshot can have and renamed when complete, so a failed
+        # export never shows up as a snapshot
+        temp_path = SNAPSHOT_DIR / f".{name}.{uuid.uuid4().hex}.tmp"
+        temp_path.mkdir(parents=True)
+        
+        try:
+            counts = {}
+            for collection_name in SNAPSHOT_COLLECTIONS:
+                documents = await db[collection_name].find({}, {"_id": 0}).to_list(None)
+                with gzip.open(temp_path / f"{collection_name}.json.gz", 'wt', encoding='utf-8') as f:
+                    json.dump(documents_to_columns(documents), f, default=str, separators=(',', ':'))
+                counts[collection_name] = len(documents)
+            
+            manifest = {
+                "name": name,
+                "format": SNAPSHOT_FORMAT,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "collections": counts
+            }
+            with open(temp_path / "manifest.json", 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            temp_path.rename(snapshot_path)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        
+        return manifest
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating snapshot: {str(e)}")
+
+@api_router.get("/snapshots")
+async def get_snapshots():
+    """List available snapshots"""
+    try:
+        snapshots = []
+        if SNAPSHOT_DIR.exists():
+            for manifest_path in SNAPSHOT_DIR.glob("*/manifest.json"):
+                if not SNAPSHOT_NAME_PATTERN.fullmatch(manifest_path.parent.name):
+                    continue  # Export still being written
+                with open(manifest_path, encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+        snapshots.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        return snapshots
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching snapshots: {str(e)}")
+
+@api_router.post("/snapshots/{name}/restore")
+async def restore_snapshot(name: str):
+    """DANGEROUS: Replace all collections with the contents of a snapshot"""
+    try:
+        snapshot_path = get_snapshot_path(name)
+        manifest_path = snapshot_path / "manifest.json"
+        if not manifest_path.exists():
+            raise HTTPException(status_code=404, detail="Snapshot niet gevonden")
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != SNAPSHOT_FORMAT:
+            raise HTTPException(status_code=400, detail=f"Onbekend snapshot formaat: {manifest.get('format')}")
+        
+        # Read and check every file before the first collection is cleared
+        contents = {
+            collection_name: await run_import_task(read_snapshot_collection, snapshot_path, collection_name, count)
+            for collection_name, count in manifest['collections'].items()
+            if collection_name in SNAPSHOT_COLLECTIONS
+        }
+        
+        restored = {}
+        for collection_name, documents in contents.items():
+            if collection_name in REFERENCE_NAME_FIELDS:
+                # Older snapshots may hold duplicate names; leave the key off so the unique index
+                # accepts them and normalize_reference_names merges them below
+                seen_keys = set()
+                for document in documents:
+                    if document.get('name_key') in seen_keys:
+                        del document['name_key']
+                    elif document.get('name_key'):
+                        seen_keys.add(document['name_key'])
+            await db[collection_name].delete_many({})
+            for start in range(0, len(documents), SNAPSHOT_RESTORE_BATCH_SIZE):
+                await db[collection_name].insert_many(
+                    documents[start:start + SNAPSHOT_RESTORE_BATCH_SIZE], ordered=False
+                )
+            restored[collection_name] = len(documents)
+        for collection_name, (name_field, kind) in REFERENCE_NAME_FIELDS.items():
+            await normalize_reference_names(db[collection_name], name_field, kind)
+        await backfill_open_amounts()
+        await invalidate_match_indexes()
+        await invalidate_counterparty_registry()
+        # Candidates are derived data and not part of a snapshot
+        await db.reconciliation_candidates.delete_many({})
+        
+        return {
+            "message": f"Snapshot {name} teruggezet",
+            "restored_collections": restored
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error restoring snapshot: {str(e)}")
+
+@api_router.delete("/snapshots/{name}")
+async def delete_snapshot(name: str):
+    """Delete a snapshot from disk"""
+    try:
+        snapshot_path = get_snapshot_path(name)
+        if not (snapshot_path / "manifest.json").exists():
+            raise HTTPException(status_code=404, detail="Snapshot niet gevonden")
+        shutil.rmtree(snapshot_path)
+        return {"message": f"Snapshot {name} verwijderd"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting snapshot: {str(e)}")
+
 # Copy-Paste Import Endpoints
 @api_router.post("/copy-paste-import/preview", response_model=CopyPasteImportResult)
 async def preview_copy_paste_import(request: CopyPasteImportRequest):
@@ -2188,107 +4996,137 @@ async def preview_copy_paste_import(request: CopyPasteImportRequest):
     try:
         if request.import_type == 'verzekeraars':
             expected_columns = ['naam', 'termijn']
-            parsed_data = parse_copy_paste_data(request.data, expected_columns)
-            
-            preview_items = []
-            valid_count = 0
-            error_count = 0
-            
-            for i, row in enumerate(parsed_data, 1):
-                item = validate_verzekeraar_data(row, i)
-                preview_items.append(item.dict())
-                if item.import_status == 'valid':
-                    valid_count += 1
-                else:
-                    error_count += 1
-        
+            validate_row = validate_verzekeraar_data
         elif request.import_type == 'crediteuren':
             expected_columns = ['crediteur', 'bedrag', 'dag']
-            parsed_data = parse_copy_paste_data(request.data, expected_columns)
-            
-            preview_items = []
-            valid_count = 0
-            error_count = 0
-            
-            for i, row in enumerate(parsed_data, 1):
-                item = validate_crediteur_data(row, i)
-                preview_items.append(item.dict())
-                if item.import_status == 'valid':
-                    valid_count += 1
-                else:
-                    error_count += 1
-        
+            validate_row = validate_crediteur_data
         else:
             raise HTTPException(status_code=400, detail=f"Onbekend import type: {request.import_type}")
         
+        timer = ImportTimer('copy_paste_preview', import_type=request.import_type)
+        with timer.stage('parse_validate') as stage:
+            items = await run_import_task(parse_and_validate_copy_paste, request.data, expected_columns, validate_row)
+            stage['rows'] = len(items)
+        
+        preview_items = [item.dict() for item in items]
+        valid_count = sum(1 for item in items if item.import_status == 'valid')
+        error_count = len(items) - valid_count
+        
         return CopyPasteImportResult(
             success=True,
             imported_count=valid_count,
             error_count=error_count,
             errors=[],
-            preview_data=preview_items
+            preview_data=preview_items,
+            timings=timer.finish(total_rows=len(items))
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Preview fout: {str(e)}")
 
+async def insert_reference_record(collection, mongo_dict: Dict[str, Any], label: str) -> Dict[str, Any]:
+    """Insert a verzekeraar/crediteur; name_key is unique, so a deactivated record with the same
+    name is reactivated with the new values instead. Returns the stored document."""
+    try:
+        await collection.insert_one(mongo_dict)
+        mongo_dict.pop('_id', None)
+        return mongo_dict
+    except DuplicateKeyError:
+        fields = {field: value for field, value in mongo_dict.items() if field not in ('_id', 'id', 'created_at')}
+        existing = await collection.find_one_and_update(
+            {"name_key": mongo_dict['name_key'], "actief": False}, {"$set": fields},
+            return_document=ReturnDocument.AFTER
+        )
+        if existing is None:
+            raise HTTPException(status_code=400, detail=f"{label} bestaat al")
+        existing.pop('_id', None)
+        return existing
+
+async def upsert_reference_records(collection, model, records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Upsert verzekeraars/crediteuren in one bulk_write keyed on the normalized name.
+    
+    Only the pasted fields are set on existing records, and a pasted record is active again; the
+    other model defaults (id, created_at, iban) apply to new records alone, so data learned or
+    entered since is kept.
+    """
+    if not records:
+        return {"upserted_count": 0, "modified_count": 0, "created_ids": []}
+    
+    operations = []
+    insert_ids = []
+    for name_key, mapped_data in records.items():
+        record_dict = prepare_for_mongo(model(**mapped_data).dict())
+        pasted = {field: record_dict.pop(field) for field in mapped_data if field in record_dict}
+        pasted['name_key'] = name_key
+        pasted['actief'] = record_dict.pop('actief', True)
+        operations.append(UpdateOne(
+            {"name_key": name_key},
+            {"$set": pasted, "$setOnInsert": record_dict},
+            upsert=True
+        ))
+        insert_ids.append(record_dict['id'])
+    
+    result = await collection.bulk_write(operations, ordered=False)
+    return {
+        "upserted_count": result.upserted_count,
+        "modified_count": result.modified_count,
+        "created_ids": [insert_ids[index] for index in result.upserted_ids]
+    }
+
 @api_router.post("/copy-paste-import/execute", response_model=ImportResult)
 async def execute_copy_paste_import(request: CopyPasteImportRequest):
     """Execute copy-paste import"""
     try:
-        imported_count = 0
         error_count = 0
         errors = []
-        created_ids = []
+        records = {}  # name_key -> mapped data; a name pasted twice keeps its last row
         
         if request.import_type == 'verzekeraars':
             expected_columns = ['naam', 'termijn']
-            parsed_data = parse_copy_paste_data(request.data, expected_columns)
-            
-            for i, row in enumerate(parsed_data, 1):
-                try:
-                    item = validate_verzekeraar_data(row, i)
-                    if item.import_status == 'valid':
-                        verzekeraar = Verzekeraar(**item.mapped_data)
-                        verzekeraar_dict = prepare_for_mongo(verzekeraar.dict())
-                        await db.verzekeraars.insert_one(verzekeraar_dict)
-                        imported_count += 1
-                        created_ids.append(verzekeraar.id)
-                    else:
-                        error_count += 1
-                        errors.extend([f"Rij {i}: {err}" for err in item.validation_errors])
-                except Exception as e:
-                    error_count += 1
-                    errors.append(f"Rij {i}: {str(e)}")
-        
+            validate_row = validate_verzekeraar_data
+            collection, name_field, model = db.verzekeraars, 'naam', Verzekeraar
         elif request.import_type == 'crediteuren':
             expected_columns = ['crediteur', 'bedrag', 'dag']
-            parsed_data = parse_copy_paste_data(request.data, expected_columns)
-            
-            for i, row in enumerate(parsed_data, 1):
-                try:
-                    item = validate_crediteur_data(row, i)
-                    if item.import_status == 'valid':
-                        crediteur = Crediteur(**item.mapped_data)
-                        crediteur_dict = prepare_for_mongo(crediteur.dict())
-                        await db.crediteuren.insert_one(crediteur_dict)
-                        imported_count += 1
-                        created_ids.append(crediteur.id)
-                    else:
-                        error_count += 1
-                        errors.extend([f"Rij {i}: {err}" for err in item.validation_errors])
-                except Exception as e:
+            validate_row = validate_crediteur_data
+            collection, name_field, model = db.crediteuren, 'crediteur', Crediteur
+        else:
+            raise HTTPException(status_code=400, detail=f"Onbekend import type: {request.import_type}")
+        
+        timer = ImportTimer('copy_paste_execute', import_type=request.import_type)
+        with timer.stage('parse_validate') as stage:
+            items = await run_import_task(parse_and_validate_copy_paste, request.data, expected_columns, validate_row)
+            stage['rows'] = len(items)
+        
+        for i, item in enumerate(items, 1):
+            try:
+                if item.import_status == 'valid':
+                    records[normalize_name(item.mapped_data[name_field])] = item.mapped_data
+                else:
                     error_count += 1
-                    errors.append(f"Rij {i}: {str(e)}")
+                    errors.extend([f"Rij {i}: {err}" for err in item.validation_errors])
+            except Exception as e:
+                error_count += 1
+                errors.append(f"Rij {i}: {str(e)}")
+        
+        # Re-pasting an unchanged list matches every record without modifying it
+        with timer.stage('upsert') as stage:
+            upsert_result = await upsert_reference_records(collection, model, records)
+            stage['rows'] = len(records)
+        await invalidate_match_indexes()
+        if request.import_type == 'crediteuren':
+            await discard_reconciliation_candidates(outgoing=True)
         
         return ImportResult(
             success=True,
-            imported_count=imported_count,
+            imported_count=upsert_result['upserted_count'] + upsert_result['modified_count'],
             error_count=error_count,
             errors=errors[:10],  # Limit errors
-            created_transactions=created_ids
+            created_transactions=upsert_result['created_ids'],
+            timings=timer.finish(imported_count=upsert_result['upserted_count'] + upsert_result['modified_count'])
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Import fout: {str(e)}")
 
@@ -2308,11 +5146,128 @@ async def create_verzekeraar(verzekeraar: VerzekeraarCreate):
     try:
         verzekeraar_obj = Verzekeraar(**verzekeraar.dict())
         mongo_dict = prepare_for_mongo(verzekeraar_obj.dict())
-        await db.verzekeraars.insert_one(mongo_dict)
-        return verzekeraar_obj
+        mongo_dict['name_key'] = normalize_name(verzekeraar_obj.naam)
+        stored = await insert_reference_record(db.verzekeraars, mongo_dict, f"Verzekeraar {verzekeraar_obj.naam}")
+        await invalidate_match_indexes()
+        return Verzekeraar(**parse_from_mongo(stored))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating verzekeraar: {str(e)}")
 
+# Recurring payment detection
+RECURRING_MIN_PAYMENTS = 3
+RECURRING_INTERVAL_DAYS = (26, 35)  # Median days between payments for a monthly crediteur
+RECURRING_MAX_INTERVAL_VARIATION = 0.2  # Std/mean of the intervals
+RECURRING_MAX_AMOUNT_VARIATION = 0.1  # Std/mean of the amounts
+RECURRING_MAX_SILENCE_DAYS = 45  # Last payment at most this long before the newest bank row
+
+def _group_medians(codes: np.ndarray, values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Median of values per group, for the groups with the given starts and counts in code order"""
+    ordered = values[np.lexsort((values, codes))]
+    return (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+
+def detect_recurring_payments(bank_rows: List[Dict[str, Any]], min_payments: int = RECURRING_MIN_PAYMENTS) -> List[Dict[str, Any]]:
+    """Counterparties that are paid monthly on a stable day with a stable amount.
+    
+    The outgoing rows are grouped on counterparty_key and all statistics are computed with numpy
+    over the whole history at once; only the groups that pass are turned into dicts.
+    """
+    rows = [row for row in bank_rows if row.get('counterparty_key') and row.get('amount', 0) < 0 and row.get('date')]
+    if not rows:
+        return []
+    keys, codes = np.unique([row['counterparty_key'] for row in rows], return_inverse=True)
+    days = np.array([str(row['date'])[:10] for row in rows], dtype='datetime64[D]')
+    amounts = np.abs(np.array([row['amount'] for row in rows], dtype=float))
+    
+    # Sort by group, then date: each group is one contiguous run
+    order = np.lexsort((days, codes))
+    codes, days, amounts = codes[order], days[order], amounts[order]
+    counts = np.bincount(codes, minlength=len(keys))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ends = starts + counts - 1
+    
+    intervals = np.diff(days).astype(float)
+    same_group = codes[1:] == codes[:-1]
+    interval_codes, intervals = codes[1:][same_group], intervals[same_group]
+    interval_counts = np.bincount(interval_codes, minlength=len(keys))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        interval_mean = np.bincount(interval_codes, weights=intervals, minlength=len(keys)) / interval_counts
+        interval_sq = np.bincount(interval_codes, weights=intervals ** 2, minlength=len(keys)) / interval_counts
+        interval_variation = np.sqrt(np.maximum(interval_sq - interval_mean ** 2, 0)) / interval_mean
+        amount_mean = np.bincount(codes, weights=amounts, minlength=len(keys)) / counts
+        amount_sq = np.bincount(codes, weights=amounts ** 2, minlength=len(keys)) / counts
+        amount_variation = np.sqrt(np.maximum(amount_sq - amount_mean ** 2, 0)) / amount_mean
+    interval_median = np.full(len(keys), np.nan)
+    has_intervals = interval_counts > 0
+    if has_intervals.any():
+        interval_starts = np.concatenate(([0], np.cumsum(interval_counts)[:-1]))
+        interval_median[has_intervals] = _group_medians(
+            interval_codes, intervals, interval_starts[has_intervals], interval_counts[has_intervals]
+        )
+    amount_median = _group_medians(codes, amounts, starts, counts)
+    day_of_month = (days - days.astype('datetime64[M]')).astype(int) + 1
+    day_median = _group_medians(codes, day_of_month.astype(float), starts, counts)
+    
+    recurring = (
+        (counts >= min_payments)
+        & (interval_median >= RECURRING_INTERVAL_DAYS[0]) & (interval_median <= RECURRING_INTERVAL_DAYS[1])
+        & (interval_variation <= RECURRING_MAX_INTERVAL_VARIATION)
+        & (amount_variation <= RECURRING_MAX_AMOUNT_VARIATION)
+        & ((days.max() - days[ends]).astype(int) <= RECURRING_MAX_SILENCE_DAYS)
+    )
+    
+    rows = [rows[index] for index in order]
+    detected = []
+    for code in np.flatnonzero(recurring):
+        last = rows[ends[code]]
+        detected.append({
+            "counterparty_key": str(keys[code]),
+            "crediteur": last.get('counterparty') or str(keys[code]),
+            "bedrag": round(float(amount_median[code]), 2),
+            "dag": int(np.floor(day_median[code])),
+            "iban": normalize_iban(last.get('account_number')) or None,
+            "payments": int(counts[code]),
+            "interval_days": round(float(interval_median[code]), 1),
+            "interval_variation": round(float(interval_variation[code]), 3),
+            "amount_variation": round(float(amount_variation[code]), 3),
+            "first_date": str(days[starts[code]]),
+            "last_date": str(days[ends[code]])
+        })
+    return detected
+
+async def propose_recurring_crediteuren(min_payments: int = RECURRING_MIN_PAYMENTS) -> List[Dict[str, Any]]:
+    """Detected recurring payments as new crediteuren or as updates of the crediteur they belong to.
+    
+    An existing crediteur is found by IBAN or by its normalised name; proposals that would not
+    change it are left out.
+    """
+    bank_rows = await db.bank_transactions.find(
+        {"amount": {"$lt": 0}},
+        {"_id": 0, "date": 1, "amount": 1, "counterparty": 1, "counterparty_key": 1, "account_number": 1}
+    ).to_list(None)
+    crediteuren = await db.crediteuren.find({"actief": True}).to_list(None)
+    by_iban = {normalize_iban(crediteur.get('iban')): crediteur for crediteur in crediteuren if crediteur.get('iban')}
+    by_key = {counterparty_key(crediteur.get('crediteur')): crediteur for crediteur in crediteuren}
+    
+    proposals = []
+    for detected in detect_recurring_payments(bank_rows, min_payments):
+        existing = by_iban.get(detected['iban']) or by_key.get(detected['counterparty_key'])
+        if not existing:
+            proposals.append({**detected, "action": "nieuw", "crediteur_id": None})
+            continue
+        changed = (
+            abs(existing.get('bedrag', 0) - detected['bedrag']) > max(1.0, 0.02 * detected['bedrag'])
+            or existing.get('dag') != detected['dag']
+            or (detected['iban'] and normalize_iban(existing.get('iban')) != detected['iban'])
+        )
+        if changed:
+            proposals.append({
+                **detected, "action": "bijwerken", "crediteur_id": existing['id'], "crediteur": existing['crediteur'],
+                "huidig": {"bedrag": existing.get('bedrag'), "dag": existing.get('dag'), "iban": existing.get('iban')}
+            })
+    return proposals
+
 # Crediteuren endpoints  
 @api_router.get("/crediteuren", response_model=List[Crediteur])
 async def get_crediteuren():
@@ -2329,11 +5284,73 @@ async def create_crediteur(crediteur: CrediteurCreate):
     try:
         crediteur_obj = Crediteur(**crediteur.dict())
         mongo_dict = prepare_for_mongo(crediteur_obj.dict())
-        await db.crediteuren.insert_one(mongo_dict)
-        return crediteur_obj
+        mongo_dict['name_key'] = normalize_name(crediteur_obj.crediteur)
+        stored = await insert_reference_record(db.crediteuren, mongo_dict, f"Crediteur {crediteur_obj.crediteur}")
+        await invalidate_match_indexes()
+        await discard_reconciliation_candidates(outgoing=True)
+        return Crediteur(**parse_from_mongo(stored))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating crediteur: {str(e)}")
 
+@api_router.get("/crediteuren/recurring")
+async def get_recurring_crediteuren(min_payments: int = Query(RECURRING_MIN_PAYMENTS, ge=2)):
+    """Crediteuren proposed from monthly recurring outgoing bank payments"""
+    try:
+        return await propose_recurring_crediteuren(min_payments)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error detecting recurring payments: {str(e)}")
+
+@api_router.post("/crediteuren/recurring/apply")
+async def apply_recurring_crediteuren(request: RecurringCrediteurApplyRequest,
+                                      min_payments: int = Query(RECURRING_MIN_PAYMENTS, ge=2)):
+    """Create or update the proposed crediteuren in bulk.
+    
+    The proposals are detected again here, so only what the bank history supports is written.
+    """
+    try:
+        proposals = await propose_recurring_crediteuren(min_payments)
+        if request.counterparty_keys is not None:
+            selected = set(request.counterparty_keys)
+            proposals = [proposal for proposal in proposals if proposal['counterparty_key'] in selected]
+        
+        # New crediteuren are upserted on name_key, so a deactivated crediteur of the same name
+        # comes back with the detected bedrag and dag instead of colliding with it
+        new_crediteuren = {}
+        updates = []
+        for proposal in proposals:
+            if proposal['action'] == 'nieuw':
+                fields = {"crediteur": proposal['crediteur'], "bedrag": proposal['bedrag'], "dag": proposal['dag']}
+                if proposal['iban']:
+                    fields["iban"] = proposal['iban']
+                new_crediteuren[normalize_name(proposal['crediteur'])] = fields
+            else:
+                fields = {"bedrag": proposal['bedrag'], "dag": proposal['dag']}
+                if proposal['iban']:
+                    fields["iban"] = proposal['iban']
+                updates.append(UpdateOne({"id": proposal['crediteur_id']}, {"$set": fields}))
+        
+        if new_crediteuren:
+            await upsert_reference_records(db.crediteuren, Crediteur, new_crediteuren)
+        if updates:
+            await db.crediteuren.bulk_write(updates, ordered=False)
+        if proposals:
+            await invalidate_match_indexes()
+            await discard_reconciliation_candidates(outgoing=True)
+        
+        return {
+            "message": f"{len(new_crediteuren)} crediteuren aangemaakt, {len(updates)} bijgewerkt",
+            "created_count": len(new_crediteuren),
+            "updated_count": len(updates),
+            "crediteuren": [
+                {"counterparty_key": proposal['counterparty_key'], "crediteur": proposal['crediteur'], "action": proposal['action']}
+                for proposal in proposals
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error applying recurring crediteuren: {str(e)}")
+
 # Verwachte betalingen endpoint
 @api_router.get("/verwachte-betalingen")
 async def get_verwachte_betalingen():
@@ -2341,11 +5358,12 @@ async def get_verwachte_betalingen():
     try:
         verwachte_betalingen = []
         
-        # Get declaratie transactions that are not reconciled
+        # Get declaratie transactions with an amount still to be paid
         transactions = await db.transactions.find({
             "type": "income",
             "category": "zorgverzekeraar",
-            "reconciled": False
+            "reconciled": False,
+            "open_amount": {"$gt": 0}
         }).to_list(1000)
         
         # Get verzekeraars for payment terms
@@ -2371,7 +5389,7 @@ async def get_verwachte_betalingen():
                 'transaction_id': trans['id'],
                 'type': 'declaratie',
                 'beschrijving': f"Declaratie {trans.get('invoice_number', '')} - {patient_name}",
-                'bedrag': trans['amount'],
+                'bedrag': trans['open_amount'],
                 'verwachte_datum': verwachte_datum.isoformat(),
                 'status': 'open' if verwachte_datum >= date.today() else 'overdue'
             }
@@ -2438,6 +5456,7 @@ async def get_cashflow_forecast(days: int = 30):
         transactions = await db.transactions.find({
             "type": "income",
             "reconciled": False,
+            "open_amount": {"$gt": 0},
             "date": {"$gte": min_transaction_date.isoformat()}  # Only recent transactions
         }).to_list(500)  # Reduced limit
         
@@ -2467,26 +5486,17 @@ async def get_cashflow_forecast(days: int = 30):
             
             # Only include if payment date is in the future (within forecast period)
             if verwachte_datum >= start_date and verwachte_datum <= start_date + timedelta(days=days):
-                # Apply any corrections to this transaction
+                # The open amount already reflects corrections and partial payments
                 original_amount = trans['amount']
-                corrected_amount = original_amount
-                
-                # Find corrections for this transaction
-                corrections = await db.correcties.find({
-                    "original_transaction_id": trans['id'],
-                    "matched": True
-                }).to_list(10)
+                corrected_amount = trans['open_amount']
                 
-                for correction in corrections:
-                    corrected_amount += correction.get('amount', 0)  # Corrections are usually negative
-                
-                # Only include if there's still an amount to expect after corrections
+                # Only include if there's still an amount to expect
                 if corrected_amount > 0:
                     verwachte_betalingen.append({
                         'datum': verwachte_datum,
                         'bedrag': corrected_amount,  # Use corrected amount
                         'type': 'inkomst',
-                        'beschrijving': f"Declaratie {trans.get('invoice_number', '')} (gecorrigeerd: €{corrected_amount:.2f})" if corrected_amount != original_amount else f"Declaratie {trans.get('invoice_number', '')}",
+                        'beschrijving': f"Declaratie {trans.get('invoice_number', '')} (open: €{corrected_amount:.2f})" if corrected_amount != original_amount else f"Declaratie {trans.get('invoice_number', '')}",
                         'transaction_id': trans['id'],
                         'transaction_type': 'declaratie',
                         'original_data': {
@@ -2734,7 +5744,237 @@ async def get_dashboard_summary():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting dashboard summary: {str(e)}")
 
+# Classification rules
+# Recurring costs (rent, energy, subscriptions) are recognised by IBAN, counterparty name or
+# description pattern. Rules are learned from earlier classifications and applied in bulk.
+CLASSIFICATION_RULE_FIELDS = ['iban', 'counterparty', 'description']  # Most specific first
+CLASSIFICATION_COLLECTIONS = {'vast': 'vaste_kosten', 'variabel': 'variabele_kosten'}
+# Classifications that must back a rule before it fires; a description pattern such as
+# 'sepa incasso' is shared by unrelated costs, so one example is not enough there
+CLASSIFICATION_RULE_MIN_HITS = {'iban': 1, 'counterparty': 2, 'description': 3}
+DESCRIPTION_NOISE_WORDS = NAME_STOP_WORDS | {
+    'januari', 'februari', 'maart', 'april', 'mei', 'juni', 'juli', 'augustus', 'september', 'oktober', 'november', 'december',
+    'jan', 'feb', 'mrt', 'apr', 'jun', 'jul', 'aug', 'sep', 'okt', 'nov', 'dec', 'ref', 'kenmerk', 'nr', 'nummer'
+}
+
+def description_pattern(description: Optional[str]) -> str:
+    """Description without amounts, dates and references: 'Huur maart 2024 ref 8812' -> 'huur'"""
+    words = [word for word in re.findall(r"[a-z]+", (description or '').lower()) if len(word) > 1 and word not in DESCRIPTION_NOISE_WORDS]
+    return ' '.join(words[:6])
+
+def classification_keys(bank_transaction: Dict[str, Any]) -> List[tuple]:
+    """(match_field, pattern) keys of a bank row, most specific first"""
+    values = {
+        'iban': normalize_iban(bank_transaction.get('account_number')),
+        'counterparty': normalize_name(bank_transaction.get('counterparty') or ''),
+        'description': description_pattern(bank_transaction.get('description'))
+    }
+    return [(field, values[field]) for field in CLASSIFICATION_RULE_FIELDS if values[field]]
+
+def build_classification(bank_transaction: Dict[str, Any], classification_type: str, category_name: str,
+                         rule_id: Optional[str] = None) -> Dict[str, Any]:
+    """vaste_kosten/variabele_kosten record for a classified bank row"""
+    return {
+        'id': str(uuid.uuid4()),
+        'bank_transaction_id': bank_transaction['id'],
+        'classification_type': classification_type,  # 'vast' of 'variabel'
+        'category_name': category_name,
+        'amount': abs(bank_transaction['amount']),  # Store as positive amount
+        'date': bank_transaction.get('date'),
+        'description': bank_transaction.get('description', ''),
+        'counterparty': bank_transaction.get('counterparty') or '',
+        'rule_id': rule_id,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'active': True
+    }
+
+async def apply_classifications(assignments: List[tuple]) -> List[Dict[str, Any]]:
+    """Classify (bank transaction, type, category, rule id) tuples with one write per collection.
+    
+    The bank rows are claimed first, so rows matched or classified concurrently are skipped;
+    if the cost records cannot be written the claim is released again. Returns the
+    classification records written.
+    """
+    if not assignments:
+        return []
+    claim_id = str(uuid.uuid4())
+    claimed = await claim_unreconciled(db.bank_transactions, [assignment[0]['id'] for assignment in assignments], claim_id)
+    records = [
+        build_classification(bank_transaction, classification_type, category_name, rule_id)
+        for bank_transaction, classification_type, category_name, rule_id in assignments
+        if bank_transaction['id'] in claimed
+    ]
+    try:
+        for classification_type, collection_name in CLASSIFICATION_COLLECTIONS.items():
+            documents = [record for record in records if record['classification_type'] == classification_type]
+            if documents:
+                await db[collection_name].insert_many(documents)
+    except Exception:
+        record_ids = [record['id'] for record in records]
+        for collection_name in CLASSIFICATION_COLLECTIONS.values():
+            await db[collection_name].delete_many({"id": {"$in": record_ids}})
+        await release_claim(db.bank_transactions, claimed, claim_id)
+        raise
+    if records:
+        reconciled_date = datetime.now(timezone.utc).isoformat()
+        await db.bank_transactions.bulk_write([
+            UpdateOne({"id": record['bank_transaction_id'], "reconciliation_claim": claim_id}, {"$set": {
+                "reconciled_date": reconciled_date,
+                "classification_type": record['classification_type'],
+                "classification_id": record['id']
+            }})
+            for record in records
+        ], ordered=False)
+        await discard_reconciliation_candidates([record['bank_transaction_id'] for record in records])
+    return records
+
+async def learn_classification_rules(bank_transaction_ids: Optional[List[str]] = None) -> int:
+    """Turn classified bank rows (default: all of them) into rules, one per IBAN, counterparty and
+    description pattern. Per key the type and category seen most often over all classifications
+    win; a full run recounts from scratch, otherwise the new rows are added to the stored counts.
+    Returns the number of rules written; failures are logged, since a classification must not
+    fail on learning."""
+    try:
+        return await _learn_classification_rules(bank_transaction_ids)
+    except Exception as e:
+        logger.warning(f"Learning classification rules failed: {str(e)}")
+        return 0
+
+async def _learn_classification_rules(bank_transaction_ids: Optional[List[str]]) -> int:
+    query = {"active": True}
+    if bank_transaction_ids is not None:
+        if not bank_transaction_ids:
+            return 0
+        query["bank_transaction_id"] = {"$in": list(bank_transaction_ids)}
+    classifications = []
+    for collection_name in CLASSIFICATION_COLLECTIONS.values():
+        classifications += await db[collection_name].find(
+            query, {"_id": 0, "bank_transaction_id": 1, "classification_type": 1, "category_name": 1}
+        ).to_list(None)
+    bank_by_id = {
+        bank['id']: bank async for bank in db.bank_transactions.find(
+            {"id": {"$in": [classification.get('bank_transaction_id') for classification in classifications]}},
+            {"_id": 0, "id": 1, "account_number": 1, "counterparty": 1, "description": 1}
+        )
+    }
+    
+    seen = {}
+    for classification in classifications:
+        bank = bank_by_id.get(classification.get('bank_transaction_id'))
+        if not bank:
+            continue
+        target = (classification['classification_type'], classification['category_name'])
+        for key in classification_keys(bank):
+            counts = seen.setdefault(key, {})
+            counts[target] = counts.get(target, 0) + 1
+    if not seen:
+        return 0
+    
+    created_at = datetime.now(timezone.utc).isoformat()
+    await record_learned_targets(
+        db.classification_rules,
+        [({"match_field": match_field, "pattern": pattern}, counts) for (match_field, pattern), counts in seen.items()],
+        ("classification_type", "category_name"), "hit_count", full=bank_transaction_ids is None,
+        insert_fields=lambda: {"id": str(uuid.uuid4()), "active": True, "applied_count": 0, "created_at": created_at}
+    )
+    return len(seen)
+
+async def match_classification_rules(bank_transactions: List[Dict[str, Any]]) -> List[tuple]:
+    """(bank transaction, type, category, rule id) for the outgoing rows an active rule covers.
+    Rules backed by fewer than CLASSIFICATION_RULE_MIN_HITS classifications are skipped."""
+    rules = {
+        (rule['match_field'], rule['pattern']): rule
+        async for rule in db.classification_rules.find({"active": True}, {"_id": 0})
+        if rule.get('hit_count', 0) >= CLASSIFICATION_RULE_MIN_HITS.get(rule['match_field'], 1)
+    }
+    assignments = []
+    for bank_transaction in bank_transactions:
+        if bank_transaction.get('amount', 0) >= 0:
+            continue
+        rule = next((rules[key] for key in classification_keys(bank_transaction) if key in rules), None)
+        if rule:
+            assignments.append((bank_transaction, rule['classification_type'], rule['category_name'], rule['id']))
+    return assignments
+
+async def apply_classification_rules(bank_transaction_ids: Optional[List[str]] = None, dry_run: bool = False) -> List[tuple]:
+    """Classify the open outgoing bank rows (default: all of them) that a rule covers"""
+    query = {"reconciled": False, "amount": {"$lt": 0}}
+    if bank_transaction_ids is not None:
+        query["id"] = {"$in": list(bank_transaction_ids)}
+    bank_transactions = await db.bank_transactions.find(query, {"_id": 0}).to_list(None)
+    assignments = await match_classification_rules(bank_transactions)
+    if dry_run or not assignments:
+        return assignments
+    
+    applied_ids = {record['bank_transaction_id'] for record in await apply_classifications(assignments)}
+    applied = [assignment for assignment in assignments if assignment[0]['id'] in applied_ids]
+    rule_counts = Counter(assignment[3] for assignment in applied)
+    if rule_counts:
+        await db.classification_rules.bulk_write([
+            UpdateOne({"id": rule_id}, {"$inc": {"applied_count": count}}) for rule_id, count in rule_counts.items()
+        ], ordered=False)
+    return applied
+
+async def classify_after_import(created_ids: List[str]):
+    """Background task after a bank import: rows a rule covers are classified straight away"""
+    try:
+        if created_ids:
+            await apply_classification_rules(created_ids)
+    except Exception as e:
+        logger.warning(f"Applying classification rules failed: {str(e)}")
+
 # Kosten Classificatie Endpoints
+@api_router.post("/bank-reconciliation/classify/bulk")
+async def classify_bank_transactions_bulk(request: BulkClassifyRequest):
+    """Classify many unmatched outgoing bank transactions with one type and category.
+    
+    One read, then apply_classifications: one update_many that claims the rows, one insert_many
+    into the cost collection and one bulk_write linking each bank row to its record, however
+    many rows are sent.
+    """
+    try:
+        bank_transaction_ids = list(dict.fromkeys(request.bank_transaction_ids))
+        if not bank_transaction_ids:
+            raise HTTPException(status_code=400, detail="Geen banktransacties opgegeven")
+        
+        bank_by_id = {
+            bank['id']: bank async for bank in db.bank_transactions.find({"id": {"$in": bank_transaction_ids}}, {"_id": 0})
+        }
+        errors = []
+        candidates = []
+        for bank_transaction_id in bank_transaction_ids:
+            bank_transaction = bank_by_id.get(bank_transaction_id)
+            if not bank_transaction:
+                errors.append(f"{bank_transaction_id}: bank transactie niet gevonden")
+            elif bank_transaction.get('amount', 0) > 0:
+                errors.append(f"{bank_transaction_id}: alleen uitgaven kunnen worden geclassificeerd")
+            else:
+                candidates.append(bank_transaction_id)
+        
+        records = await apply_classifications([
+            (bank_by_id[bank_transaction_id], request.classification_type, request.category_name, None)
+            for bank_transaction_id in candidates
+        ])
+        classified = {record['bank_transaction_id'] for record in records}
+        errors += [f"{bank_transaction_id}: deze transactie is al gereconcilieerd" for bank_transaction_id in candidates if bank_transaction_id not in classified]
+        if records:
+            await learn_classification_rules(list(classified))
+        
+        return {
+            "message": f"{len(records)} banktransacties geclassificeerd als {request.classification_type}e kosten",
+            "classified_count": len(records),
+            "classification_type": request.classification_type,
+            "category_name": request.category_name,
+            "total_amount": round(sum(record['amount'] for record in records), 2),
+            "error_count": len(errors),
+            "errors": errors
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error classifying transactions: {str(e)}")
+
 @api_router.post("/bank-reconciliation/classify/{bank_transaction_id}")
 async def classify_bank_transaction(
     bank_transaction_id: str,
@@ -2756,36 +5996,14 @@ async def classify_bank_transaction(
         if transaction_amount > 0:
             raise HTTPException(status_code=400, detail="Alleen uitgaven (negatieve bedragen) kunnen worden geclassificeerd")
         
-        # Create the classification record
-        classification = {
-            'id': str(uuid.uuid4()),
-            'bank_transaction_id': bank_transaction_id,
-            'classification_type': classification_type,  # 'vast' of 'variabel'
-            'category_name': category_name,
-            'amount': abs(transaction_amount),  # Store as positive amount
-            'date': bank_transaction.get('date'),
-            'description': bank_transaction.get('description', ''),
-            'counterparty': bank_transaction.get('counterparty_name', ''),
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'active': True
-        }
-        
-        # Store in appropriate collection
-        if classification_type == 'vast':
-            await db.vaste_kosten.insert_one(classification)
-        elif classification_type == 'variabel':
-            await db.variabele_kosten.insert_one(classification)
+        # Store the classification record and mark the bank transaction as reconciled
+        records = await apply_classifications([(bank_transaction, classification_type, category_name, None)])
+        if not records:
+            raise HTTPException(status_code=400, detail="Deze transactie is al gereconcilieerd")
+        classification = records[0]
         
-        # Mark bank transaction as reconciled
-        await db.bank_transactions.update_one(
-            {"id": bank_transaction_id},
-            {"$set": {
-                "reconciled": True,
-                "reconciled_date": datetime.now(timezone.utc).isoformat(),
-                "classification_type": classification_type,
-                "classification_id": classification['id']
-            }}
-        )
+        # Next month's payment to the same party is classified automatically
+        await learn_classification_rules([bank_transaction_id])
         
         return {
             "message": f"Transactie succesvol geclassificeerd als {classification_type}e kosten",
@@ -2795,9 +6013,66 @@ async def classify_bank_transaction(
             "amount": classification['amount']
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error classifying transaction: {str(e)}")
 
+@api_router.get("/classification-rules", response_model=List[ClassificationRule])
+async def get_classification_rules():
+    """Learned classification rules, most used first"""
+    try:
+        rules = await db.classification_rules.find({}, {"_id": 0}).sort([("hit_count", -1)]).to_list(None)
+        return [ClassificationRule(**parse_from_mongo(rule)) for rule in rules]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching classification rules: {str(e)}")
+
+@api_router.post("/classification-rules/learn")
+async def relearn_classification_rules():
+    """Rebuild the rules from all earlier classifications"""
+    try:
+        rule_count = await learn_classification_rules()
+        return {"message": f"{rule_count} classificatieregels geleerd", "rule_count": rule_count}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error learning classification rules: {str(e)}")
+
+@api_router.post("/classification-rules/apply")
+async def apply_classification_rules_endpoint(dry_run: bool = Query(False)):
+    """Classify every open outgoing bank transaction a rule covers, in one bulk write"""
+    try:
+        applied = await apply_classification_rules(dry_run=dry_run)
+        return {
+            "message": f"{len(applied)} banktransacties {'kunnen worden' if dry_run else 'zijn'} geclassificeerd",
+            "dry_run": dry_run,
+            "classified_count": len(applied),
+            "classifications": [
+                {
+                    "bank_transaction_id": bank_transaction['id'],
+                    "amount": bank_transaction.get('amount', 0.0),
+                    "description": bank_transaction.get('description', ''),
+                    "classification_type": classification_type,
+                    "category_name": category_name,
+                    "rule_id": rule_id
+                }
+                for bank_transaction, classification_type, category_name, rule_id in applied
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error applying classification rules: {str(e)}")
+
+@api_router.put("/classification-rules/{rule_id}")
+async def update_classification_rule(rule_id: str, active: bool = Query(...)):
+    """Switch a rule off (or back on) without losing what was learned"""
+    try:
+        result = await db.classification_rules.update_one({"id": rule_id}, {"$set": {"active": active}})
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Classificatieregel niet gevonden")
+        return {"message": "Classificatieregel bijgewerkt", "active": active}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating classification rule: {str(e)}")
+
 @api_router.get("/vaste-kosten")
 async def get_vaste_kosten():
     """Get all vaste kosten categorieën"""
@@ -2959,13 +6234,9 @@ async def edit_dashboard_transaction(
                 "type": "income" if amount > 0 else "expense"
             }
             
-            result = await db.transactions.update_one(
-                {"id": transaction_id},
-                {"$set": update_data}
-            )
-            
-            if result.matched_count == 0:
+            if await update_transaction_fields(transaction_id, update_data) is None:
                 raise HTTPException(status_code=404, detail="Declaratie transactie niet gevonden")
+            await discard_reconciliation_candidates(transaction_ids=[transaction_id])
                 
         elif transaction_type == "crediteur":
             # Extract crediteur name from description and update crediteuren collection
@@ -2988,6 +6259,7 @@ async def edit_dashboard_transaction(
             
             update_data = {
                 "crediteur": crediteur_naam,
+                "name_key": normalize_name(crediteur_naam),
                 "bedrag": abs(amount),  # Crediteuren always store positive amounts
                 "dag": target_crediteur.get('dag', 1)  # Keep existing payment day
             }
@@ -2996,6 +6268,8 @@ async def edit_dashboard_transaction(
                 {"id": target_crediteur['id']},
                 {"$set": update_data}
             )
+            await invalidate_match_indexes()
+            await discard_reconciliation_candidates(outgoing=True)
             
         elif transaction_type == "overige_omzet":
             # Update in overige_omzet collection
@@ -3043,6 +6317,7 @@ async def delete_dashboard_transaction(
             
             if result.deleted_count == 0:
                 raise HTTPException(status_code=404, detail="Declaratie transactie niet gevonden")
+            await discard_reconciliation_candidates(transaction_ids=[transaction_id])
                 
         elif transaction_type == "crediteur":
             # For crediteuren, we don't delete but mark as inactive
@@ -3050,6 +6325,8 @@ async def delete_dashboard_transaction(
                 {"id": transaction_id},
                 {"$set": {"actief": False}}
             )
+            await invalidate_match_indexes()
+            await discard_reconciliation_candidates(outgoing=True)
             
             if result.matched_count == 0:
                 raise HTTPException(status_code=404, detail="Crediteur niet gevonden")
@@ -3096,6 +6373,98 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Reference collections keyed on a unique name_key: name field and counterparty registry kind
+REFERENCE_NAME_FIELDS = {"verzekeraars": ("naam", "verzekeraar"), "crediteuren": ("crediteur", "crediteur")}
+
+async def normalize_reference_names(collection, name_field: str, kind: str):
+    """Backfill name_key and keep one verzekeraar/crediteur per name_key (the active, oldest one) so
+    the unique index can be built; registry entries pointing at a removed duplicate move to the kept record"""
+    records = await collection.find({}, {"_id": 0, "id": 1, name_field: 1, "name_key": 1, "actief": 1, "created_at": 1}).to_list(None)
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault(record.get('name_key') or normalize_name(record.get(name_field, '')), []).append(record)
+    missing = []
+    for name_key, group in groups.items():
+        kept, *duplicates = sorted(group, key=lambda record: (not record.get('actief', True), str(record.get('created_at') or '')))
+        if duplicates:
+            duplicate_ids = [record['id'] for record in duplicates]
+            await collection.delete_many({"id": {"$in": duplicate_ids}})
+            await db.counterparties.update_many(
+                {"kind": kind, "target_id": {"$in": duplicate_ids}}, {"$set": {"target_id": kept['id']}}
+            )
+            logger.warning(f"Removed {len(duplicate_ids)} duplicate {kind} records named '{name_key}'")
+        if not kept.get('name_key'):
+            missing.append(UpdateOne({"id": kept['id']}, {"$set": {"name_key": name_key}}))
+    if missing:
+        await collection.bulk_write(missing, ordered=False)
+
+async def backfill_open_amounts():
+    """open_amount for transactions stored before it existed (or restored from an older snapshot)"""
+    # Matches documents without the field as well as explicit nulls
+    legacy = await db.transactions.find({"open_amount": None}, {"id": 1, "amount": 1, "reconciled": 1}).to_list(None)
+    if legacy:
+        await db.transactions.bulk_write([
+            UpdateOne({"id": doc['id']}, {"$set": {"open_amount": transaction_open_amount(doc)}})
+            for doc in legacy
+        ], ordered=False)
+
+@app.on_event("startup")
+async def ensure_indexes():
+    """Create the indexes the bulk endpoints rely on and backfill derived keys on legacy documents"""
+    try:
+        for collection_name, (name_field, kind) in REFERENCE_NAME_FIELDS.items():
+            collection = db[collection_name]
+            # name_key is the upsert key of the copy-paste import; unique so concurrent pastes cannot duplicate
+            await normalize_reference_names(collection, name_field, kind)
+            index_info = await collection.index_information()
+            if 'name_key_1' in index_info and not index_info['name_key_1'].get('unique'):
+                await collection.drop_index('name_key_1')
+            # Partial so documents restored from an older snapshot without name_key do not collide on null
+            await collection.create_index(
+                "name_key", unique=True, partialFilterExpression={"name_key": {"$type": "string"}}
+            )
+        await db.reconciliation_candidates.create_index("bank_transaction_id", unique=True)
+        await db.reconciliation_candidates.create_index("transaction_ids")
+        await db.reconciliation_candidates.create_index("bank_amount")
+        await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_KEY_TTL_SECONDS)
+        await db.transactions.create_index("invoice_number")
+        await db.counterparties.create_index("iban", unique=True)
+        await db.classification_rules.create_index([("match_field", 1), ("pattern", 1)], unique=True)
+        await db.vaste_kosten.create_index("bank_transaction_id")
+        await db.variabele_kosten.create_index("bank_transaction_id")
+        await db.reconciliations.create_index("bank_transaction_id")
+        await db.transactions.create_index([("reconciled", 1), ("open_amount", 1), ("date", 1)])
+        await db.bank_transactions.create_index("invoice_numbers")
+        legacy = await db.bank_transactions.find({"invoice_numbers": {"$exists": False}}, {"id": 1, "description": 1}).to_list(None)
+        if legacy:
+            await db.bank_transactions.bulk_write([
+                UpdateOne({"id": doc['id']}, {"$set": {"invoice_numbers": extract_invoice_numbers(doc.get('description'))}})
+                for doc in legacy
+            ], ordered=False)
+        await db.bank_transactions.create_index([("id", 1), ("reconciled", 1)])
+        await db.bank_transactions.create_index([("reconciled", 1), ("counterparty_key", 1)])
+        legacy = await db.bank_transactions.find(
+            {"counterparty_key": {"$exists": False}}, {"id": 1, "counterparty": 1, "description": 1}
+        ).to_list(None)
+        if legacy:
+            await db.bank_transactions.bulk_write([
+                UpdateOne({"id": doc['id']}, {"$set": {"counterparty_key": counterparty_key(doc.get('counterparty'), doc.get('description'))}})
+                for doc in legacy
+            ], ordered=False)
+        await db.transactions.create_index([("id", 1), ("reconciled", 1)])
+    except Exception as e:
+        logger.warning(f"Index setup failed: {str(e)}")
+
+@app.on_event("startup")
+async def backfill_legacy_open_amounts():
+    """Separate from ensure_indexes so a failing index step cannot skip the open_amount backfill"""
+    try:
+        await backfill_open_amounts()
+    except Exception as e:
+        logger.warning(f"open_amount backfill failed: {str(e)}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    if _import_process_pool is not None:
+        _import_process_pool.shutdown(wait=False)
\ No newline at end of file
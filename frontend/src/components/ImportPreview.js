@@ -17,11 +17,17 @@ const ImportPreview = ({ previewData, onComplete, onBack }) => {
     );
   }
 
+  const isBankImport = previewData?.import_type?.startsWith('bank_');
+
   const getImportTypeLabel = (type) => {
     const labels = {
       epd_declaraties: 'EPD Declaraties',
       epd_particulier: 'EPD Particuliere Facturen',
-      bank_bunq: 'BUNQ Bank Export'
+      bank_bunq: 'BUNQ Bank Export',
+      bank_ing: 'ING Bank Export',
+      bank_rabobank: 'Rabobank Export',
+      bank_abnamro: 'ABN AMRO Export',
+      bank_camt053: 'CAMT.053 Bankafschrift'
     };
     return labels[type] || type;
   };
@@ -143,7 +149,7 @@ const ImportPreview = ({ previewData, onComplete, onBack }) => {
                 <th className="px-4 py-3 text-left text-xs font-medium text-slate-500 uppercase tracking-wider">
                   Rij
                 </th>
-                {previewData?.import_type !== 'bank_bunq' && (
+                {!isBankImport && (
                   <>
                     <th className="px-4 py-3 text-left text-xs font-medium text-slate-500 uppercase tracking-wider">
                       Factuur
@@ -159,7 +165,7 @@ const ImportPreview = ({ previewData, onComplete, onBack }) => {
                     </th>
                   </>
                 )}
-                {previewData?.import_type === 'bank_bunq' && (
+                {isBankImport && (
                   <>
                     <th className="px-4 py-3 text-left text-xs font-medium text-slate-500 uppercase tracking-wider">
                       Datum
@@ -195,7 +201,7 @@ const ImportPreview = ({ previewData, onComplete, onBack }) => {
                   <td className="px-4 py-3 whitespace-nowrap text-sm text-slate-900">
                     {item?.row_number || '-'}
                   </td>
-                  {previewData?.import_type !== 'bank_bunq' && (
+                  {!isBankImport && (
                     <>
                       <td className="px-4 py-3 whitespace-nowrap text-sm text-slate-900">
                         {item?.mapped_data?.invoice_number || '-'}
@@ -211,7 +217,7 @@ const ImportPreview = ({ previewData, onComplete, onBack }) => {
                       </td>
                     </>
                   )}
-                  {previewData?.import_type === 'bank_bunq' && (
+                  {isBankImport && (
                     <>
                       <td className="px-4 py-3 whitespace-nowrap text-sm text-slate-900">
                         {item?.mapped_data?.date ? formatDate(item.mapped_data.date) : '-'}
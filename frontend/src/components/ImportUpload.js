@@ -29,9 +29,38 @@ const ImportUpload = ({ onPreviewReady }) => {
       label: 'BUNQ Bank Export',
       description: 'BUNQ CSV export voor reconciliatie',
       example: 'Date, Amount, Counterparty, Description'
+    },
+    { 
+      value: 'bank_ing', 
+      label: 'ING Bank Export',
+      description: 'ING CSV export (Af Bij, Bedrag (EUR))',
+      example: 'Datum, Naam / Omschrijving, Tegenrekening, Af Bij, Bedrag (EUR)'
+    },
+    { 
+      value: 'bank_rabobank', 
+      label: 'Rabobank Export',
+      description: 'Rabobank CSV export',
+      example: 'Datum, Bedrag, Tegenrekening IBAN/BBAN, Naam tegenpartij'
+    },
+    { 
+      value: 'bank_abnamro', 
+      label: 'ABN AMRO Export',
+      description: 'ABN AMRO TAB export (.tab / .txt)',
+      example: 'rekening, munt, datum, ..., bedrag, omschrijving'
+    },
+    { 
+      value: 'bank_camt053', 
+      label: 'CAMT.053 Bankafschrift',
+      description: 'CAMT.053 XML bankafschrift (alle banken)',
+      example: '<Ntry> met bedrag, datum en tegenpartij'
     }
   ];
 
+  const allowedExtensions = {
+    bank_abnamro: ['.tab', '.txt', '.csv'],
+    bank_camt053: ['.xml']
+  };
+
   const handleDrag = (e) => {
     e.preventDefault();
     e.stopPropagation();
@@ -54,12 +83,13 @@ const ImportUpload = ({ onPreviewReady }) => {
   };
 
   const handleFileSelect = (file) => {
-    if (!file.name.endsWith('.csv')) {
-      setError('Alleen CSV bestanden zijn toegestaan');
+    const extensions = allowedExtensions[importType] || ['.csv'];
+    if (!extensions.some((extension) => file.name.toLowerCase().endsWith(extension))) {
+      setError(`Alleen ${extensions.join(', ')} bestanden zijn toegestaan`);
       return;
     }
     
-    if (file.size > 10 * 1024 * 1024) { // 10MB limit
+    if (importType !== 'bank_camt053' && file.size > 10 * 1024 * 1024) { // 10MB limit
       setError('Bestand te groot. Maximum 10MB toegestaan');
       return;
     }
@@ -86,16 +116,18 @@ const ImportUpload = ({ onPreviewReady }) => {
 
     try {
       // First, inspect the file columns for better debugging
-      const inspectFormData = new FormData();
-      inspectFormData.append('file', selectedFile);
-      
-      const inspectResponse = await axios.post(`${API}/import/inspect-columns`, inspectFormData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-      });
+      if (selectedFile.name.toLowerCase().endsWith('.csv')) {
+        const inspectFormData = new FormData();
+        inspectFormData.append('file', selectedFile);
+        
+        const inspectResponse = await axios.post(`${API}/import/inspect-columns`, inspectFormData, {
+          headers: {
+            'Content-Type': 'multipart/form-data',
+          },
+        });
 
-      console.log('File inspection:', inspectResponse.data);
+        console.log('File inspection:', inspectResponse.data);
+      }
 
       // Then proceed with preview
       const formData = new FormData();
@@ -304,7 +336,7 @@ ${JSON.stringify(debugInfo.sample_raw_rows, null, 2)}`;
                   </span>
                   <input
                     type="file"
-                    accept=".csv"
+                    accept={(allowedExtensions[importType] || ['.csv']).join(',')}
                     onChange={handleFileInputChange}
                     className="hidden"
                     data-testid="file-input"
@@ -313,7 +345,7 @@ ${JSON.stringify(debugInfo.sample_raw_rows, null, 2)}`;
               </div>
               
               <p className="text-sm text-slate-500">
-                Ondersteunde formaten: CSV (max 10MB)
+                Ondersteunde formaten: {(allowedExtensions[importType] || ['.csv']).join(', ')}
               </p>
             </div>
           )}
@@ -0,0 +1,30 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'cashflow_test')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """TestClient against a fresh in-memory database, with the startup hooks run"""
+    monkeypatch.setattr(server, "db", mongomock_motor.AsyncMongoMockClient()['cashflow_test'])
+    monkeypatch.setattr(server, "_crediteur_match_index", None)
+    monkeypatch.setattr(server, "_name_index", None)
+    monkeypatch.setattr(server, "_counterparty_registry", None)
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def db(api):
+    return server.db
@@ -0,0 +1,37 @@
+import anyio
+import pytest
+
+
+def seed(api, db, bank_amount):
+    response = api.post("/api/transactions", json={
+        "type": "income", "category": "zorgverzekeraar", "amount": 100.0, "description": "Declaratie",
+        "date": "2026-03-02", "patient_name": "Jansen", "invoice_number": "202600000123"
+    })
+    anyio.run(db.bank_transactions.insert_one, {
+        "id": "b1", "date": "2026-03-02", "amount": bank_amount, "description": "Betaling factuur 202600000123",
+        "counterparty": "Jansen", "invoice_numbers": ["202600000123"], "reconciled": False
+    })
+    return response.json()['id']
+
+
+@pytest.mark.parametrize("min_score", [95.0, 80.0])
+def test_assignment_never_closes_a_declaratie_on_a_smaller_payment(api, db, min_score):
+    transaction_id = seed(api, db, 40.0)
+    
+    response = api.post("/api/bank-reconciliation/auto-match", params={"mode": "assignment", "min_score": min_score})
+    
+    assert response.status_code == 200
+    assert response.json()['matched_count'] == 0
+    transaction = anyio.run(db.transactions.find_one, {"id": transaction_id})
+    assert (transaction['reconciled'], transaction['open_amount']) == (False, 100.0)
+    assert anyio.run(db.bank_transactions.find_one, {"id": "b1"})['reconciled'] is False
+
+
+def test_assignment_closes_a_declaratie_paid_in_full(api, db):
+    transaction_id = seed(api, db, 100.0)
+    
+    response = api.post("/api/bank-reconciliation/auto-match", params={"mode": "assignment"})
+    
+    assert response.json()['matched_count'] == 1
+    transaction = anyio.run(db.transactions.find_one, {"id": transaction_id})
+    assert (transaction['reconciled'], transaction['open_amount']) == (True, 0.0)
@@ -0,0 +1,113 @@
+import anyio
+
+import server
+
+
+def add_bank_transactions(db, rows):
+    anyio.run(db.bank_transactions.insert_many, [
+        {"date": "2024-03-01", "amount": -100.0, "description": "Huur praktijkruimte", "account_number": "",
+         "reconciled": False, **row}
+        for row in rows
+    ])
+
+
+def rule(db, match_field, pattern):
+    return anyio.run(db.classification_rules.find_one, {"match_field": match_field, "pattern": pattern})
+
+
+def classify(api, bank_transaction_id, classification_type, category_name):
+    response = api.post(f"/api/bank-reconciliation/classify/{bank_transaction_id}", params={
+        "classification_type": classification_type, "category_name": category_name
+    })
+    assert response.status_code == 200
+
+
+def test_one_odd_classification_does_not_flip_a_learned_rule(api, db):
+    add_bank_transactions(db, [{"id": f"b{index}", "counterparty": "Vastgoed BV"} for index in range(4)])
+    response = api.post("/api/bank-reconciliation/classify/bulk", json={
+        "bank_transaction_ids": ["b0", "b1", "b2"], "classification_type": "vast", "category_name": "Huur"
+    })
+    assert response.status_code == 200
+    
+    classify(api, "b3", "variabel", "Onderhoud")
+    
+    learned = rule(db, "counterparty", "vastgoed bv")
+    assert (learned['classification_type'], learned['category_name']) == ("vast", "Huur")
+    assert learned['hit_count'] == 3
+
+
+def test_incremental_counts_switch_the_rule_once_another_target_wins(api, db):
+    add_bank_transactions(db, [{"id": f"b{index}", "counterparty": "Vastgoed BV"} for index in range(3)])
+    classify(api, "b0", "vast", "Huur")
+    classify(api, "b1", "variabel", "Onderhoud")
+    assert rule(db, "counterparty", "vastgoed bv")['category_name'] == "Huur"
+    
+    classify(api, "b2", "variabel", "Onderhoud")
+    
+    learned = rule(db, "counterparty", "vastgoed bv")
+    assert (learned['classification_type'], learned['category_name'], learned['hit_count']) == ("variabel", "Onderhoud", 2)
+
+
+def test_full_relearn_matches_incremental_counts(api, db):
+    add_bank_transactions(db, [{"id": f"b{index}", "counterparty": "Vastgoed BV"} for index in range(3)])
+    for bank_transaction_id, category_name in (("b0", "Huur"), ("b1", "Huur"), ("b2", "Schoonmaak")):
+        classify(api, bank_transaction_id, "vast", category_name)
+    incremental = rule(db, "counterparty", "vastgoed bv")
+    
+    assert api.post("/api/classification-rules/learn").status_code == 200
+    
+    relearned = rule(db, "counterparty", "vastgoed bv")
+    assert relearned['id'] == incremental['id']
+    assert (relearned['category_name'], relearned['hit_count']) == (incremental['category_name'], incremental['hit_count']) == ("Huur", 2)
+
+
+def test_rules_need_enough_hits_before_they_fire(api, db):
+    add_bank_transactions(db, [
+        {"id": "b0", "counterparty": "Vastgoed BV", "description": "SEPA incasso"},
+        {"id": "new", "counterparty": "Energie Direct", "description": "SEPA incasso"}
+    ])
+    classify(api, "b0", "vast", "Huur")
+    new_row = anyio.run(db.bank_transactions.find_one, {"id": "new"})
+    
+    assert anyio.run(server.match_classification_rules, [new_row]) == []
+
+
+def test_iban_rule_fires_after_one_classification(api, db):
+    add_bank_transactions(db, [
+        {"id": "b0", "counterparty": "Vastgoed BV", "account_number": "NL12 RABO 0123 4567 89"},
+        {"id": "new", "counterparty": "Vastgoed", "account_number": "NL12RABO0123456789"}
+    ])
+    classify(api, "b0", "vast", "Huur")
+    
+    [(bank_transaction, classification_type, category_name, _)] = anyio.run(server.apply_classification_rules, ["new"])
+    assert (bank_transaction['id'], classification_type, category_name) == ("new", "vast", "Huur")
+
+
+def test_bulk_classify_links_each_bank_row_to_its_cost_record(api, db):
+    add_bank_transactions(db, [{"id": f"b{index}", "counterparty": "Vastgoed BV"} for index in range(3)])
+    
+    response = api.post("/api/bank-reconciliation/classify/bulk", json={
+        "bank_transaction_ids": ["b0", "b1", "b2"], "classification_type": "vast", "category_name": "Huur"
+    })
+    
+    assert response.json()['classified_count'] == 3
+    records = {record['bank_transaction_id']: record for record in anyio.run(lambda: db.vaste_kosten.find().to_list(None))}
+    for bank_transaction in anyio.run(lambda: db.bank_transactions.find().to_list(None)):
+        assert bank_transaction['reconciled'] is True
+        assert bank_transaction['classification_id'] == records[bank_transaction['id']]['id']
+
+
+def test_bulk_classify_releases_the_claim_when_the_insert_fails(api, db, monkeypatch):
+    add_bank_transactions(db, [{"id": f"b{index}", "counterparty": "Vastgoed BV"} for index in range(2)])
+    
+    async def failing_insert_many(self, documents, *args, **kwargs):
+        raise RuntimeError("write failed")
+    monkeypatch.setattr(type(db.vaste_kosten), "insert_many", failing_insert_many)
+    
+    response = api.post("/api/bank-reconciliation/classify/bulk", json={
+        "bank_transaction_ids": ["b0", "b1"], "classification_type": "vast", "category_name": "Huur"
+    })
+    
+    assert response.status_code == 500
+    assert anyio.run(db.bank_transactions.count_documents, {"reconciled": False}) == 2
+    assert anyio.run(db.bank_transactions.count_documents, {"reconciliation_claim": {"$exists": True}}) == 0
@@ -0,0 +1,53 @@
+import anyio
+
+import server
+
+
+def preview(api, content):
+    response = api.post(
+        "/api/import/preview",
+        files={"file": ("declaraties.csv", content.encode('utf-8'), "text/csv")},
+        data={"import_type": "epd_declaraties"}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_fingerprint_ignores_surrounding_whitespace_but_not_case():
+    fingerprint = server.compute_header_fingerprint(["datum", "bedrag"])
+    assert server.compute_header_fingerprint([" datum", "bedrag "]) == fingerprint
+    assert server.compute_header_fingerprint(["Datum", "Bedrag"]) != fingerprint
+    assert server.compute_header_fingerprint(["bedrag", "datum"]) != fingerprint
+
+
+def test_discovery_keeps_the_column_spelling_of_the_file():
+    rows = [{"Factuur": "INV1", "Datum": "2025-01-01", "Verzekeraar": "CZ", "Bedrag": "10"}]
+    mapping = server.discover_column_mapping('epd_declaraties', rows)
+    assert mapping == {"invoice_number": "Factuur", "date": "Datum", "patient_name": "Verzekeraar", "amount": "Bedrag"}
+
+
+def test_known_layout_reuses_its_profile(api, db):
+    first = preview(api, "factuur,datum,verzekeraar,bedrag\nINV001,2025-01-01,CZ,150.50\n")
+    second = preview(api, "factuur,datum,verzekeraar,bedrag\nINV002,2025-01-02,VGZ,225.00\n")
+    
+    assert first['valid_rows'] == second['valid_rows'] == 1
+    assert anyio.run(db.column_mapping_profiles.count_documents, {}) == 1
+
+
+def test_header_in_other_case_gets_its_own_working_profile(api, db):
+    preview(api, "factuur,datum,verzekeraar,bedrag\nINV001,2025-01-01,CZ,150.50\n")
+    result = preview(api, "Factuur,Datum,Verzekeraar,Bedrag\nINV002,2025-01-02,VGZ,225.00\n")
+    
+    assert result['valid_rows'] == 1
+    assert result['error_rows'] == 0
+    assert anyio.run(db.column_mapping_profiles.count_documents, {}) == 2
+
+
+def test_rows_fall_back_to_other_columns_when_the_mapped_one_is_empty():
+    mapping = {"date": "datum", "amount": "Debet", "counterparty": "debiteur", "description": "omschrijving"}
+    row = {"datum": "2025-01-02", "Debet": "", "Credit": "25,00", "debiteur": "", "Tegenpartij": "Huisartsenpraktijk", "omschrijving": "Factuur 12"}
+    
+    item = server.validate_bunq_row(row, 1, mapping)
+    
+    assert item.import_status == 'valid', item.validation_errors
+    assert (item.mapped_data['amount'], item.mapped_data['counterparty']) == (25.0, "Huisartsenpraktijk")
@@ -0,0 +1,83 @@
+import anyio
+
+
+def paste_crediteuren(api, data):
+    return api.post("/api/copy-paste-import/execute", json={"import_type": "crediteuren", "data": data})
+
+
+def crediteuren(db):
+    return anyio.run(lambda: db.crediteuren.find({}, {"_id": 0}).to_list(None))
+
+
+def test_new_crediteuren_get_model_defaults(api, db):
+    response = paste_crediteuren(api, "crediteur\tbedrag\tdag\nVastgoed BV\t1200\t1\nEnergie Direct\t150\t15")
+    
+    assert response.status_code == 200
+    assert response.json()['imported_count'] == 2
+    stored = {crediteur['name_key']: crediteur for crediteur in crediteuren(db)}
+    assert stored['vastgoed bv']['actief'] is True
+    assert stored['vastgoed bv']['iban'] is None
+    assert stored['vastgoed bv']['id'] and stored['vastgoed bv']['created_at']
+
+
+def test_repaste_updates_pasted_fields_and_keeps_the_rest(api, db):
+    paste_crediteuren(api, "crediteur\tbedrag\tdag\nVastgoed BV\t1200\t1")
+    original = crediteuren(db)[0]
+    anyio.run(db.crediteuren.update_one, {"id": original['id']}, {"$set": {"iban": "NL12RABO0123456789"}})
+    
+    response = paste_crediteuren(api, "crediteur\tbedrag\tdag\nvastgoed  bv\t1250\t2")
+    
+    assert response.status_code == 200
+    [updated] = crediteuren(db)
+    assert updated['id'] == original['id']
+    assert updated['created_at'] == original['created_at']
+    assert (updated['bedrag'], updated['dag']) == (1250.0, 2)
+    assert updated['iban'] == "NL12RABO0123456789"
+
+
+def test_repasting_a_deleted_crediteur_brings_it_back(api, db):
+    paste_crediteuren(api, "crediteur\tbedrag\tdag\nVastgoed BV\t1200\t1")
+    original = crediteuren(db)[0]
+    api.delete("/api/dashboard/transaction/delete", params={"transaction_id": original['id'], "transaction_type": "crediteur"})
+    assert api.get("/api/crediteuren").json() == []
+    
+    paste_crediteuren(api, "crediteur\tbedrag\tdag\nVastgoed BV\t1250\t1")
+    
+    [restored] = api.get("/api/crediteuren").json()
+    assert (restored['id'], restored['bedrag']) == (original['id'], 1250.0)
+
+
+def test_unknown_import_type_is_a_client_error(api):
+    response = api.post("/api/copy-paste-import/execute", json={"import_type": "debiteuren", "data": "a\tb"})
+    assert response.status_code == 400
+
+
+def test_creating_an_existing_crediteur_is_refused_unless_it_was_deleted(api, db):
+    created = api.post("/api/crediteuren", json={"crediteur": "Vastgoed BV", "bedrag": 1200, "dag": 1}).json()
+    
+    assert api.post("/api/crediteuren", json={"crediteur": "vastgoed bv", "bedrag": 1300, "dag": 1}).status_code == 400
+    
+    api.delete("/api/dashboard/transaction/delete", params={"transaction_id": created['id'], "transaction_type": "crediteur"})
+    response = api.post("/api/crediteuren", json={"crediteur": "Vastgoed BV", "bedrag": 1300, "dag": 2})
+    assert response.status_code == 200
+    assert (response.json()['id'], response.json()['bedrag'], response.json()['actief']) == (created['id'], 1300.0, True)
+
+
+def test_startup_removes_duplicate_names_before_the_unique_index(monkeypatch):
+    import mongomock_motor
+    import server
+    
+    fresh = mongomock_motor.AsyncMongoMockClient()['cashflow_dedupe']
+    monkeypatch.setattr(server, "db", fresh)
+    anyio.run(fresh.crediteuren.insert_many, [
+        {"id": "old-inactive", "crediteur": "Vastgoed BV", "name_key": "vastgoed bv", "actief": False, "created_at": "2023-01-01"},
+        {"id": "kept", "crediteur": "Vastgoed BV", "name_key": "vastgoed bv", "actief": True, "created_at": "2024-01-01"},
+        {"id": "newer", "crediteur": "VASTGOED BV", "actief": True, "created_at": "2024-06-01"}
+    ])
+    anyio.run(fresh.counterparties.insert_one, {"iban": "NL12RABO0123456789", "kind": "crediteur", "target_id": "newer"})
+    
+    anyio.run(server.ensure_indexes)
+    
+    assert [doc['id'] for doc in anyio.run(lambda: fresh.crediteuren.find().to_list(None))] == ["kept"]
+    assert anyio.run(fresh.counterparties.find_one, {})['target_id'] == "kept"
+    assert anyio.run(fresh.crediteuren.index_information)['name_key_1'].get('unique') is True
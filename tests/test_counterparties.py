@@ -0,0 +1,67 @@
+import anyio
+
+import server
+
+IBAN = "NL01CZZZ0000000001"
+
+
+def confirm_payment(db, index, verzekeraar):
+    """A reconciled bank row from IBAN matched to a declaratie of the given verzekeraar"""
+    async def insert():
+        await db.bank_transactions.insert_one({
+            "id": f"b{index}", "date": "2024-03-01", "amount": 100.0, "description": "Betaling",
+            "counterparty": "Zorgverzekeraar", "account_number": IBAN, "reconciled": True
+        })
+        await db.transactions.insert_one({
+            "id": f"t{index}", "type": "income", "category": "zorgverzekeraar", "amount": 100.0,
+            "patient_name": verzekeraar, "reconciled": True, "open_amount": 0.0
+        })
+        await db.reconciliations.insert_one({
+            "id": f"r{index}", "bank_transaction_id": f"b{index}", "matched_transaction_id": f"t{index}",
+            "reconciliation_status": "matched"
+        })
+        return await server.learn_counterparties([f"b{index}"])
+    return anyio.run(insert)
+
+
+def registered(db):
+    return anyio.run(db.counterparties.find_one, {"iban": IBAN})
+
+
+def seed_verzekeraars(db):
+    anyio.run(db.verzekeraars.insert_many, [
+        {"id": "v1", "naam": "CZ", "actief": True}, {"id": "v2", "naam": "VGZ", "actief": True}
+    ])
+
+
+def test_single_mismatch_does_not_repoint_a_confirmed_iban(api, db):
+    seed_verzekeraars(db)
+    for index in range(3):
+        confirm_payment(db, index, "CZ")
+    
+    confirm_payment(db, 3, "VGZ")
+    
+    counterparty = registered(db)
+    assert (counterparty['target_id'], counterparty['name'], counterparty['match_count']) == ("v1", "CZ", 3)
+
+
+def test_iban_moves_once_another_counterparty_is_confirmed_more_often(api, db):
+    seed_verzekeraars(db)
+    confirm_payment(db, 0, "CZ")
+    for index in range(1, 3):
+        confirm_payment(db, index, "VGZ")
+    
+    counterparty = registered(db)
+    assert (counterparty['target_id'], counterparty['match_count']) == ("v2", 2)
+    
+    assert anyio.run(server.learn_counterparties) == 1
+    assert (registered(db)['target_id'], registered(db)['match_count']) == ("v2", 2)
+
+
+def test_registry_follows_learning_in_other_workers(api, db):
+    assert anyio.run(server.get_counterparty_registry) == {}
+    
+    anyio.run(db.counterparties.insert_one, {"iban": "NL12RABO0123456789", "kind": "verzekeraar", "target_id": "v1", "name": "CZ"})
+    anyio.run(server.bump_cache_version, "counterparty_registry")
+    
+    assert list(anyio.run(server.get_counterparty_registry)) == ["NL12RABO0123456789"]
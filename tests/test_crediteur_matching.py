@@ -0,0 +1,57 @@
+import anyio
+
+import server
+
+
+def suggestions(crediteuren, **bank):
+    bank_trans = {"amount": -100.0, "description": "", "counterparty": "", "account_number": "", **bank}
+    return {
+        suggestion['id']: suggestion['match_score']
+        for suggestion in server.CrediteurMatchIndex(crediteuren).suggestions(bank_trans)
+    }
+
+
+CREDITEUREN = [
+    {"id": "huur", "crediteur": "Huur", "bedrag": 1200.0, "dag": 1},
+    {"id": "kpn", "crediteur": "KPN", "bedrag": 45.0, "dag": 15},
+    {"id": "vastgoed", "crediteur": "Vastgoed Beheer BV", "bedrag": 1200.0, "dag": 1}
+]
+
+
+def test_name_words_match_as_whole_words():
+    assert suggestions(CREDITEUREN, amount=-1200.0, description="Huur maart") == {"huur": 95, "vastgoed": 85}
+    assert suggestions(CREDITEUREN, amount=-1200.0, description="Huurtoeslag maart") == {"huur": 85, "vastgoed": 85}
+
+
+def test_short_names_match_when_the_whole_name_is_present():
+    assert suggestions(CREDITEUREN, amount=-45.0, counterparty="KPN B.V.") == {"kpn": 95}
+    assert suggestions(CREDITEUREN, amount=-45.0, counterparty="KPNX Telecom") == {"kpn": 85}
+
+
+def test_counterparty_contained_in_crediteur_name():
+    assert suggestions(CREDITEUREN, amount=-1200.0, counterparty="Vastgoed Beheer") == {"huur": 85, "vastgoed": 95}
+
+
+def test_crediteur_write_in_another_worker_invalidates_the_cached_index(api, db):
+    anyio.run(db.crediteuren.insert_one, {"id": "c1", "crediteur": "Vastgoed BV", "bedrag": 1200, "dag": 1, "actief": True})
+    cached = anyio.run(server.get_crediteur_match_index)
+    assert anyio.run(server.get_crediteur_match_index) is cached
+    
+    # Another worker stores a crediteur and bumps the shared version stamp
+    anyio.run(db.crediteuren.insert_one, {"id": "c2", "crediteur": "Energie NV", "bedrag": 80, "dag": 5, "actief": True})
+    anyio.run(server.bump_cache_version, "match_indexes")
+    
+    rebuilt = anyio.run(server.get_crediteur_match_index)
+    assert rebuilt is not cached
+    assert [suggestion['id'] for suggestion in rebuilt.suggestions(
+        {"amount": -80.0, "date": "2025-01-05", "counterparty": "Energie NV", "description": "", "account_number": ""}
+    )] == ["c2"]
+
+
+def test_name_index_follows_writes_in_other_workers(api, db):
+    assert anyio.run(server.get_name_index).search("Energie NV") == []
+    
+    anyio.run(db.crediteuren.insert_one, {"id": "c2", "crediteur": "Energie NV", "bedrag": 80, "dag": 5, "actief": True})
+    anyio.run(server.bump_cache_version, "match_indexes")
+    
+    assert [hit['ref'] for hit in anyio.run(server.get_name_index).search("Energie NV")] == ["c2"]
@@ -0,0 +1,40 @@
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_bunq_layout_with_datum_and_bedrag_is_not_taken_for_rabobank():
+    content = (
+        "Datum,Bedrag,Tegenpartij,Omschrijving,Rekening\n"
+        "2025-01-02,\"-45,00\",Energie BV,Termijn januari,NL12BUNQ0123456789\n"
+    ).encode('utf-8')
+    assert server.detect_import_type("export.csv", content) == 'bank_bunq'
+
+
+def test_rabobank_export_is_detected():
+    content = (
+        "IBAN/BBAN,Datum,Bedrag,Naam tegenpartij,Tegenrekening IBAN/BBAN,Omschrijving-1\n"
+        "NL01RABO0123456789,2025-01-02,\"-45,00\",Energie BV,NL02INGB0123456789,Termijn januari\n"
+    ).encode('utf-8')
+    assert server.detect_import_type("export.csv", content) == 'bank_rabobank'
+
+
+def test_archive_limit_applies_to_the_bytes_read(monkeypatch):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("a.csv", "x" * 3000)
+        archive.writestr("b.csv", "y" * 3000)
+    monkeypatch.setattr(server, "IMPORT_ARCHIVE_READ_CHUNK", 1024)
+    monkeypatch.setattr(server, "IMPORT_ARCHIVE_MAX_BYTES", 5000)
+    
+    with pytest.raises(HTTPException) as error:
+        server.expand_import_archives([("batch.zip", buffer.getvalue())])
+    assert error.value.status_code == 400
+    
+    monkeypatch.setattr(server, "IMPORT_ARCHIVE_MAX_BYTES", 6000)
+    expanded = server.expand_import_archives([("batch.zip", buffer.getvalue())])
+    assert [(name, len(content)) for name, content in expanded] == [("batch.zip/a.csv", 3000), ("batch.zip/b.csv", 3000)]
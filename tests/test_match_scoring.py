@@ -0,0 +1,19 @@
+import server
+
+
+def test_invoice_hit_with_other_amount_stays_below_auto_apply():
+    bank = {"amount": 40.0, "date": "2026-03-02", "description": "Factuur 202600000123", "counterparty": "Jansen"}
+    transaction = {"amount": 100.0, "open_amount": 100.0, "date": "2026-03-02", "patient_name": "Jansen",
+                   "invoice_number": "202600000123"}
+    
+    score, reason = server.score_transaction_match(bank, transaction)
+    
+    assert score == server.NON_EXACT_MATCH_MAX_SCORE < 95
+    assert reason.startswith("Factuurnummer in omschrijving, ander bedrag")
+
+
+def test_exact_invoice_hit_scores_above_auto_apply():
+    bank = {"amount": 100.0, "date": "2026-03-02", "description": "Factuur 202600000123"}
+    transaction = {"amount": 100.0, "open_amount": 100.0, "date": "2026-03-02", "invoice_number": "202600000123"}
+    
+    assert server.score_transaction_match(bank, transaction)[0] == 100.0
@@ -0,0 +1,121 @@
+import anyio
+
+import server
+
+
+def create_declaratie(api, amount):
+    response = api.post("/api/transactions", json={
+        "type": "income", "category": "zorgverzekeraar", "amount": amount,
+        "description": "Declaratie", "date": "2024-03-01", "patient_name": "Jansen"
+    })
+    assert response.status_code == 200
+    return response.json()['id']
+
+
+def add_bank_transaction(db, bank_id, amount):
+    anyio.run(db.bank_transactions.insert_one, {
+        "id": bank_id, "date": "2024-03-10", "amount": amount, "description": "Betaling",
+        "counterparty": "CZ", "reconciled": False
+    })
+
+
+def stored(db, transaction_id):
+    return anyio.run(db.transactions.find_one, {"id": transaction_id})
+
+
+def test_instalments_reduce_open_amount_until_closed(api, db):
+    transaction_id = create_declaratie(api, 300.0)
+    for index, amount in enumerate((100.0, 100.1, 99.9)):
+        add_bank_transaction(db, f"b{index}", amount)
+        response = api.post("/api/bank-reconciliation/match", params={
+            "bank_transaction_id": f"b{index}", "cashflow_transaction_id": transaction_id
+        })
+        assert response.status_code == 200
+    
+    transaction = stored(db, transaction_id)
+    assert transaction['reconciled'] is True
+    assert transaction['open_amount'] == 0.0
+
+
+def test_partial_instalment_keeps_rounded_balance(api, db):
+    transaction_id = create_declaratie(api, 100.0)
+    for index in range(3):
+        add_bank_transaction(db, f"b{index}", 33.33)
+        api.post("/api/bank-reconciliation/match", params={
+            "bank_transaction_id": f"b{index}", "cashflow_transaction_id": transaction_id
+        })
+    
+    transaction = stored(db, transaction_id)
+    assert transaction['reconciled'] is False
+    assert round(transaction['open_amount'], 2) == 0.01
+
+
+def test_correction_moves_open_amount_of_open_transaction(api, db):
+    transaction_id = create_declaratie(api, 200.0)
+    anyio.run(db.correcties.insert_one, {"id": "c1", "amount": 50.0, "matched": False})
+    
+    assert api.post("/api/correcties/c1/match", params={"original_transaction_id": transaction_id}).status_code == 200
+    
+    transaction = stored(db, transaction_id)
+    assert transaction['amount'] == 150.0
+    assert transaction['open_amount'] == 150.0
+
+
+def test_correction_after_payment_leaves_transaction_closed(api, db):
+    transaction_id = create_declaratie(api, 200.0)
+    add_bank_transaction(db, "b1", 200.0)
+    api.post("/api/bank-reconciliation/match", params={"bank_transaction_id": "b1", "cashflow_transaction_id": transaction_id})
+    anyio.run(db.correcties.insert_one, {"id": "c1", "amount": 50.0, "matched": False})
+    
+    api.post("/api/correcties/c1/match", params={"original_transaction_id": transaction_id})
+    
+    transaction = stored(db, transaction_id)
+    assert transaction['amount'] == 150.0
+    assert transaction['open_amount'] == 0.0
+    response = api.get("/api/verwachte-betalingen")
+    assert response.status_code == 200
+    assert all(payment.get('transaction_id') != transaction_id for payment in response.json())
+
+
+def test_backfill_runs_even_when_index_setup_fails(monkeypatch):
+    import mongomock_motor
+    
+    fresh = mongomock_motor.AsyncMongoMockClient()['cashflow_backfill']
+    monkeypatch.setattr(server, "db", fresh)
+    anyio.run(fresh.transactions.insert_many, [
+        {"id": "missing", "amount": 120.0, "reconciled": False},
+        {"id": "null", "amount": 80.0, "reconciled": False, "open_amount": None},
+        {"id": "closed", "amount": 50.0, "reconciled": True}
+    ])
+    
+    async def failing_step(*args, **kwargs):
+        raise RuntimeError("index build failed")
+    monkeypatch.setattr(server, "normalize_reference_names", failing_step)
+    for hook in server.app.router.on_startup:
+        anyio.run(hook)
+    
+    open_amounts = {doc['id']: doc['open_amount'] for doc in anyio.run(lambda: fresh.transactions.find().to_list(None))}
+    assert open_amounts == {"missing": 120.0, "null": 80.0, "closed": 0.0}
+
+
+def test_batch_match_books_instalments_like_single_match(api, db):
+    partial_id = create_declaratie(api, 300.0)
+    full_id = create_declaratie(api, 100.0)
+    add_bank_transaction(db, "b1", 120.0)
+    add_bank_transaction(db, "b2", 100.0)
+    
+    response = api.post("/api/bank-reconciliation/match/batch", json={"matches": [
+        {"bank_transaction_id": "b1", "cashflow_transaction_id": partial_id},
+        {"bank_transaction_id": "b2", "cashflow_transaction_id": full_id}
+    ]})
+    
+    assert response.status_code == 200
+    assert (response.json()['matched_count'], response.json()['partial_count']) == (2, 1)
+    partial = stored(db, partial_id)
+    assert (partial['reconciled'], partial['open_amount']) == (False, 180.0)
+    assert 'reconciliation_claim' not in partial
+    full = stored(db, full_id)
+    assert (full['reconciled'], full['open_amount']) == (True, 0.0)
+    statuses = {record['bank_transaction_id']: record['reconciliation_status']
+                for record in anyio.run(lambda: db.reconciliations.find().to_list(None))}
+    assert statuses == {"b1": "partial_payment", "b2": "matched"}
@@ -0,0 +1,51 @@
+import server
+
+
+def monthly(key, amounts, day=1, months=range(1, 13)):
+    return [
+        {"counterparty_key": key, "counterparty": key.title(), "amount": -amount, "date": f"2024-{month:02d}-{day:02d}"}
+        for month, amount in zip(months, amounts)
+    ]
+
+
+def test_stable_monthly_payments_are_detected():
+    rows = monthly("vastgoed", [1200.0] * 12) + monthly("energie", [150.0, 152.5, 149.0] * 4, day=15)
+    
+    detected = {payment['counterparty_key']: payment for payment in server.detect_recurring_payments(rows)}
+    
+    assert set(detected) == {"vastgoed", "energie"}
+    assert (detected["vastgoed"]['bedrag'], detected["vastgoed"]['dag'], detected["vastgoed"]['payments']) == (1200.0, 1, 12)
+    assert detected["energie"]['dag'] == 15
+
+
+def test_irregular_stopped_and_incoming_payments_are_ignored():
+    rows = (
+        monthly("supermarkt", [20.0, 180.0, 55.0, 300.0, 12.0, 90.0] * 2)
+        + monthly("oude lease", [50.0] * 3, months=range(1, 4))
+        + [{**row, "amount": -row['amount']} for row in monthly("zorgverzekeraar", [500.0] * 12)]
+        + monthly("vastgoed", [1200.0] * 12)
+    )
+    
+    assert [payment['counterparty_key'] for payment in server.detect_recurring_payments(rows)] == ["vastgoed"]
+
+
+def test_too_few_payments_or_no_history():
+    assert server.detect_recurring_payments([]) == []
+    assert server.detect_recurring_payments(monthly("vastgoed", [1200.0] * 2, months=range(11, 13))) == []
+
+
+def test_apply_brings_back_a_deactivated_crediteur_of_the_same_name(api, db):
+    import anyio
+    anyio.run(db.bank_transactions.insert_many, [
+        {**row, "id": f"b{index}", "description": "Huur", "reconciled": True}
+        for index, row in enumerate(monthly("vastgoed", [1200.0] * 12))
+    ])
+    anyio.run(db.crediteuren.insert_one, {
+        "id": "old", "crediteur": "Vastgoed", "name_key": "vastgoed", "bedrag": 900.0, "dag": 5, "actief": False
+    })
+    
+    response = api.post("/api/crediteuren/recurring/apply", json={})
+    
+    assert response.status_code == 200
+    [crediteur] = api.get("/api/crediteuren").json()
+    assert (crediteur['id'], crediteur['bedrag'], crediteur['dag']) == ("old", 1200.0, 1)
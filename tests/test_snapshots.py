@@ -0,0 +1,56 @@
+import gzip
+
+import anyio
+import pytest
+
+import server
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "SNAPSHOT_DIR", tmp_path)
+    return tmp_path
+
+
+def test_failed_export_leaves_no_snapshot_behind(api, db, snapshot_dir, monkeypatch):
+    def failing_columns(documents):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(server, "documents_to_columns", failing_columns)
+    
+    assert api.post("/api/snapshots", params={"name": "broken"}).status_code == 500
+    
+    assert list(snapshot_dir.iterdir()) == []
+    assert api.get("/api/snapshots").json() == []
+
+
+def test_damaged_file_is_rejected_before_anything_is_deleted(api, db, snapshot_dir):
+    anyio.run(db.crediteuren.insert_one, {"id": "c1", "crediteur": "Vastgoed BV", "bedrag": 1200.0, "dag": 1, "actief": True})
+    assert api.post("/api/snapshots", params={"name": "backup"}).status_code == 200
+    anyio.run(db.crediteuren.insert_one, {"id": "c2", "crediteur": "Energie Direct", "bedrag": 150.0, "dag": 15, "actief": True})
+    with gzip.open(snapshot_dir / "backup" / "verzekeraars.json.gz", 'wt') as f:
+        f.write("{not json")
+    
+    response = api.post("/api/snapshots/backup/restore")
+    
+    assert response.status_code == 400
+    assert "verzekeraars" in response.json()['detail']
+    assert anyio.run(db.crediteuren.count_documents, {}) == 2
+
+
+def test_snapshot_round_trip(api, db, snapshot_dir):
+    anyio.run(db.crediteuren.insert_one, {"id": "c1", "crediteur": "Vastgoed BV", "bedrag": 1200.0, "dag": 1, "actief": True})
+    api.post("/api/snapshots", params={"name": "backup"})
+    anyio.run(db.crediteuren.delete_many, {})
+    
+    response = api.post("/api/snapshots/backup/restore")
+    
+    assert response.status_code == 200
+    assert [snapshot['name'] for snapshot in api.get("/api/snapshots").json()] == ["backup"]
+    assert anyio.run(db.crediteuren.count_documents, {"id": "c1"}) == 1
+
+
+def test_name_with_trailing_newline_is_refused(api, snapshot_dir):
+    response = api.post("/api/snapshots", params={"name": "backup\n"})
+    
+    assert response.status_code == 400
+    assert list(snapshot_dir.iterdir()) == []
@@ -0,0 +1,48 @@
+import io
+
+import server
+
+
+SPECIFICATION_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Specificatie>
+  <Header><Betaaldatum>2025-02-01</Betaaldatum></Header>
+  <Regels>
+    <Regel>
+      <Factuurnummer>INV001</Factuurnummer>
+      <Betaald>100,00</Betaald>
+      <Patient><Naam>Jansen</Naam></Patient>
+    </Regel>
+    <Regel>
+      <Factuurnummer>INV002</Factuurnummer>
+      <Betaald>0,00</Betaald>
+      <Reden>Niet verzekerd</Reden>
+      <Toelichting><Regel><Factuurnummer>INV002</Factuurnummer></Regel></Toelichting>
+    </Regel>
+  </Regels>
+</Specificatie>
+"""
+
+
+def test_xml_lines_are_read_from_their_leaf_fields():
+    items = list(server.parse_specification_xml(io.BytesIO(SPECIFICATION_XML)))
+    
+    # The nested <Regel> without a paid amount is a line of its own; its parent keeps its own fields
+    assert [(item.mapped_data['invoice_number'], item.mapped_data['paid_amount'], item.import_status) for item in items] == [
+        ("INV001", 100.0, 'valid'), ("INV002", None, 'error'), ("INV002", 0.0, 'valid')
+    ]
+    assert items[2].mapped_data['reason'] == "Niet verzekerd"
+
+
+def test_xml_elements_are_detached_once_read(monkeypatch):
+    roots = []
+    iterparse = server.ET.iterparse
+    
+    def tracking_iterparse(*args, **kwargs):
+        for event, elem in iterparse(*args, **kwargs):
+            if not roots:
+                roots.append(elem)
+            yield event, elem
+    monkeypatch.setattr(server.ET, "iterparse", tracking_iterparse)
+    
+    assert len(list(server.parse_specification_xml(io.BytesIO(SPECIFICATION_XML)))) == 3
+    assert len(roots[0]) == 0